@@ -0,0 +1,82 @@
+import math
+from datetime import datetime
+
+from sqlalchemy import func
+
+from .database import db
+from .models import Activity, ActivityOption, ActivityTombstone, Tracker
+from .rollups import refreshRollups
+from .validation import numericValue
+
+
+def typedValueColumns(trackerType, value):
+    """num_value / duration_seconds of a log with the given value string."""
+    columns = {"num_value": None, "duration_seconds": None}
+    number = numericValue(trackerType, value)
+    if not math.isnan(number):
+        if trackerType == 3:
+            columns["duration_seconds"] = int(number)
+        else:
+            columns["num_value"] = number
+    return columns
+
+
+def replaceActivityOptions(rows):
+    """Rewrite the activity_option rows of (activity id, value) pairs."""
+    rows = list(rows)
+    if not rows:
+        return
+    db.session.query(ActivityOption).filter(
+        ActivityOption.activity_id.in_([aid for aid, _ in rows])
+    ).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(
+        ActivityOption,
+        [
+            {"activity_id": aid, "option": option}
+            for aid, value in rows
+            for option in set(value.split(","))
+        ],
+    )
+
+
+def touchTracker(tid, timestamps=(), trackerType=None, zone=None):
+    # Recompute the denormalized tracker.last_activity_at (a single seek on
+    # the (tracker_id, timestamp) index), bump data_version so cached charts
+    # for the tracker are no longer used, and stamp the rows this write left
+    # with a NULL revision (new/updated activities, tombstones) with it.
+    # timestamps are the old/new timestamps of the changed logs; the rollup
+    # buckets containing them are recomputed. Multiple choice logs changed by
+    # this write (NULL revision too) get their activity_option rows first.
+    # Callers that already loaded the tracker pass its type, and callers
+    # serving its owner their timezone (the rollups' days), to save a query.
+    if trackerType is None:
+        trackerType = db.session.query(Tracker.type).filter(Tracker.id == tid).scalar()
+    if trackerType == 2:
+        replaceActivityOptions(
+            db.session.query(Activity.id, Activity.value).filter(
+                Activity.tracker_id == tid, Activity.revision.is_(None)
+            )
+        )
+    latest = (
+        db.session.query(func.max(Activity.timestamp))
+        .filter(Activity.tracker_id == tid)
+        .scalar_subquery()
+    )
+    db.session.query(Tracker).filter(Tracker.id == tid).update(
+        {
+            Tracker.last_activity_at: latest,
+            Tracker.data_version: Tracker.data_version + 1,
+            Tracker.data_changed_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    version = (
+        db.session.query(Tracker.data_version)
+        .filter(Tracker.id == tid)
+        .scalar_subquery()
+    )
+    for model in (Activity, ActivityTombstone):
+        db.session.query(model).filter(
+            model.tracker_id == tid, model.revision.is_(None)
+        ).update({model.revision: version}, synchronize_session=False)
+    refreshRollups(tid, timestamps, trackerType, zone)
@@ -0,0 +1,284 @@
+import warnings
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import func
+
+from .database import db
+from .models import TRACKERTYPE, ActivityOptionRollup, ActivityRollup
+from .rollups import bucketStart
+
+# Cross tracker analytics. The day/week rollups of the selected trackers are
+# read as plain column tuples and scattered onto one time grid: a series x
+# bucket matrix with NaN where a series has no logs. Summaries, moving
+# averages and the pairwise correlations are then computed on the whole
+# matrix at once, so the cost depends on its size, not on the number of logs.
+#
+# One series per tracker: the mean value per bucket (minutes for durations,
+# the share of "Yes" for booleans), and one per option of a multiple choice
+# tracker (the share of its logs in the bucket that picked the option).
+
+GRID_STEPS = {"day": 1, "week": 7}
+# Rows of the two rollup queries; NULL sums (multiple choice) become NaN
+ROLLUP_DTYPE = [
+    ("tracker_id", np.int64),
+    ("day", "datetime64[D]"),
+    ("count", np.float64),
+    ("value_count", np.float64),
+    ("sum", np.float64),
+]
+OPTION_DTYPE = [
+    ("tracker_id", np.int64),
+    ("day", "datetime64[D]"),
+    ("option", object),
+    ("count", np.float64),
+]
+PERCENTILES = (10, 25, 50, 75, 90)
+
+Analytics = namedtuple(
+    "Analytics",
+    ["period", "x", "labels", "trackerIds", "values", "movingAverage", "overlap", "r"],
+)
+
+
+def seriesOf(trackers, optionPairs):
+    """Labels and tracker ids of the matrix rows, and the row of every
+    non multiple choice tracker / (tracker id, option) pair."""
+    labels, trackerIds, rowOf = [], [], {}
+    optionsOf = {}
+    for tid, option in optionPairs:
+        optionsOf.setdefault(tid, []).append(option)
+    for t in trackers:
+        if t.type == TRACKERTYPE.Multi.value:
+            # Options in the order of the tracker settings, then any others
+            settings = [s for s in (t.settings or "").split(",") if s]
+            seen = optionsOf.get(t.id, [])
+            for option in settings + sorted(set(seen) - set(settings)):
+                if option in seen:
+                    rowOf[t.id, option] = len(labels)
+                    labels.append("%s: %s" % (t.name, option))
+                    trackerIds.append(t.id)
+        else:
+            rowOf[t.id] = len(labels)
+            labels.append(t.name)
+            trackerIds.append(t.id)
+    return labels, trackerIds, rowOf
+
+
+def lookup(keys, mapping, default=-1, dtype=np.intp):
+    """mapping[key] for every key of the array; the dict is only consulted
+    once per distinct key."""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    found = [mapping.get(k, default) for k in unique.tolist()]
+    return np.array(found, dtype=dtype)[inverse]
+
+
+def fetchArray(query, dtype):
+    """The rows of a column query as a structured NumPy array. They come
+    straight from the DBAPI cursor and are converted in one call, without a
+    SQLAlchemy Row (or a Python datetime) per rollup bucket."""
+    result = db.session.connection().execute(query.statement)
+    rows = result.cursor.fetchall()
+    result.close()
+    return np.array(rows, dtype=dtype)
+
+
+def gridIndex(days, first, step):
+    """Column of every datetime64[D] day on the grid starting at first."""
+    return ((days - first).astype(np.int64) // step).astype(np.intp)
+
+
+def movingAverage(values, window):
+    """Trailing mean over `window` buckets, skipping the NaNs."""
+    present = ~np.isnan(values)
+    zeros = np.zeros((values.shape[0], 1))
+    sums = np.hstack([zeros, np.cumsum(np.where(present, values, 0.0), axis=1)])
+    counts = np.hstack([zeros, np.cumsum(present, axis=1)])
+    end = np.arange(1, values.shape[1] + 1)
+    start = np.maximum(end - window, 0)
+    total = sums[:, end] - sums[:, start]
+    count = counts[:, end] - counts[:, start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def correlate(values, minOverlap):
+    """Pearson r of every pair of rows over the buckets where both have a
+    value, and the number of those buckets. Pairs with fewer than
+    minOverlap shared buckets (or a constant series) get NaN."""
+    present = (~np.isnan(values)).astype(np.float64)
+    # Centering first keeps the sums of squares from cancelling out
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        centered = values - np.nanmean(values, axis=1, keepdims=True)
+    x = np.where(present > 0, centered, 0.0)
+    n = present @ present.T
+    sx = x @ present.T
+    sxx = (x * x) @ present.T
+    sxy = x @ x.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sx.T / n
+        var = sxx - sx * sx / n
+        r = cov / np.sqrt(var * var.T)
+    r[(n < minOverlap) | ~np.isfinite(r)] = np.nan
+    np.clip(r, -1, 1, out=r)
+    return n.astype(np.int64), r
+
+
+def summarize(values, averages):
+    """Per row statistics over its non empty buckets, and the latest value
+    of its moving average."""
+    present = ~np.isnan(values)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        percentiles = np.nanpercentile(values, PERCENTILES, axis=1)
+        summary = {
+            "buckets": np.count_nonzero(present, axis=1),
+            "mean": np.nanmean(values, axis=1),
+            "std": np.nanstd(values, axis=1),
+            "min": np.nanmin(values, axis=1),
+            "max": np.nanmax(values, axis=1),
+        }
+    for p, row in zip(PERCENTILES, percentiles):
+        summary["p%d" % p] = row
+    summary["median"] = summary["p50"]
+    # Index of the last non empty bucket of every row
+    last = values.shape[1] - 1 - np.argmax(present[:, ::-1], axis=1)
+    latest = averages[np.arange(len(values)), last]
+    latest[~present.any(axis=1)] = np.nan
+    summary["moving_average_last"] = latest
+    return summary
+
+
+def getAnalytics(trackers, period="day", since=None, window=7, minOverlap=5):
+    """Align the rollups of trackers (rows with id, name, type, settings)
+    onto one `period` grid; None when none of them has logs in the range."""
+    step = GRID_STEPS[period]
+    ids = [t.id for t in trackers]
+    multiIds = [t.id for t in trackers if t.type == TRACKERTYPE.Multi.value]
+    since = bucketStart(period, since) if since is not None else None
+
+    # date() turns the bucket starts into "YYYY-MM-DD" strings, which NumPy
+    # parses into datetime64 while building the array
+    query = db.session.query(
+        ActivityRollup.tracker_id,
+        func.date(ActivityRollup.bucket_start),
+        ActivityRollup.count,
+        ActivityRollup.value_count,
+        ActivityRollup.sum,
+    ).filter(ActivityRollup.tracker_id.in_(ids), ActivityRollup.period == period)
+    if since is not None:
+        query = query.filter(ActivityRollup.bucket_start >= since)
+    rollups = fetchArray(query, ROLLUP_DTYPE)
+    if not len(rollups):
+        return None
+    optionRollups = np.array([], dtype=OPTION_DTYPE)
+    if multiIds:
+        query = db.session.query(
+            ActivityOptionRollup.tracker_id,
+            func.date(ActivityOptionRollup.bucket_start),
+            ActivityOptionRollup.option,
+            ActivityOptionRollup.count,
+        ).filter(
+            ActivityOptionRollup.tracker_id.in_(multiIds),
+            ActivityOptionRollup.period == period,
+        )
+        if since is not None:
+            query = query.filter(ActivityOptionRollup.bucket_start >= since)
+        optionRollups = fetchArray(query, OPTION_DTYPE)
+
+    tids, counts, sums = rollups["tracker_id"], rollups["count"], rollups["sum"]
+    first = np.datetime64(since, "D") if since is not None else rollups["day"].min()
+    grid = gridIndex(rollups["day"], first, step)
+    x = first + np.arange(grid.max() + 1) * step
+
+    optionPairs = []
+    if len(optionRollups):
+        # (tracker, option) pairs are coded as tracker id * options + option
+        oTids = optionRollups["tracker_id"]
+        # As a fixed width str array the options sort in C, not as objects
+        optionNames, optionCodes = np.unique(
+            optionRollups["option"].astype(str), return_inverse=True
+        )
+        optionNames = optionNames.tolist()
+        pairKeys = oTids * len(optionNames) + optionCodes
+        for key in np.unique(pairKeys).tolist():
+            optionPairs.append(
+                (key // len(optionNames), optionNames[key % len(optionNames)])
+            )
+    labels, trackerIds, rowOf = seriesOf(trackers, optionPairs)
+    values = np.full((len(labels), len(x)), np.nan)
+
+    # Numeric, duration and boolean trackers: sum / values in the bucket
+    scale = {
+        t.id: 60.0 if t.type == TRACKERTYPE.Time_Duration.value else 1.0
+        for t in trackers
+    }
+    rows = lookup(tids, rowOf)
+    keep = (rows >= 0) & ~np.isnan(sums)
+    scales = lookup(tids[keep], scale, 1.0, np.float64)
+    valueCounts = rollups["value_count"][keep]
+    values[rows[keep], grid[keep]] = sums[keep] / valueCounts / scales
+
+    if len(optionRollups):
+        # Multiple choice: option count / logs of the tracker in the bucket
+        indexOf = {tid: i for i, tid in enumerate(ids)}
+        logCounts = np.zeros((len(ids), len(x)))
+        logCounts[lookup(tids, indexOf), grid] = counts
+        oGrid = gridIndex(optionRollups["day"], first, step)
+        pairRows = {
+            tid * len(optionNames) + optionNames.index(option): rowOf[tid, option]
+            for tid, option in optionPairs
+        }
+        oRows = lookup(pairKeys, pairRows)
+        denominators = logCounts[lookup(oTids, indexOf), oGrid]
+        values[oRows, oGrid] = optionRollups["count"] / denominators
+
+    overlap, r = correlate(values, minOverlap)
+    return Analytics(
+        period,
+        x,
+        labels,
+        trackerIds,
+        values,
+        movingAverage(values, window),
+        overlap,
+        r,
+    )
+
+
+def jsonList(array, decimals):
+    """NaN -> None, so the result is valid JSON."""
+    rounded = np.round(array, decimals).astype(object)
+    rounded[np.isnan(array)] = None
+    return rounded.tolist()
+
+
+def analyticsPayload(analytics, withSeries=False):
+    """JSON-ready summaries and correlations; x is in epoch seconds."""
+    summary = {
+        name: column.tolist() if name == "buckets" else jsonList(column, 4)
+        for name, column in summarize(analytics.values, analytics.movingAverage).items()
+    }
+    series = []
+    for i, label in enumerate(analytics.labels):
+        entry = {"label": label, "tracker_id": analytics.trackerIds[i]}
+        entry.update((name, column[i]) for name, column in summary.items())
+        if withSeries:
+            entry["values"] = jsonList(analytics.values[i], 4)
+            entry["moving_average"] = jsonList(analytics.movingAverage[i], 4)
+        series.append(entry)
+    payload = {
+        "period": analytics.period,
+        "start": str(analytics.x[0]),
+        "end": str(analytics.x[-1]),
+        "buckets": len(analytics.x),
+        "series": series,
+        "correlation": {
+            "r": jsonList(analytics.r, 3),
+            "overlap": analytics.overlap.tolist(),
+        },
+    }
+    if withSeries:
+        payload["x"] = analytics.x.astype("datetime64[s]").astype(np.int64).tolist()
+    return payload
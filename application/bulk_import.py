@@ -0,0 +1,220 @@
+import csv
+import io
+import json
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .activity_service import touchTracker, typedValueColumns
+from .database import db
+from .models import Activity, Tracker
+from .validation import getLogValueError
+
+# Bulk activity import. Rows are dicts with "timestamp" (ISO-8601, UTC),
+# "value" (as stored in activity.value: "h,m,s" for durations and
+# comma separated options for multiple choice), optional "note" and
+# optional "tracker_id". They are validated and inserted one batch at a
+# time; invalid rows are reported and skipped without failing the file.
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+DURATION_RE = re.compile(r"\d+,\d+,\d+")
+UTC_OFFSET_RE = re.compile(r"T.*[+-]\d\d:?\d\d$")
+# A full date and time, as the log form requires: NumPy alone would also
+# take "now", "today", "2024" or "2024-01"
+FULL_TIMESTAMP_RE = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}")
+
+
+def guessImportFormat(filename):
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    return "csv"
+
+
+def readImportRows(stream, fmt):
+    """Yield row dicts from a binary CSV (with a header line) or NDJSON stream."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        yield from csv.DictReader(text)
+    elif fmt == "ndjson":
+        for line in text:
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield {"_error": "Malformed JSON line"}
+                    continue
+                if not isinstance(row, dict):
+                    row = {"_error": "Expected a JSON object"}
+                yield row
+    else:
+        raise ValueError("Unsupported import format " + fmt)
+
+
+def normalizeValue(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (list, tuple)):
+        return ",".join(str(v) for v in value)
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def parseTimestamp(value):
+    if not FULL_TIMESTAMP_RE.match(str(value).strip()):
+        return np.datetime64("NaT")
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return np.datetime64("NaT")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(parsed, "us")
+
+
+def parseTimestamps(values):
+    # Whole-column parse through NumPy; only a column containing something
+    # NumPy rejects (offsets, garbage) falls back to parsing row by row.
+    # Values that are not a full date and time are NaT (invalid) either way.
+    cleaned = [
+        str(v).strip().rstrip("Z") if v not in (None, "") else "NaT" for v in values
+    ]
+    cleaned = [v if FULL_TIMESTAMP_RE.match(v) else "NaT" for v in cleaned]
+    if not any(UTC_OFFSET_RE.search(v) for v in cleaned):
+        try:
+            return np.array(cleaned, dtype="datetime64[us]")
+        except ValueError:
+            pass
+    return np.array([parseTimestamp(v) for v in cleaned], dtype="datetime64[us]")
+
+
+def validValueMask(tracker, values):
+    """Boolean array marking the values that pass getLogValueError."""
+    if tracker.type == 1:
+        try:
+            numbers = np.array(values, dtype=np.float64)
+        except ValueError:
+            numbers = np.array([toFloat(v) for v in values], dtype=np.float64)
+        return numbers >= 0
+    if tracker.type == 2:
+        options = set((tracker.settings or "").split(","))
+        return np.array(
+            [v != "" and set(v.split(",")) <= options for v in values], dtype=bool
+        )
+    if tracker.type == 3:
+        return np.array(
+            [DURATION_RE.fullmatch(v) is not None for v in values], dtype=bool
+        )
+    if tracker.type == 4:
+        return np.isin(np.array(values, dtype=object), ["0", "1"])
+    return np.zeros(len(values), dtype=bool)
+
+
+def toFloat(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def validateBatch(tracker, rows):
+    """Split (rowNumber, row) pairs of one tracker into insert mappings and
+    (rowNumber, message) errors."""
+    values = [normalizeValue(row.get("value")) for _, row in rows]
+    timestamps = parseTimestamps([row.get("timestamp") for _, row in rows])
+    badTimestamps = np.isnat(timestamps)
+    validValues = validValueMask(tracker, values)
+
+    mappings = []
+    errors = []
+    for i, (rowNumber, row) in enumerate(rows):
+        if badTimestamps[i]:
+            errors.append((rowNumber, "Tracker log timestamp is invalid/malformed."))
+        elif not validValues[i]:
+            message = getLogValueError(
+                tracker.type, tracker.settings, values[i].split(",")
+            )
+            errors.append((rowNumber, message or "Invalid log value"))
+        else:
+            mappings.append(
+                {
+                    "timestamp": timestamps[i].item(),
+                    "value": values[i],
+                    "note": normalizeValue(row.get("note")),
+                    "tracker_id": tracker.id,
+                    **typedValueColumns(tracker.type, values[i]),
+                }
+            )
+    return mappings, errors
+
+
+def importActivities(
+    rows, userId, trackerId=None, batchSize=5000, maxErrors=1000, ingest=None
+):
+    """Import row dicts for the trackers of userId.
+
+    Each batch loads its trackers with one query (restricted to the user's
+    trackers), validates per tracker, inserts with bulk_insert_mappings and
+    commits, so a bad row never aborts the rest of the file. With
+    ingest(trackerId, trackerType, mappings) the valid rows go there instead
+    of being inserted here (see ingest_queue.py).
+    """
+    result = {"imported": 0, "failed": 0, "errors": []}
+
+    def fail(rowNumber, message):
+        result["failed"] += 1
+        if len(result["errors"]) < maxErrors:
+            result["errors"].append({"row": rowNumber, "error": message})
+
+    def flush(batch):
+        trackerIds = {row["_tracker_id"] for _, row in batch}
+        trackers = {
+            t.id: t
+            for t in db.session.query(Tracker).filter(
+                Tracker.id.in_(trackerIds),
+                Tracker.user_id == userId,
+                Tracker.deleted_at.is_(None),
+            )
+        }
+        groups = {}
+        for rowNumber, row in batch:
+            tracker = trackers.get(row["_tracker_id"])
+            if tracker is None:
+                fail(rowNumber, "Tracker id is not valid.")
+            else:
+                groups.setdefault(tracker.id, []).append((rowNumber, row))
+
+        for tid, group in groups.items():
+            mappings, errors = validateBatch(trackers[tid], group)
+            for rowNumber, message in errors:
+                fail(rowNumber, message)
+            if mappings and ingest is not None:
+                ingest(tid, trackers[tid].type, mappings)
+                result["imported"] += len(mappings)
+            elif mappings:
+                db.session.bulk_insert_mappings(Activity, mappings)
+                touchTracker(tid, [m["timestamp"] for m in mappings])
+                result["imported"] += len(mappings)
+        db.session.commit()
+
+    batch = []
+    for rowNumber, row in enumerate(rows, start=1):
+        if "_error" in row:
+            fail(rowNumber, row["_error"])
+            continue
+        try:
+            row["_tracker_id"] = int(row.get("tracker_id") or trackerId)
+        except (TypeError, ValueError):
+            fail(rowNumber, "Tracker id is not valid.")
+            continue
+        batch.append((rowNumber, row))
+        if len(batch) >= batchSize:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    result["errors"].sort(key=lambda e: e["row"])
+    return result
@@ -0,0 +1,209 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ChartCache:
+    """LRU cache of rendered charts with a byte budget and an optional disk tier.
+
+    Keys are tuples starting with the tracker id; they also carry the
+    tracker's data_version, so a write to the tracker makes old entries
+    unreachable and they age out of the LRU, and the user's timezone, whose
+    days the chart's buckets are. Values are bytes.
+
+    The disk tier holds at most diskMaxBytes: writing a chart removes the
+    tracker's files of older data_versions (key[VERSION_FIELD]), and past
+    the cap the least recently used files (oldest mtime; reads touch it)
+    are removed until the tier is back under DISK_LOW_WATER of the cap.
+    """
+
+    # Chart keys are (tracker id, type, range, data_version, format, timezone)
+    VERSION_FIELD = 3
+    DISK_LOW_WATER = 0.9
+
+    def __init__(
+        self, maxBytes=32 * 1024 * 1024, directory=None, diskMaxBytes=256 * 1024 * 1024
+    ):
+        self.maxBytes = maxBytes
+        self.directory = directory
+        self.diskMaxBytes = diskMaxBytes
+        self._diskBytes = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        self.maxBytes = app.config.get("CHART_CACHE_MAX_BYTES", self.maxBytes)
+        self.directory = app.config.get("CHART_CACHE_DIR")
+        self.diskMaxBytes = app.config.get(
+            "CHART_CACHE_DISK_MAX_BYTES", self.diskMaxBytes
+        )
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._pruneDisk()
+        self.clear()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        value = self._readDisk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.diskHits += 1
+        self._store(key, value)
+        return value
+
+    def put(self, key, value):
+        self._store(key, value)
+        if self.directory:
+            self._removeOlderVersions(key)
+            self._writeDisk(key, value)
+
+    def invalidateTracker(self, tid):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == tid]:
+                self._bytes -= len(self._entries.pop(key))
+        if self.directory:
+            prefix = "%s-" % tid
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix):
+                    self._removeFile(os.path.join(self.directory, name))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.diskHits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.maxBytes,
+                "disk_bytes": self._diskBytes,
+                "disk_max_bytes": self.diskMaxBytes,
+            }
+
+    def _store(self, key, value):
+        if len(value) > self.maxBytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.maxBytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def _path(self, key):
+        # Timezone names have slashes ("Europe/Paris")
+        name = "-".join(str(k).replace("/", "_") for k in key)
+        return os.path.join(self.directory, name + ".bin")
+
+    def _readDisk(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            # Recently read files are the last to be evicted
+            os.utime(path)
+        except OSError:
+            return None
+        return value
+
+    def _writeDisk(self, key, value):
+        path = self._path(key)
+        tmp = "%s.%s.tmp" % (path, threading.get_ident())
+        try:
+            with open(tmp, "wb") as f:
+                f.write(value)
+            os.replace(tmp, path)
+        except OSError:
+            logger.warning("Could not write chart cache file %s", path, exc_info=True)
+            self._remove(tmp)
+            return
+        with self._lock:
+            self._diskBytes += len(value)
+            full = self._diskBytes > self.diskMaxBytes
+        if full:
+            self._pruneDisk()
+
+    def _removeOlderVersions(self, key):
+        # Files of the tracker's earlier data_versions can never be hit again
+        version = key[self.VERSION_FIELD]
+        prefix = "%s-" % key[0]
+        for name in os.listdir(self.directory):
+            if not name.startswith(prefix) or not name.endswith(".bin"):
+                continue
+            fields = name[: -len(".bin")].split("-")
+            try:
+                stale = int(fields[self.VERSION_FIELD]) < version
+            except (IndexError, ValueError):
+                continue
+            if stale:
+                self._removeFile(os.path.join(self.directory, name))
+
+    def _pruneDisk(self):
+        # Sizes from the directory itself: other processes share it
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".bin"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        if total > self.diskMaxBytes:
+            target = self.diskMaxBytes * self.DISK_LOW_WATER
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                if self._remove(path):
+                    total -= size
+                    evicted += 1
+        with self._lock:
+            self._diskBytes = total
+            self.evictions += evicted
+
+    def _removeFile(self, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if self._remove(path):
+            with self._lock:
+                self._diskBytes = max(0, self._diskBytes - size)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        return True
+
+
+chartCache = ChartCache()
@@ -0,0 +1,105 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .rollups import choosePeriod, getOptionCounts, getRollups
+
+# Data preparation for the overview charts: rollup rows go into NumPy arrays
+# once, and everything the drawing code needs (averages, bands, ticks,
+# shares) is computed on whole arrays. Long series are downsampled to a
+# point budget so plotting time does not grow with the history.
+
+TrendSeries = namedtuple("TrendSeries", ["period", "x", "y", "low", "high", "yticks"])
+ShareSeries = namedtuple("ShareSeries", ["labels", "shares"])
+
+
+def lttbIndices(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets."""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    xs = x.astype(np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    indices = np.empty(threshold, dtype=np.intp)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        nextEnd = edges[i + 2] if i + 2 < len(edges) else n
+        avgX = xs[end:nextEnd].mean()
+        avgY = y[end:nextEnd].mean()
+        area = np.abs(
+            (xs[a] - avgX) * (y[start:end] - y[a])
+            - (xs[a] - xs[start:end]) * (avgY - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def yTicks(low, high, count=10):
+    # NaN-safe: no ticks rather than a ValueError for an empty band
+    lo = float(np.nanmin(low, initial=np.inf))
+    hi = float(np.nanmax(high, initial=-np.inf))
+    if not (np.isfinite(lo) and np.isfinite(hi)):
+        return np.array([])
+    return np.arange(lo, hi + 1, (hi + 1 - lo) / count)
+
+
+def getTrendSeries(tid, since, scale, maxBuckets, maxPoints):
+    """Average per rollup bucket (divided by scale) with its min..max band,
+    or None when the range has no logs with a value."""
+    period = choosePeriod(tid, since, maxBuckets)
+    rows = getRollups(tid, period, since)
+    if not rows:
+        return None
+    # Buckets whose logs all lack a value have no average (nor min/max)
+    rows = [row for row in rows if row[1]]
+    if not rows:
+        return None
+    starts, valueCounts, sums, lows, highs = zip(*rows)
+    x = np.array(starts, dtype="datetime64[s]")
+    valueCounts = np.array(valueCounts, dtype=np.float64)
+    y = np.array(sums, dtype=np.float64) / valueCounts / scale
+    low = np.array(lows, dtype=np.float64) / scale
+    high = np.array(highs, dtype=np.float64) / scale
+
+    keep = lttbIndices(x, y, maxPoints)
+    if len(keep) < len(y):
+        # The band keeps the extremes of everything between two kept points
+        low = np.minimum.reduceat(low, keep)
+        high = np.maximum.reduceat(high, keep)
+        x, y = x[keep], y[keep]
+    return TrendSeries(period, x, y, low, high, yTicks(low, high))
+
+
+def getShareSeries(tid, since, labels=None):
+    """Share of each option in the range; labels maps stored options to
+    display labels (and fixes their order) when given."""
+    counts = dict(getOptionCounts(tid, since))
+    if not counts:
+        return None
+    if labels is None:
+        labels = {option: option for option in counts}
+    values = np.array([counts.get(option, 0) for option in labels], dtype=np.float64)
+    return ShareSeries(list(labels.values()), values / values.sum())
+
+
+def seriesPayload(kind, series, ylabel=None):
+    """JSON-ready chart data for static/js/charts.js; x is in epoch seconds."""
+    if kind == "trend":
+        return {
+            "kind": kind,
+            "period": series.period,
+            "ylabel": ylabel,
+            "x": series.x.astype("datetime64[s]").astype(np.int64).tolist(),
+            "y": np.round(series.y, 3).tolist(),
+            "low": np.round(series.low, 3).tolist(),
+            "high": np.round(series.high, 3).tolist(),
+        }
+    return {
+        "kind": kind,
+        "ylabel": ylabel,
+        "labels": list(series.labels),
+        "shares": np.round(series.shares, 4).tolist(),
+    }
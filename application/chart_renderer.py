@@ -0,0 +1,246 @@
+import io
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from .metrics import Histogram
+
+# Chart rendering on the object oriented matplotlib API: every render gets
+# its own Figure and Agg canvas, so nothing is shared through pyplot's global
+# state and concurrent requests cannot draw on each other's axes. Renders run
+# on a bounded pool of threads or, with the "process" backend, of worker
+# processes that keep slow renders from holding this process's GIL.
+# matplotlib is imported on the first render, so an app that sends chart data
+# to the browser (CHART_MODE = "client") never loads it.
+
+RENDER_BACKENDS = ("thread", "process")
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+class ChartRendererBusy(Exception):
+    """No render slot freed up within the timeout."""
+
+
+class ChartRenderTimeout(Exception):
+    """The render did not finish within the timeout."""
+
+
+PERIOD_TITLES = {"day": "daily", "week": "weekly", "month": "monthly"}
+# Margins (inches) around the trend axes, room for the title, the y tick
+# labels and the 45 degree "yy-mm-dd" x tick labels with the axis labels.
+# Fixed, because tight_layout measures them with an extra draw per render.
+TREND_MARGINS = {"left": 1.0, "right": 0.25, "top": 0.45, "bottom": 0.95}
+
+
+def drawTrend(fig, series, ylabel):
+    # Average per bucket, with the bucket's min..max range shaded
+    from matplotlib.dates import DateFormatter
+
+    ax = fig.add_subplot()
+    ax.set_xlabel("Time")
+    ax.set_ylabel(ylabel)
+    ax.set_title("Trend over time (%s average)" % PERIOD_TITLES[series.period])
+    ax.set_yticks(series.yticks)
+    ax.fill_between(series.x, series.low, series.high, alpha=0.2)
+    ax.plot(series.x, series.y, marker="o" if len(series.x) <= 60 else None)
+    ax.xaxis.set_major_formatter(DateFormatter("%y-%m-%d"))
+    ax.locator_params(axis="y", nbins=10)
+    ax.tick_params(axis="x", labelrotation=45)
+    width, height = fig.get_size_inches()
+    fig.subplots_adjust(
+        left=TREND_MARGINS["left"] / width,
+        right=1 - TREND_MARGINS["right"] / width,
+        top=1 - TREND_MARGINS["top"] / height,
+        bottom=TREND_MARGINS["bottom"] / height,
+    )
+
+
+def drawPie(fig, series):
+    ax = fig.add_subplot()
+    ax.pie(series.shares, labels=series.labels)
+
+
+def drawShareBars(fig, series):
+    ax = fig.add_subplot()
+    ax.set_ylabel("Percentage")
+    ax.bar(series.labels, series.shares * 100)
+    ax.set_ylim(0, 100)
+    ax.set_yticks(range(0, 110, 10))
+
+
+def drawPlaceholder(fig, message):
+    fig.text(0.5, 0.5, message, ha="center", va="center", color="grey")
+
+
+def renderFigure(draw, args, fmt, dpi, figsize):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    try:
+        draw(fig, *args)
+        output = io.BytesIO()
+        fig.savefig(output, format=fmt)
+        return output.getvalue()
+    finally:
+        # Break the figure/canvas/artist cycles now instead of waiting for gc
+        fig.clear()
+
+
+def warmWorker():
+    # Runs once in every render process so the first real render does not
+    # pay for loading the Agg backend and the font cache
+    renderFigure(drawPlaceholder, ("",), "png", 10, (1, 1))
+
+
+class ChartRenderer:
+    """Renders charts on `workers` threads or processes.
+
+    At most workers + maxQueued renders are in flight; render() waits up to
+    `timeout` seconds for a slot (ChartRendererBusy otherwise) and for the
+    result (ChartRenderTimeout otherwise). A render that timed out keeps its
+    slot until it really finishes, so stuck renders cannot pile up.
+    workers=0 renders in the calling thread.
+    """
+
+    def __init__(
+        self,
+        workers=4,
+        maxQueued=16,
+        dpi=100,
+        figsize=(6.4, 4.8),
+        backend="thread",
+        timeout=10,
+    ):
+        self.workers = workers
+        self.maxQueued = maxQueued
+        self.dpi = dpi
+        self.figsize = figsize
+        self.backend = backend
+        self.timeout = timeout
+        self.queueDepth = Histogram(QUEUE_DEPTH_BUCKETS)
+        self.latency = Histogram()
+        self.rejected = 0
+        self.timeouts = 0
+        self._inFlight = 0
+        self._executor = None
+        self._slots = None
+        self._placeholders = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.shutdown()
+        self.workers = app.config.get("CHART_RENDER_WORKERS", self.workers)
+        self.maxQueued = app.config.get("CHART_RENDER_QUEUE", self.maxQueued)
+        self.dpi = app.config.get("CHART_DPI", self.dpi)
+        self.figsize = app.config.get("CHART_FIGSIZE", self.figsize)
+        self.backend = app.config.get("CHART_RENDER_BACKEND", self.backend)
+        self.timeout = app.config.get("CHART_RENDER_TIMEOUT", self.timeout)
+        if self.backend not in RENDER_BACKENDS:
+            raise ValueError("Unknown chart render backend " + self.backend)
+        clientCharts = app.config.get("CHART_MODE") == "client"
+        if self.backend == "process" and self.workers and not clientCharts:
+            # Start the processes now, while this process has no threads or
+            # open connections for them to inherit. In client mode only the
+            # fallback renders here, so the pool starts on demand instead.
+            self._pool()
+
+    def render(self, draw, args, fmt="png"):
+        """Bytes of the chart drawn by draw(fig, *args), in format fmt."""
+        started = time.perf_counter()
+        if not self.workers:
+            img = renderFigure(draw, args, fmt, self.dpi, self.figsize)
+            self.latency.observe((time.perf_counter() - started) * 1000)
+            return img
+
+        executor, slots = self._pool()
+        if not slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ChartRendererBusy()
+        with self._lock:
+            self._inFlight += 1
+            depth = self._inFlight - 1
+        self.queueDepth.observe(depth)
+        try:
+            future = executor.submit(
+                renderFigure, draw, args, fmt, self.dpi, self.figsize
+            )
+        except Exception:
+            self._release(slots)
+            raise
+        future.add_done_callback(lambda f: self._release(slots))
+
+        remaining = self.timeout - (time.perf_counter() - started)
+        try:
+            img = future.result(timeout=max(remaining, 0))
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise ChartRenderTimeout()
+        self.latency.observe((time.perf_counter() - started) * 1000)
+        return img
+
+    def placeholder(self, fmt="png", message="Chart is taking too long, retry"):
+        # Drawn here, not in the pool, so it is available when the pool is not
+        if fmt not in self._placeholders:
+            self._placeholders[fmt] = renderFigure(
+                drawPlaceholder, (message,), fmt, self.dpi, self.figsize
+            )
+        return self._placeholders[fmt]
+
+    def stats(self):
+        with self._lock:
+            inFlight = self._inFlight
+            rejected = self.rejected
+            timeouts = self.timeouts
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "max_queued": self.maxQueued,
+            "in_flight": inFlight,
+            "rejected": rejected,
+            "timeouts": timeouts,
+            "queue_depth": self.queueDepth.snapshot(),
+            "latency_ms": self.latency.snapshot(),
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    def _release(self, slots):
+        with self._lock:
+            self._inFlight -= 1
+        slots.release()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                if self.backend == "process":
+                    methods = multiprocessing.get_all_start_methods()
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(
+                            "fork" if "fork" in methods else "spawn"
+                        ),
+                        initializer=warmWorker,
+                    )
+                    # Fork every worker up front (the first submit starts them)
+                    self._executor.submit(int).result()
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="chart-render"
+                    )
+                self._slots = threading.BoundedSemaphore(self.workers + self.maxQueued)
+            return self._executor, self._slots
+
+
+chartRenderer = ChartRenderer()
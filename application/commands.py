@@ -0,0 +1,88 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .database import db
+from .migrations import upgradeDatabase
+from .models import User
+from .rollups import rebuildRollups
+
+# `flask <command>` maintenance commands, registered on the app by create_app
+
+
+@click.command("upgrade-db")
+@with_appcontext
+def upgrade_db():
+    """Apply pending schema migrations to the configured database."""
+    upgradeDatabase()
+
+
+@click.command("import-activities")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--user", "email", required=True, help="Email of the owning user.")
+@click.option("--tracker", type=int, help="Tracker id for rows without tracker_id.")
+@click.option("--format", "fmt", type=click.Choice(("csv", "ndjson")))
+@click.option("--batch-size", type=int, default=None)
+@with_appcontext
+def import_activities_command(path, email, tracker, fmt, batch_size):
+    """Bulk import activities from a CSV or NDJSON file."""
+    from .bulk_import import guessImportFormat, importActivities, readImportRows
+
+    user = User.query.filter(User.email == email).first()
+    if user is None:
+        raise click.ClickException("No user with email " + email)
+    with open(path, "rb") as f:
+        result = importActivities(
+            readImportRows(f, fmt or guessImportFormat(path)),
+            user.id,
+            tracker,
+            batch_size or current_app.config["IMPORT_BATCH_SIZE"],
+        )
+    click.echo("Imported %(imported)s activities, %(failed)s rows failed" % result)
+    for error in result["errors"]:
+        click.echo("  row %(row)s: %(error)s" % error)
+
+
+@click.command("rebuild-rollups")
+@click.option("--tracker", type=int, help="Only rebuild this tracker.")
+@with_appcontext
+def rebuild_rollups_command(tracker):
+    """Recompute the chart rollups from the activity logs."""
+    count = rebuildRollups(tracker)
+    db.session.commit()
+    click.echo("Rebuilt rollups of %s trackers" % count)
+
+
+@click.command("purge-trackers")
+@with_appcontext
+def purge_trackers_command():
+    """Delete the logs of deleted trackers now, in chunks, and the trackers."""
+    from .models import Tracker
+    from .tracker_purge import purgeTracker
+
+    pending = db.session.query(Tracker.id).filter(Tracker.deleted_at.isnot(None))
+    for (tid,) in pending.all():
+        deleted = purgeTracker(tid, current_app.config["PURGE_CHUNK_ROWS"])
+        click.echo("Purged tracker %s and %s logs" % (tid, deleted))
+
+
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index_command():
+    """Create the note search index if missing and re-index every note."""
+    from .search import createSearchIndex, rebuildSearchIndex
+
+    if not createSearchIndex():
+        raise click.ClickException("This database has no FTS5 support")
+    rebuildSearchIndex()
+    db.session.commit()
+    click.echo("Rebuilt the note search index")
+
+
+COMMANDS = [
+    upgrade_db,
+    import_activities_command,
+    rebuild_rollups_command,
+    purge_trackers_command,
+    rebuild_search_index_command,
+]
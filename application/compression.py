@@ -0,0 +1,86 @@
+import zlib
+from functools import partial
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only without the brotli package
+    brotli = None
+
+# gzip / brotli Content-Encoding of text responses: pages, JSON, CSV and the
+# static CSS/JS. Streamed responses (the exports) are compressed chunk by
+# chunk and flushed after each one, so they keep streaming. Binary formats
+# (PNG charts, the gzipped and columnar exports) are left alone.
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/csv",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+
+def chooseEncoding():
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offered)
+
+
+def gzipChunks(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def brotliChunks(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compressResponse(response):
+    config = current_app.config
+    if (
+        not config["RESPONSE_COMPRESSION"]
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = chooseEncoding()
+    if response.status_code != 200 or encoding is None:
+        return response
+    if encoding == "br":
+        encode = partial(brotliChunks, quality=config["COMPRESSION_BROTLI_QUALITY"])
+    else:
+        encode = partial(gzipChunks, level=config["COMPRESSION_GZIP_LEVEL"])
+
+    if response.direct_passthrough:
+        # send_file (static files): read the file into the body
+        response.direct_passthrough = False
+        response.get_data()
+    if response.is_streamed:
+        # The writer's chunks as they come; no Content-Length up front
+        response.response = encode(response.iter_encoded())
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config["COMPRESSION_MIN_BYTES"]:
+            return response
+        response.set_data(b"".join(encode([data])))
+    response.headers["Content-Encoding"] = encoding
+    # Same resource, different bytes: a strong ETag no longer matches them
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,147 @@
+import hashlib
+
+from flask import Blueprint, current_app, jsonify, make_response
+from flask import request, abort, render_template
+from flask_login import current_user, login_required
+from werkzeug.http import is_resource_modified
+
+from application.database import db
+from application.models import Tracker
+from application.rollups import CHART_RANGES, chartRangeStart
+from application.timezones import getUserTimezone
+
+# Cross tracker summaries and correlations (application/analytics.py). Like
+# the charts, NumPy is only imported by the first analytics request.
+
+analytics = Blueprint("analytics", __name__)
+
+
+@analytics.route("/analytics", methods=["GET"])
+@login_required
+def analytics_overview():
+    if request.method == "GET":
+        from application.analytics import analyticsPayload
+
+        options = getAnalyticsOptions()
+        result = getUserAnalytics(options)
+        return render_template(
+            "analytics.html",
+            trackers=options["trackers"],
+            selected={t.id for t in options["selected"]},
+            options=options,
+            ranges=list(CHART_RANGES),
+            analytics=analyticsPayload(result) if result is not None else None,
+        )
+
+
+@analytics.route("/analytics.json", methods=["GET"])
+@login_required
+def analytics_json():
+    # ?tracker=<id> (repeated; when absent the ANALYTICS_MAX_TRACKERS most
+    # recently logged trackers), ?period=day|week, ?range= as for the
+    # charts, ?window= buckets of the moving average and ?series=1 for the
+    # aligned series themselves
+    if request.method == "GET":
+        from application.analytics import analyticsPayload
+
+        options = getAnalyticsOptions()
+        etag = getAnalyticsEtag(options)
+        lastModified = max(
+            (t.data_changed_at for t in options["selected"]), default=None
+        )
+        if is_resource_modified(request.environ, etag=etag, last_modified=lastModified):
+            result = getUserAnalytics(options)
+            if result is None:
+                abort(404, "There are no logs for these trackers yet")
+            response = jsonify(analyticsPayload(result, options["withSeries"]))
+        else:
+            response = make_response("", 304)
+
+        response.set_etag(etag)
+        response.last_modified = lastModified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+
+def getAnalyticsOptions():
+    period = request.args.get("period", "day")
+    if period not in ("day", "week"):
+        abort(400, "period should be day or week")
+    chartRange = request.args.get("range", "1y")
+    if chartRange not in CHART_RANGES:
+        abort(400, "range should be one of " + ", ".join(CHART_RANGES))
+    window = request.args.get("window", current_app.config["ANALYTICS_WINDOW"], int)
+    if window < 1:
+        abort(400, "window should be a positive number of buckets")
+    zone = getUserTimezone()
+    since = chartRangeStart(chartRange, zone)
+
+    trackers = (
+        db.session.query(
+            Tracker.id,
+            Tracker.name,
+            Tracker.type,
+            Tracker.settings,
+            Tracker.data_version,
+            Tracker.data_changed_at,
+            Tracker.last_activity_at,
+        )
+        .filter(Tracker.user_id == current_user.id, Tracker.deleted_at.is_(None))
+        .order_by(Tracker.id)
+        .all()
+    )
+    maxTrackers = current_app.config["ANALYTICS_MAX_TRACKERS"]
+    requested = set(request.args.getlist("tracker", int))
+    if requested - {t.id for t in trackers}:
+        abort(404, "Tracker not found")
+    if len(requested) > maxTrackers:
+        abort(400, "Select at most %d trackers" % maxTrackers)
+    if not requested:
+        # Nothing picked: the most recently logged trackers, up to the limit
+        recent = sorted(
+            trackers,
+            key=lambda t: (t.last_activity_at is not None, t.last_activity_at, t.id),
+            reverse=True,
+        )
+        requested = {t.id for t in recent[:maxTrackers]}
+    selected = [t for t in trackers if t.id in requested]
+    return {
+        "trackers": trackers,
+        "selected": selected,
+        "period": period,
+        "range": chartRange,
+        "since": since,
+        "sinceKey": since.strftime("%Y%m%d") if since else "all",
+        "zone": str(zone),
+        "window": window,
+        "withSeries": request.args.get("series") == "1",
+    }
+
+
+def getAnalyticsEtag(options):
+    # Changes with any selected tracker's data_version, with the query and
+    # with the user's timezone (the days of the buckets)
+    key = (
+        [(t.id, t.data_version) for t in options["selected"]],
+        options["period"],
+        options["sinceKey"],
+        options["zone"],
+        options["window"],
+        options["withSeries"],
+    )
+    return "analytics-" + hashlib.md5(repr(key).encode()).hexdigest()
+
+
+def getUserAnalytics(options):
+    from application.analytics import getAnalytics
+
+    if not options["selected"]:
+        return None
+    return getAnalytics(
+        options["selected"],
+        options["period"],
+        options["since"],
+        options["window"],
+        current_app.config["ANALYTICS_MIN_OVERLAP"],
+    )
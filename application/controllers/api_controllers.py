@@ -0,0 +1,217 @@
+import hashlib
+
+from flask import Blueprint, current_app, jsonify, make_response, request
+from flask_security import auth_required, current_user
+from sqlalchemy import and_, or_
+from werkzeug.http import is_resource_modified
+
+from application.database import db
+from application.ingest_queue import IngestQueueFull, ingestQueue
+from application.models import Activity, ActivityTombstone, Tracker
+from application.validation import (
+    BusinessValidationError,
+    NotFoundError,
+    SchemaValidationError,
+)
+
+# Versioned JSON API for the mobile client and sync jobs. Responses are built
+# from column tuples, never from ORM objects, and every GET answers
+# If-None-Match so an unchanged tracker costs one primary key lookup.
+
+api = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+TRACKER_FIELDS = ["id", "name", "description", "type", "settings"]
+
+
+def isoUtc(dt):
+    return dt.isoformat() + "Z" if dt is not None else None
+
+
+def trackerToDict(row):
+    data = {f: getattr(row, f) for f in TRACKER_FIELDS}
+    data["last_activity_at"] = isoUtc(row.last_activity_at)
+    data["version"] = row.data_version
+    return data
+
+
+def activityToDict(row):
+    return {
+        "id": row.id,
+        "timestamp": isoUtc(row.timestamp),
+        "value": row.value,
+        "note": row.note,
+        "revision": row.revision,
+    }
+
+
+def trackerColumns():
+    return db.session.query(
+        Tracker.id,
+        Tracker.name,
+        Tracker.description,
+        Tracker.type,
+        Tracker.settings,
+        Tracker.last_activity_at,
+        Tracker.data_version,
+    ).filter(Tracker.user_id == current_user.id, Tracker.deleted_at.is_(None))
+
+
+def getOwnedTracker(tid):
+    tracker = trackerColumns().filter(Tracker.id == tid).first()
+    if tracker is None:
+        raise NotFoundError(404)
+    return tracker
+
+
+def notModified(etag):
+    response = make_response("", 304)
+    response.set_etag(etag)
+    return response
+
+
+def parseSince(since):
+    # "<revision>" resumes after everything up to that revision,
+    # "<revision>,<activity id>" resumes inside a revision (paging).
+    # Without a cursor everything is returned; revisions start at 0.
+    if not since:
+        return -1, None
+    try:
+        parts = [int(p) for p in since.split(",")]
+    except ValueError:
+        parts = []
+    if len(parts) not in (1, 2):
+        raise BusinessValidationError(400, "API002", "Invalid since cursor")
+    return parts[0], parts[1] if len(parts) == 2 else None
+
+
+@api.route("/trackers", methods=["GET"])
+@auth_required("session")
+def list_trackers():
+    rows = trackerColumns().order_by(Tracker.id).all()
+    etag = hashlib.md5(
+        repr([(r.id, r.data_version) for r in rows]).encode()
+    ).hexdigest()
+    if not is_resource_modified(request.environ, etag=etag):
+        return notModified(etag)
+    response = jsonify({"trackers": [trackerToDict(r) for r in rows]})
+    response.set_etag(etag)
+    return response
+
+
+@api.route("/trackers/<int:tid>", methods=["GET"])
+@auth_required("session")
+def get_tracker(tid):
+    tracker = getOwnedTracker(tid)
+    etag = "tracker-%s-%s" % (tid, tracker.data_version)
+    if not is_resource_modified(request.environ, etag=etag):
+        return notModified(etag)
+    response = jsonify(trackerToDict(tracker))
+    response.set_etag(etag)
+    return response
+
+
+@api.route("/trackers/<int:tid>/activities", methods=["GET"])
+@auth_required("session")
+def list_activities(tid):
+    """Activities changed after the `since` cursor, oldest change first.
+
+    Follow `next` while it is set; when it is null, keep `cursor` for the
+    next sync. `deleted` lists the ids removed after the cursor.
+    """
+    tracker = getOwnedTracker(tid)
+    since = request.args.get("since", "")
+    maxLimit = current_app.config["API_MAX_PAGE_SIZE"]
+    limit = min(request.args.get("limit", maxLimit, type=int), maxLimit)
+    if limit < 1:
+        raise BusinessValidationError(400, "API003", "limit should be positive")
+
+    etag = "activities-%s-%s-%s-%s" % (tid, tracker.data_version, since, limit)
+    if not is_resource_modified(request.environ, etag=etag):
+        return notModified(etag)
+
+    sinceRevision, sinceId = parseSince(since)
+    query = db.session.query(
+        Activity.id,
+        Activity.timestamp,
+        Activity.value,
+        Activity.note,
+        Activity.revision,
+    ).filter(Activity.tracker_id == tid)
+    if sinceId is None:
+        query = query.filter(Activity.revision > sinceRevision)
+    else:
+        query = query.filter(
+            or_(
+                Activity.revision > sinceRevision,
+                and_(Activity.revision == sinceRevision, Activity.id > sinceId),
+            )
+        )
+    rows = query.order_by(Activity.revision, Activity.id).limit(limit + 1).all()
+
+    nextCursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        nextCursor = "%s,%s" % (rows[-1].revision, rows[-1].id)
+
+    deleted = [
+        aid
+        for (aid,) in db.session.query(ActivityTombstone.activity_id).filter(
+            ActivityTombstone.tracker_id == tid,
+            ActivityTombstone.revision > sinceRevision,
+        )
+    ]
+
+    response = jsonify(
+        {
+            "tracker_id": tid,
+            "version": tracker.data_version,
+            "activities": [activityToDict(r) for r in rows],
+            "deleted": deleted,
+            "next": nextCursor,
+            "cursor": nextCursor or str(tracker.data_version),
+        }
+    )
+    response.set_etag(etag)
+    return response
+
+
+@api.route("/trackers/<int:tid>/activities", methods=["POST"])
+@auth_required("session")
+def create_activities(tid):
+    """Create one activity (a JSON object) or many (a JSON list, or an object
+    with an "activities" list). Rows that fail validation are reported in
+    `errors` and the others are still created. With INGEST_MODE = "queue"
+    the answer is 202 when the rows are queued but not committed yet."""
+    from application.bulk_import import importActivities
+
+    getOwnedTracker(tid)
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get("activities", [body])
+    if not isinstance(body, list) or not all(isinstance(r, dict) for r in body):
+        raise SchemaValidationError(
+            400, "API001", "Expected an activity object or a list of them"
+        )
+    for row in body:
+        row["tracker_id"] = tid
+
+    committed = []
+    ingest = None
+    if ingestQueue.enabled:
+
+        def ingest(trackerId, trackerType, mappings):
+            committed.append(ingestQueue.ingest(trackerId, trackerType, mappings))
+
+    try:
+        result = importActivities(
+            body,
+            current_user.id,
+            tid,
+            current_app.config["IMPORT_BATCH_SIZE"],
+            ingest=ingest,
+        )
+    except IngestQueueFull:
+        raise BusinessValidationError(503, "API004", "Too many logs queued, retry")
+    if not result["imported"]:
+        return jsonify(result), 400
+    return jsonify(result), 201 if all(committed) else 202
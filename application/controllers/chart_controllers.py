@@ -0,0 +1,188 @@
+from flask import Blueprint, current_app, jsonify, make_response
+from flask import request, abort
+from flask_login import login_required
+from werkzeug.http import is_resource_modified
+
+from application.chart_cache import chartCache
+from application.chart_renderer import (
+    ChartRendererBusy,
+    ChartRenderTimeout,
+    chartRenderer,
+    drawPie,
+    drawShareBars,
+    drawTrend,
+)
+from application.loaders import loadTracker
+from application.models import TRACKERTYPE
+from application.rollups import CHART_RANGES, chartRangeStart
+from application.timezones import getUserTimezone
+
+# Chart images and chart data of the tracker overview. NumPy (chart_data) and
+# matplotlib (chart_renderer) are imported on the first chart request, so
+# the app starts, and serves every other page, without loading either.
+
+charts = Blueprint("chart", __name__)
+
+CHART_MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+@charts.route("/tracker/<int:tid>/chart.<fmt>", methods=["GET"])
+@login_required
+def tracker_chart(tid, fmt):
+    if request.method == "GET":
+        if fmt not in CHART_MIMETYPES:
+            abort(404, "Unsupported chart format")
+        since, sinceKey, zone = getChartRange()
+        tracker = loadTracker(tid)
+
+        etag = "%s-%s-%s-%s" % (tracker.id, tracker.data_version, sinceKey, zone)
+        if is_resource_modified(
+            request.environ, etag=etag, last_modified=tracker.data_changed_at
+        ):
+            try:
+                img = getCachedChartImg(tracker, fmt, since, sinceKey, zone)
+            except ChartRendererBusy:
+                response = make_response("Too many charts rendering, retry", 503)
+                response.headers["Retry-After"] = "1"
+                return response
+            except ChartRenderTimeout:
+                # Never cached or revalidated: the next request renders again
+                response = make_response(chartRenderer.placeholder(fmt))
+                response.headers["Content-Type"] = CHART_MIMETYPES[fmt]
+                response.cache_control.no_store = True
+                return response
+            if img is None:
+                abort(404, "There are no logs for this tracker yet")
+            response = make_response(img)
+        else:
+            response = make_response("", 304)
+
+        response.headers["Content-Type"] = CHART_MIMETYPES[fmt]
+        response.set_etag(etag)
+        response.last_modified = tracker.data_changed_at
+        # Always revalidate; a matching ETag costs no rendering at all
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+
+@charts.route("/tracker/<int:tid>/series.json", methods=["GET"])
+@login_required
+def tracker_series(tid):
+    # Chart data for charts.js (CHART_MODE = "client"), the same series the
+    # server side renderer would plot
+    if request.method == "GET":
+        since, sinceKey, zone = getChartRange()
+        tracker = loadTracker(tid)
+
+        etag = "series-%s-%s-%s-%s" % (
+            tracker.id,
+            tracker.data_version,
+            sinceKey,
+            zone,
+        )
+        if is_resource_modified(
+            request.environ, etag=etag, last_modified=tracker.data_changed_at
+        ):
+            from application.chart_data import seriesPayload
+
+            chart = getChartSeries(tracker, since)
+            if chart is None:
+                abort(404, "There are no logs for this tracker yet")
+            response = jsonify(seriesPayload(*chart))
+        else:
+            response = make_response("", 304)
+
+        response.set_etag(etag)
+        response.last_modified = tracker.data_changed_at
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+
+@charts.route("/chart-cache/stats", methods=["GET"])
+@login_required
+def chart_cache_stats():
+    if request.method == "GET":
+        return jsonify(chartCache.stats())
+
+
+@charts.route("/chart-render/stats", methods=["GET"])
+@login_required
+def chart_render_stats():
+    if request.method == "GET":
+        return jsonify(chartRenderer.stats())
+
+
+def getCachedChartImg(tracker, fmt, since=None, sinceKey="all", zone=None):
+    # The buckets are days in the user's timezone: the zone is part of the key
+    key = (
+        tracker.id,
+        tracker.type,
+        sinceKey,
+        tracker.data_version,
+        fmt,
+        str(zone or getUserTimezone()),
+    )
+    cached = chartCache.get(key)
+    if cached is not None:
+        return cached
+    img = getChartImg(tracker, fmt, since)
+    if img is not None:
+        chartCache.put(key, img)
+    return img
+
+
+def getChartSeries(tracker, since=None):
+    # Charts read the rollup tables, never the activity rows: one row per
+    # day (or week/month for long ranges) for Numeric and Duration, summed
+    # option counts for Multi and Bool. Buckets are days in the user's
+    # timezone.
+    # Returns (kind, series, ylabel), or None when there is nothing to plot.
+    from application.chart_data import getShareSeries, getTrendSeries
+
+    maxBuckets = current_app.config["CHART_MAX_BUCKETS"]
+    maxPoints = current_app.config["CHART_MAX_POINTS"]
+    if tracker.type == TRACKERTYPE.Numeric.value:
+        series = getTrendSeries(tracker.id, since, 1, maxBuckets, maxPoints)
+    elif tracker.type == TRACKERTYPE.Time_Duration.value:
+        # Durations are rolled up in seconds
+        series = getTrendSeries(tracker.id, since, 60, maxBuckets, maxPoints)
+    elif tracker.type == TRACKERTYPE.Bool.value:
+        series = getShareSeries(tracker.id, since, {"1": "Yes", "0": "No"})
+    else:
+        series = getShareSeries(tracker.id, since)
+    if series is None:
+        return None
+    if tracker.type == TRACKERTYPE.Numeric.value:
+        return "trend", series, "Values"
+    elif tracker.type == TRACKERTYPE.Multi.value:
+        return "pie", series, None
+    elif tracker.type == TRACKERTYPE.Time_Duration.value:
+        return "trend", series, "Minutes"
+    elif tracker.type == TRACKERTYPE.Bool.value:
+        return "bar", series, "Percentage"
+
+
+def getChartImg(tracker, fmt="png", since=None):
+    chart = getChartSeries(tracker, since)
+    if chart is None:
+        return None
+    kind, series, ylabel = chart
+    if kind == "trend":
+        return chartRenderer.render(drawTrend, (series, ylabel), fmt)
+    elif kind == "pie":
+        return chartRenderer.render(drawPie, (series,), fmt)
+    return chartRenderer.render(drawShareBars, (series,), fmt)
+
+
+def getChartRange():
+    # ?range= of the chart endpoints. Relative ranges move with the clock, so
+    # the range start (not the range name) goes in ETags and cache keys, as
+    # does the timezone the days (and the buckets) are in.
+    chartRange = request.args.get("range", "all")
+    if chartRange not in CHART_RANGES:
+        abort(400, "range should be one of " + ", ".join(CHART_RANGES))
+    zone = getUserTimezone()
+    since = chartRangeStart(chartRange, zone)
+    return since, since.strftime("%Y%m%d") if since else "all", zone
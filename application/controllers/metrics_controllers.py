@@ -0,0 +1,27 @@
+import hmac
+
+from flask import Blueprint, Response, abort, current_app, request
+
+from application.chart_cache import chartCache
+from application.chart_renderer import chartRenderer
+from application.metrics import prometheusText, requestMetrics
+
+# Prometheus scrape target. It is not behind the login so the scraper needs
+# no session; with METRICS_TOKEN set it wants "Authorization: Bearer <token>"
+# (Prometheus' bearer_token), and production only serves it with a token.
+# REQUEST_METRICS = False removes it.
+
+monitoring = Blueprint("metrics", __name__)
+
+
+@monitoring.route("/metrics", methods=["GET"])
+def metrics():
+    token = current_app.config["METRICS_TOKEN"]
+    if token and not hmac.compare_digest(
+        request.headers.get("Authorization", ""), "Bearer " + token
+    ):
+        abort(401)
+    return Response(
+        prometheusText(requestMetrics, chartRenderer, chartCache.stats()),
+        mimetype="text/plain; version=0.0.4",
+    )
@@ -0,0 +1,124 @@
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, request, url_for
+from flask import abort, render_template
+from flask_login import current_user, login_required
+
+from application.database import db
+from application.models import Tracker
+from application.search import SearchPage, searchActivities
+from application.timezones import dayRange, getUserTimezone, toLocal
+
+# Search over the notes of all the user's logs (application/search.py)
+
+search = Blueprint("search", __name__)
+
+
+@search.route("/search", methods=["GET"])
+@login_required
+def search_notes():
+    if request.method == "GET":
+        options = getSearchOptions()
+        result = getSearchPage(options)
+        zone = getUserTimezone()
+        hits = [h._replace(timestamp=toLocal(h.timestamp, zone)) for h in result.hits]
+        return render_template(
+            "search.html",
+            trackers=options["trackers"],
+            options=options,
+            result=result._replace(hits=hits),
+            prevUrl=options["page"] > 1 and getSearchUrl(options, options["page"] - 1),
+            nextUrl=result.hasNext and getSearchUrl(options, options["page"] + 1),
+        )
+
+
+@search.route("/search.json", methods=["GET"])
+@login_required
+def search_json():
+    # ?q= words that must all appear in the note (word* for a prefix),
+    # ?tracker=<id>, ?start= / ?end= days (YYYY-MM-DD in the user's timezone,
+    # both included) and ?page= from 1; timestamps are returned in UTC
+    if request.method == "GET":
+        options = getSearchOptions()
+        if not options["q"]:
+            abort(400, "Search terms are mandatory")
+        result = getSearchPage(options)
+        return jsonify(
+            {
+                "page": options["page"],
+                "has_next": result.hasNext,
+                "order": result.order,
+                "results": [
+                    {
+                        "id": hit.id,
+                        "tracker_id": hit.tracker_id,
+                        "tracker_name": hit.tracker_name,
+                        "timestamp": hit.timestamp.isoformat() + "Z",
+                        "value": hit.value,
+                        "snippet": str(hit.snippet),
+                    }
+                    for hit in result.hits
+                ],
+            }
+        )
+
+
+def getSearchDay(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        abort(400, name + " should be a date like 2022-01-31")
+
+
+def getSearchOptions():
+    page = request.args.get("page", 1, int)
+    if page < 1:
+        abort(400, "page should be a positive number")
+    start, end = dayRange(getSearchDay("start"), getSearchDay("end"), getUserTimezone())
+
+    trackers = (
+        db.session.query(Tracker.id, Tracker.name)
+        .filter(Tracker.user_id == current_user.id, Tracker.deleted_at.is_(None))
+        .order_by(Tracker.id)
+        .all()
+    )
+    trackerId = request.args.get("tracker", None, int)
+    if trackerId is not None and trackerId not in {t.id for t in trackers}:
+        abort(404, "Tracker not found")
+    return {
+        "q": request.args.get("q", "").strip(),
+        "trackers": trackers,
+        "trackerId": trackerId,
+        "start": start,
+        "end": end,
+        "page": page,
+    }
+
+
+def getSearchUrl(options, page):
+    return url_for(
+        "search.search_notes",
+        q=options["q"],
+        tracker=options["trackerId"],
+        start=request.args.get("start") or None,
+        end=request.args.get("end") or None,
+        page=page,
+    )
+
+
+def getSearchPage(options):
+    if not options["q"]:
+        return SearchPage([], False, None)
+    return searchActivities(
+        current_user.id,
+        options["q"],
+        options["trackerId"],
+        options["start"],
+        options["end"],
+        options["page"],
+        current_app.config["SEARCH_PAGE_SIZE"],
+        current_app.config["SEARCH_RANK_LIMIT"],
+    )
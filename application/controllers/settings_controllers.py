@@ -0,0 +1,44 @@
+from flask import Blueprint, abort, redirect, render_template, request, url_for
+from flask_login import current_user, login_required
+
+from application.database import db
+from application.rollups import rebuildRollups
+from application.timezones import getUserTimezone, isTimezone, timezoneNames
+
+# Per user preferences; for now the timezone the UI shows times in
+
+settings = Blueprint("settings", __name__)
+
+
+@settings.route("/settings", methods=["GET", "POST"])
+@login_required
+def user_settings():
+    if request.method == "GET":
+        return render_template(
+            "settings.html",
+            timezones=timezoneNames(),
+            timezone=current_user.timezone,
+            effective=str(getUserTimezone()),
+        )
+    elif request.method == "POST":
+        name = request.form.get("timezone", "")
+        if request.form.get("detected"):
+            # Sent by the browser (detectTimezone) on any page, and only taken
+            # when the user has not picked a timezone themselves; a zone this
+            # server has no data for is ignored (DEFAULT_TIMEZONE stays)
+            if current_user.timezone is None and isTimezone(name):
+                setTimezone(name)
+            return "", 204
+        if not isTimezone(name):
+            abort(400, "Unknown timezone " + name)
+        setTimezone(name)
+        return redirect(url_for("settings.user_settings"))
+
+
+def setTimezone(name):
+    # Chart buckets are the user's local days: a new zone means new buckets
+    previous = getUserTimezone()
+    current_user.timezone = name
+    if getUserTimezone() != previous:
+        rebuildRollups(userId=current_user.id)
+    db.session.commit()
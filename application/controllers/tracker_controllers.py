@@ -1,58 +1,578 @@
-from flask import current_app as app
+from collections import namedtuple
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, jsonify, make_response
+from flask import stream_with_context
 from flask import request, url_for
 from flask import render_template, redirect, abort
-from application.models import Tracker, Activity
-
-
-# @app.route("/", methods=["GET"])
-# def home():
-#     if request.method == "GET":
-#         return render_template("home.html"),200
-        
-
-# # Tracker endpoints
-# # @app.route("/tracker/<tid>", methods=["GET"])
-# # def trackerInfo(tid):
-# #     tracker = Tracker.query.filter(Tracker.id == tid).first()
-# #     return render_template("tracker_overview.html", tracker = tracker)
-
-# @app.route("/tracker/create", methods=["GET", "POST"])
-# def create_tracker():
-#     if request.method == "GET":
-#         return render_template("create_tracker.html"), 200
-#     elif request.method == "POST":
-#         if createTracker(request.form) == False:
-#             abort(500)
-#         redirect(url_for("home"))
-
-# @app.route("/tracker/<tid>/overview", methods=["GET"])
-# def tracker_overview(tid):
-#     tracker = Tracker.query.filter(Tracker.id == tid).first()
-#     activities = Activity.query.filter(Activity.tracker_id == tid)
-#     return render_template("tracker_overview.html", tracker = tracker, activities = activities)
-
-# @app.route("/tracker/<tid>/update", methods=["GET", "POST"])
-# def update_tracker(tid):
-#     if request.method == "GET":
-#         tracker = Tracker.query.filter(Tracker.id == tid).first()
-#         return render_template("tracker_update.html", tracker = tracker)
-#     elif request.method == "POST":
-#         if updateTracker(request.form) == False:
-#             abort(500)
-#         redirect(url_for("home"))
-
-
-# @app.after_request
-# def after_request(response):
-#     header = response.headers
-#     header["Access-Control-Allow-Origin"] = "*"
-#     return response
-
-# Create Tracker 
-# def createTracker(data):
-  
-#     return False
-
-# def updateTracker(data):
-#     return False
+from flask_login import current_user, login_required
+from sqlalchemy import and_, func, or_
+
+from application.activity_service import touchTracker, typedValueColumns
+from application.chart_cache import chartCache
+from application.database import db
+from application.fragment_cache import fragmentCache
+from application.ingest_queue import IngestQueueFull, ingestQueue
+from application.loaders import loadActivity, loadTracker
+from application.models import Tracker, Activity, ActivityTombstone
+from application.rollups import CHART_RANGES, deleteBuckets
+from application.timezones import (
+    getUserTimezone,
+    localNow,
+    parseLocalTimestamp,
+    toLocal,
+)
+from application.tracker_purge import trackerPurger
+import application.validation as validation
+
+# Pages of the web UI: trackers, their logs and the import/export endpoints.
+# The bulk import and export modules load NumPy, so they are imported by the
+# views that use them rather than with the app.
+
+trackers = Blueprint("tracker", __name__)
+
+
+@trackers.route("/", methods=["GET"])
+@login_required
+def home():
+    if request.method == "GET":
+        trackerList, trackerRows = getTrackers()
+        return (
+            render_template(
+                "home.html",
+                trackers=trackerList,
+                trackerRows=trackerRows,
+            ),
+            200,
+        )
+
+
+@trackers.route("/tracker/create", methods=["GET", "POST"])
+@login_required
+def create_tracker():
+    if request.method == "GET":
+        return render_template("tracker_create.html"), 200
+    elif request.method == "POST":
+        if createTracker(request.form) == False:
+            abort(500)
+        return redirect(url_for("tracker.home"))
+
+
+@trackers.route("/tracker/<int:tid>/update", methods=["GET", "POST"])
+@login_required
+def update_tracker(tid):
+    tracker = loadTracker(tid)
+    if request.method == "GET":
+        return render_template("tracker_update.html", tracker=tracker)
+    elif request.method == "POST":
+        if updateTracker(request.form, tracker) == False:
+            abort(500)
+        return redirect(url_for("tracker.home"))
+
+
+@trackers.route("/tracker/<int:tid>/delete")
+@login_required
+def delete_tracker(tid):
+    if request.method == "GET":
+        if deleteTracker(loadTracker(tid)):
+            return redirect(url_for("tracker.home"))
+
+
+@trackers.route("/tracker/<int:tid>/log", methods=["GET", "POST"])
+@login_required
+def activity_log(tid):
+    tracker = loadTracker(tid)
+    if request.method == "GET":
+        return (
+            render_template(
+                "log_create.html",
+                tracker=tracker,
+                localTimestamp=localNow(getUserTimezone()),
+            ),
+            200,
+        )
+    elif request.method == "POST":
+        try:
+            if create_log(request.form, tracker):
+                return redirect(url_for("tracker.home"))
+        except IngestQueueFull:
+            response = make_response("Too many logs queued, retry", 503)
+            response.headers["Retry-After"] = "1"
+            return response
+        abort(400)
+
+
+@trackers.route("/tracker/<int:tid>/overview", methods=["GET"])
+@login_required
+def tracker_overview(tid):
+    if request.method == "GET":
+        tracker = loadTracker(tid)
+        order = request.args.get("order", "desc")
+        if order not in ("asc", "desc"):
+            abort(400, "order should be asc or desc")
+        chartRange = request.args.get("range", "all")
+        if chartRange not in CHART_RANGES:
+            abort(400, "range should be one of " + ", ".join(CHART_RANGES))
+        cursor = request.args.get("cursor")
+        zone = getUserTimezone()
+        # A page of logs only changes with the tracker's data_version
+        key = (
+            tid,
+            "logs",
+            tracker.data_version,
+            tracker.type,
+            order,
+            cursor,
+            chartRange,
+            str(zone),
+        )
+        logTable = fragmentCache.cached(
+            key, lambda: renderActivityTable(tracker, order, cursor, chartRange)
+        )
+
+        return render_template(
+            "tracker_overview.html",
+            tracker=tracker,
+            logTable=logTable,
+            order=order,
+            chartRange=chartRange,
+            chartRanges=CHART_RANGES,
+        )
+
+
+@trackers.route("/activity/<int:aid>/update", methods=["GET", "POST"])
+@login_required
+def update_activity(aid):
+    activity = loadActivity(aid)
+    if request.method == "GET":
+        return render_template(
+            "log_update.html",
+            activity=activity,
+            localTimestamp=toLocal(activity.timestamp, getUserTimezone()),
+            tracker=activity.activity,
+            backurl=request.referrer,
+        )
+    elif request.method == "POST":
+        if updateActivity(request.form, activity):
+            return redirect(request.form["backurl"])
+
+
+@trackers.route("/activity/<int:aid>/delete")
+@login_required
+def delete_activity(aid):
+    if request.method == "GET":
+        if deleteActivity(loadActivity(aid)):
+            return redirect(request.referrer)
+
+
+@trackers.route("/import", methods=["POST"])
+@login_required
+def import_activities():
+    from application.bulk_import import (
+        IMPORT_FORMATS,
+        guessImportFormat,
+        importActivities,
+        readImportRows,
+    )
+
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if upload is None:
+            abort(400, "Attach the CSV or NDJSON file to import as 'file'")
+        fmt = request.args.get("format") or guessImportFormat(upload.filename)
+        if fmt not in IMPORT_FORMATS:
+            abort(400, "Unsupported import format, use one of csv, ndjson")
+        result = importActivities(
+            readImportRows(upload.stream, fmt),
+            current_user.id,
+            request.args.get("tracker", type=int),
+            current_app.config["IMPORT_BATCH_SIZE"],
+        )
+        return jsonify(result)
+
+
+@trackers.route("/export", methods=["GET"])
+@login_required
+def exportAsCSV():
+    if request.method == "GET":
+        return downloadData(request.args.get("format", "csv"))
+
+
+###################################################################
+# Tracker Controller
+###################################################################
+
+
+def getTrackers():
+    # The row of a tracker is rendered once per data_version (and local day,
+    # for "Last Tracked") and then served from the fragment cache; only the
+    # trackers whose row is not cached have their logs counted, in one
+    # grouped query answered from the (tracker_id, timestamp) index.
+    trackerList = (
+        db.session.query(
+            Tracker.id,
+            Tracker.name,
+            Tracker.type,
+            Tracker.data_version,
+            Tracker.last_activity_at,
+        )
+        .filter(Tracker.user_id == current_user.id, Tracker.deleted_at.is_(None))
+        .order_by(Tracker.id)
+        .all()
+    )
+    zone = getUserTimezone()
+    now = localNow(zone)
+    keys = {
+        t.id: (t.id, "home", t.data_version, t.name, now.date(), str(zone))
+        for t in trackerList
+    }
+    trackerRows = {t.id: fragmentCache.getHtml(keys[t.id]) for t in trackerList}
+
+    missing = [t for t in trackerList if trackerRows[t.id] is None]
+    logCounts = {}
+    if missing:
+        logCounts = dict(
+            db.session.query(Activity.tracker_id, func.count(Activity.id))
+            .filter(Activity.tracker_id.in_([t.id for t in missing]))
+            .group_by(Activity.tracker_id)
+            .all()
+        )
+    for t in missing:
+        if t.last_activity_at is None:
+            lastTimestamp = "No Logs yet"
+        else:
+            lastTimestamp = convertToNaturalday(toLocal(t.last_activity_at, zone), now)
+        trackerRows[t.id] = fragmentCache.putHtml(
+            keys[t.id],
+            render_template(
+                "home_row.html",
+                t=t,
+                lastTimestamp=lastTimestamp,
+                logCount=logCounts.get(t.id, 0),
+            ),
+        )
+    return trackerList, trackerRows
+
+
+def createTracker(data):
+    if validateTrackerData(data):
+        tracker = Tracker(
+            name=data["name"],
+            description=data["desc"],
+            type=data["t_type"],
+            settings=data["settings"],
+            user_id=current_user.id,
+        )
+        db.session.add(tracker)
+        db.session.commit()
+        return True
+    return False
+
+
+def updateTracker(data, tracker):
+    if validateUpdateTrackerData(data):
+        tracker.name = data["name"]
+        tracker.description = data["desc"]
+        db.session.flush()
+        touchTracker(tracker.id, trackerType=tracker.type)
+        db.session.commit()
+        return True
+    return False
+
+
+def deleteTracker(tracker):
+    tid = tracker.id
+    if trackerPurger.enabled:
+        # Hidden from now on; the purge thread deletes the logs in chunks
+        tracker.deleted_at = datetime.utcnow()
+        db.session.commit()
+        trackerPurger.schedule(tid)
+    else:
+        db.session.query(ActivityTombstone).filter(
+            ActivityTombstone.tracker_id == tid
+        ).delete()
+        deleteBuckets(tid)
+        # The logs and their options go with it (ON DELETE CASCADE)
+        db.session.delete(tracker)
+        db.session.commit()
+    chartCache.invalidateTracker(tid)
+    fragmentCache.invalidateTracker(tid)
+    return True
+
+
+ActivityRow = namedtuple(
+    "ActivityRow", ["id", "timestamp", "value", "note", "duration_seconds"]
+)
+
+
+def renderActivityTable(tracker, order, cursor, chartRange):
+    activities, nextCursor = getActivityPage(tracker.id, order, cursor)
+    return render_template(
+        "activity_table.html",
+        tracker=tracker,
+        activities=activities,
+        order=order,
+        chartRange=chartRange,
+        nextUrl=nextCursor
+        and url_for(
+            "tracker.tracker_overview",
+            tid=tracker.id,
+            order=order,
+            range=chartRange,
+            cursor=nextCursor,
+        ),
+    )
+
+
+def getActivityPage(tid, order="desc", cursor=None):
+    # Keyset pagination on (timestamp, id): every page is a range scan on the
+    # (tracker_id, timestamp) index, however deep into the history it is.
+    # Returns the rows in the user's timezone and the cursor of the
+    # next page (None on the last page).
+    pageSize = current_app.config["ACTIVITY_PAGE_SIZE"]
+    query = db.session.query(
+        Activity.id,
+        Activity.timestamp,
+        Activity.value,
+        Activity.note,
+        Activity.duration_seconds,
+    ).filter(Activity.tracker_id == tid)
+
+    if cursor:
+        try:
+            cursorTime, cursorId = cursor.rsplit(",", 1)
+            cursorTime, cursorId = datetime.fromisoformat(cursorTime), int(cursorId)
+        except ValueError:
+            abort(400, "Invalid page cursor")
+        if order == "desc":
+            query = query.filter(
+                or_(
+                    Activity.timestamp < cursorTime,
+                    and_(Activity.timestamp == cursorTime, Activity.id < cursorId),
+                )
+            )
+        else:
+            query = query.filter(
+                or_(
+                    Activity.timestamp > cursorTime,
+                    and_(Activity.timestamp == cursorTime, Activity.id > cursorId),
+                )
+            )
+
+    if order == "desc":
+        query = query.order_by(Activity.timestamp.desc(), Activity.id.desc())
+    else:
+        query = query.order_by(Activity.timestamp, Activity.id)
+
+    rows = query.limit(pageSize + 1).all()
+    nextCursor = None
+    if len(rows) > pageSize:
+        rows = rows[:pageSize]
+        nextCursor = "%s,%s" % (rows[-1].timestamp.isoformat(), rows[-1].id)
+
+    # New rows in the user's timezone; the cursor above stays in UTC
+    zone = getUserTimezone()
+    activities = [
+        ActivityRow(
+            r.id, toLocal(r.timestamp, zone), r.value, r.note, r.duration_seconds
+        )
+        for r in rows
+    ]
+    return activities, nextCursor
+
+
+#####################################################################
+# Activity Controller                                               #
+#####################################################################
+
+
+def create_log(data, tracker):
+    if validateTrackerLogData(data, tracker):
+        value = ",".join(request.form.getlist("tvalue"))  # joining by ','
+        columns = dict(
+            timestamp=parseLocalTimestamp(data["timestamp"], getUserTimezone()),
+            value=value,
+            note=data["note"],
+            tracker_id=tracker.id,
+            **typedValueColumns(tracker.type, value),
+        )
+        if ingestQueue.enabled:
+            # The writer thread inserts and group commits it
+            ingestQueue.ingest(tracker.id, tracker.type, [columns])
+            return True
+        activity = Activity(**columns)
+        db.session.add(activity)
+        db.session.flush()
+        touchTracker(tracker.id, [activity.timestamp], tracker.type, getUserTimezone())
+        db.session.commit()
+        return True
+    return False
+
+
+def updateActivity(data, activity):
+    # Same rules as a new log: a value the typed columns cannot hold is a 400
+    if validateTrackerLogData(data, activity.activity):
+        timestamp = parseLocalTimestamp(data["timestamp"], getUserTimezone())
+        oldTimestamp = activity.timestamp
+        activity.timestamp = timestamp
+        activity.value = ",".join(request.form.getlist("tvalue"))
+        activity.note = data["note"]
+        activity.revision = None
+        typed = typedValueColumns(activity.activity.type, activity.value)
+        activity.num_value = typed["num_value"]
+        activity.duration_seconds = typed["duration_seconds"]
+
+        db.session.flush()
+        touchTracker(
+            activity.tracker_id,
+            [oldTimestamp, activity.timestamp],
+            activity.activity.type,
+            getUserTimezone(),
+        )
+        db.session.commit()
+        return True
+    return False
+
+
+def deleteActivity(activity):
+    # Its activity_option rows go with it (ON DELETE CASCADE)
+    db.session.delete(activity)
+    db.session.merge(
+        ActivityTombstone(activity_id=activity.id, tracker_id=activity.tracker_id)
+    )
+    db.session.flush()
+    touchTracker(
+        activity.tracker_id,
+        [activity.timestamp],
+        activity.activity.type,
+        getUserTimezone(),
+    )
+    db.session.commit()
+    return True
+
+
+##########################################################################
+# UTILS
+##########################################################################
+def downloadData(fmt="csv"):
+    # Stream the export: activities are fetched EXPORT_CHUNK_ROWS at a time
+    # from a single query and each encoded chunk is sent as soon as it is
+    # ready, so memory stays flat and the first byte goes out before the last
+    # row is read.
+    from application.export_formats import EXPORT_FORMATS
+
+    if fmt not in EXPORT_FORMATS:
+        abort(400, "Unsupported export format, use one of " + ", ".join(EXPORT_FORMATS))
+    writer, mimetype, filename = EXPORT_FORMATS[fmt]
+    zone = getUserTimezone()
+    chunkRows = current_app.config["EXPORT_CHUNK_ROWS"]
+
+    trackerRows = (
+        db.session.query(
+            Tracker.id,
+            Tracker.name,
+            Tracker.description,
+            Tracker.type,
+            Tracker.settings,
+        )
+        .filter(Tracker.user_id == current_user.id, Tracker.deleted_at.is_(None))
+        .order_by(Tracker.id)
+    )
+    activities = (
+        db.session.query(
+            Activity.id,
+            Activity.timestamp,
+            Activity.value,
+            Activity.note,
+            Activity.tracker_id,
+            Activity.num_value,
+            Activity.duration_seconds,
+        )
+        .join(Tracker, Tracker.id == Activity.tracker_id)
+        .filter(Tracker.user_id == current_user.id, Tracker.deleted_at.is_(None))
+        .order_by(Activity.tracker_id, Activity.timestamp)
+        .yield_per(chunkRows)
+    )
+
+    output = Response(
+        stream_with_context(writer(trackerRows, activities, chunkRows, zone)),
+        mimetype=mimetype,
+    )
+    output.headers["Content-Disposition"] = "attachment; filename=" + filename
+    return output
+
+
+def validateTrackerData(tdata):
+    # Validate Tracker data
+    if tdata["name"] is None or tdata["name"] == "":
+        abort(400, "Tracker Name is mandatory")
+
+    if not tdata["name"].replace(" ", "").isalpha():
+        abort(400, "Only alphabets are allowed for Tracker Name")
+
+    if tdata["t_type"] is None or tdata["t_type"] == "":
+        abort(400, "Tracker Type is mandatory")
+
+    if tdata["t_type"] not in ["1", "2", "3", "4"]:
+        abort(400, "Invalid tracker type")
+
+    if tdata["t_type"] == "2" and (
+        tdata["settings"] is None or tdata["settings"] == ""
+    ):
+        abort(
+            400,
+            "For multichoice tracker, setting field is mandatory. Choices should be entered as comma separated values.",
+        )
+
+    return True
+
+
+def validateUpdateTrackerData(tdata):
+    # Validate Tracker data
+    if tdata["name"] is None or tdata["name"] == "":
+        abort(400, "Tracker Name is mandatory")
+
+    if not tdata["name"].replace(" ", "").isalpha():
+        abort(400, "Only alphabets are allowed for Tracker Name")
+
+    return True
+
+
+def validateTrackerLogData(tdata, tracker):
+    # Validate Tracker data
+    if tdata["timestamp"] is None or tdata["timestamp"] == "":
+        abort(400, "Tracker log timestamp is mandatory.")
+    try:
+        parseLocalTimestamp(tdata["timestamp"], getUserTimezone())
+    except ValueError:
+        abort(400, "Tracker log timestamp is invalid/malformed.")
+
+    error = validation.getLogValueError(
+        tracker.type, tracker.settings, request.form.getlist("tvalue")
+    )
+    if error is not None:
+        abort(400, error)
+
+    return True
+
+
+def convertToNaturalday(dt, now=None):
+    # Calendar days between dt and now, both in the user's local time
+    now = now or datetime.now()
+    count = (now.date() - dt.date()).days
+    if count == 0 or count == -1:
+        return "Today"
+    elif count == 1:
+        return "Yesterday"
+    elif count > 1 and count < 31:
+        return str(count) + " day(s) ago"
+    elif count > 30 and count < 366:
+        return (
+            "" + str(int(count / 30)) + " Month(s) " + str(count % 30) + " Day(s) ago"
+        )
+    elif count > 365:
+        noOfYears = str(int(count / 365))
+        remaining = str(count % 365)
+        return "" + noOfYears + " Year(s) " + remaining + " Day(s) ago"
 
+    return count
@@ -1,6 +1,39 @@
+from sqlalchemy import event
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 
 engine = None
 Base = declarative_base()
 db = SQLAlchemy()
+
+
+def isSqlite(app):
+    return app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite")
+
+
+def applySqliteEngineOptions(app):
+    # SQLAlchemy gives file based SQLite a NullPool, which rejects pool_size;
+    # when the config asks for a pool, use a QueuePool shared across threads.
+    if not isSqlite(app):
+        return
+    options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    if options.get("pool_size"):
+        options.setdefault("poolclass", QueuePool)
+        connectArgs = dict(options.get("connect_args") or {})
+        connectArgs.setdefault("check_same_thread", False)
+        options["connect_args"] = connectArgs
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+
+def registerSqlitePragmas(app):
+    pragmas = app.config.get("SQLITE_PRAGMAS")
+    if not pragmas or not isSqlite(app):
+        return
+
+    @event.listens_for(db.get_engine(app), "connect")
+    def setPragmas(dbapiConnection, connectionRecord):
+        cursor = dbapiConnection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA %s = %s" % (name, value))
+        cursor.close()
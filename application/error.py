@@ -1,11 +1,21 @@
-from flask import current_app as app
+from flask import Blueprint, render_template
 
-@app.errorhandler(400)
-def student_exist(e):
-  return 400
-    # return render_template('student_exist.html'), 400
+# Error pages of the web UI, for every blueprint. The JSON API raises its own
+# HTTPException subclasses (see validation.py), which carry their response.
 
-@app.errorhandler(500)
-def something_wrong(e):
-  return 500
-    # return render_template('something_wrong.html'), 500
+errors = Blueprint("errors", __name__)
+
+
+@errors.app_errorhandler(400)
+def bad_request(e):
+    return render_template("400.html", msg=e.description), 400
+
+
+@errors.app_errorhandler(404)
+def not_found(e):
+    return render_template("404.html", msg=e.description), 404
+
+
+@errors.app_errorhandler(500)
+def internal_error(e):
+    return render_template("500.html"), 500
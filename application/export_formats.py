@@ -0,0 +1,242 @@
+import csv
+import gzip
+import json
+import struct
+import zlib
+from io import StringIO
+
+import numpy as np
+
+from .timezones import UTC, localIsoStrings
+
+# Writers for /export. Each takes the tracker rows, the activity rows (both
+# iterables of tuples, see TRACKER_COLUMNS / ACTIVITY_COLUMNS; activity rows
+# end with the TYPED_COLUMNS too), a chunk size and the user's timezone, and
+# yields the encoded output one chunk at a time.
+# The text formats write local times with their UTC offset, converted a
+# chunk at a time; the columnar one keeps UTC epoch seconds.
+
+TRACKER_COLUMNS = ["id", "name", "description", "type", "settings"]
+ACTIVITY_COLUMNS = ["id", "timestamp", "value", "note", "tracker_id"]
+# Activity.num_value / duration_seconds, for the columnar num_value
+TYPED_COLUMNS = ["num_value", "duration_seconds"]
+
+EPOCH = np.datetime64("1970-01-01T00:00:00", "s")
+
+
+def localChunk(chunk, zone):
+    """The activity rows of chunk with their timestamps as local ISO 8601
+    strings."""
+    ids, timestamps, values, notes, trackerIds = list(zip(*chunk))[:5]
+    local = localIsoStrings(np.array(timestamps, dtype="datetime64[s]"), zone)
+    return zip(ids, local.tolist(), values, notes, trackerIds)
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+#####################################################################
+# CSV
+#####################################################################
+
+
+def csvChunks(trackers, activities, chunkRows, zone=UTC):
+    buffer = StringIO()
+    cw = csv.writer(buffer, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL)
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    cw.writerow(["Tracker"])
+    cw.writerow(["Id", "Name", "Description", "Type", "Settings"])
+    cw.writerows(trackers)
+    cw.writerow([])
+
+    cw.writerow(["Activity"])
+    cw.writerow(["Id", "Timestamp", "Value", "Note", "Tracker Id"])
+    yield flush()
+
+    for chunk in chunked(activities, chunkRows):
+        cw.writerows(localChunk(chunk, zone))
+        yield flush()
+
+
+#####################################################################
+# NDJSON, gzip compressed
+#####################################################################
+
+
+def ndjsonGzChunks(trackers, activities, chunkRows, zone=UTC):
+    # One gzip stream, sync-flushed after every chunk so the client can
+    # decompress what it has received so far.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def encode(kind, columns, rows):
+        lines = []
+        for row in rows:
+            record = dict(zip(columns, row))
+            record["record"] = kind
+            lines.append(json.dumps(record))
+        data = ("\n".join(lines) + "\n").encode() if lines else b""
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    yield encode("tracker", TRACKER_COLUMNS, trackers)
+    for chunk in chunked(activities, chunkRows):
+        yield encode("activity", ACTIVITY_COLUMNS, localChunk(chunk, zone))
+    yield compressor.flush()
+
+
+def readNdjsonGz(fileobj):
+    with gzip.open(fileobj, "rt") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+#####################################################################
+# Columnar binary
+#
+# MAGIC, then blocks of  <4s kind><uint32 rows><uint32 length><zlib payload>
+# ending with an END block. A payload is the block's columns back to back:
+# fixed width columns as little endian arrays, string columns as uint32
+# end offsets followed by the UTF-8 bytes.
+#####################################################################
+
+COLUMNAR_MAGIC = b"TRKCOL1\n"
+BLOCK_HEADER = struct.Struct("<4sII")
+
+# kind -> [(column, dtype or "str")]
+COLUMNAR_LAYOUT = {
+    b"TRKR": [
+        ("id", "<i4"),
+        ("type", "<i1"),
+        ("name", "str"),
+        ("description", "str"),
+        ("settings", "str"),
+    ],
+    b"ACTV": [
+        ("id", "<i8"),
+        ("timestamp", "<i8"),
+        ("tracker_id", "<i4"),
+        ("num_value", "<f8"),
+        ("value", "str"),
+        ("note", "str"),
+    ],
+}
+
+
+def encodeStrings(values):
+    blobs = [("" if v is None else str(v)).encode() for v in values]
+    ends = np.cumsum([len(b) for b in blobs], dtype="<u4")
+    return ends.tobytes() + b"".join(blobs)
+
+
+def decodeStrings(payload, pos, rows):
+    ends = np.frombuffer(payload, dtype="<u4", count=rows, offset=pos)
+    pos += ends.nbytes
+    blob = payload[pos : pos + (int(ends[-1]) if rows else 0)]
+    starts = np.concatenate(([0], ends[:-1])) if rows else ends
+    values = np.array(
+        [blob[s:e].decode() for s, e in zip(starts.tolist(), ends.tolist())],
+        dtype=object,
+    )
+    return values, pos + len(blob)
+
+
+def encodeBlock(kind, columns):
+    parts = []
+    rows = 0
+    for name, dtype in COLUMNAR_LAYOUT[kind]:
+        values = columns[name]
+        rows = len(values)
+        if dtype == "str":
+            parts.append(encodeStrings(values))
+        else:
+            parts.append(np.asarray(values, dtype=dtype).tobytes())
+    payload = zlib.compress(b"".join(parts), 6)
+    return BLOCK_HEADER.pack(kind, rows, len(payload)) + payload
+
+
+def columnarChunks(trackers, activities, chunkRows, zone=UTC):
+    trackers = list(trackers)
+    yield COLUMNAR_MAGIC + encodeBlock(
+        b"TRKR",
+        {
+            "id": [t[0] for t in trackers],
+            "type": [t[3] for t in trackers],
+            "name": [t[1] for t in trackers],
+            "description": [t[2] for t in trackers],
+            "settings": [t[4] for t in trackers],
+        },
+    )
+    for chunk in chunked(activities, chunkRows):
+        ids, timestamps, values, notes, trackerIds, numbers, durations = zip(*chunk)
+        # The typed columns as stored; NULL (multiple choice, unparsed) is NaN
+        numbers = np.array(numbers, dtype=np.float64)
+        durations = np.array(durations, dtype=np.float64)
+        yield encodeBlock(
+            b"ACTV",
+            {
+                "id": ids,
+                "timestamp": (
+                    np.array(timestamps, dtype="datetime64[s]") - EPOCH
+                ).astype("<i8"),
+                "tracker_id": trackerIds,
+                "num_value": np.where(np.isnan(numbers), durations, numbers),
+                "value": values,
+                "note": notes,
+            },
+        )
+    yield BLOCK_HEADER.pack(b"END\0", 0, 0)
+
+
+def readColumnar(fileobj):
+    """Read a columnar export back into {"trackers": {...}, "activities": {...}}
+    with one NumPy array per column."""
+    if fileobj.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a tracker columnar export")
+    blocks = {b"TRKR": [], b"ACTV": []}
+    while True:
+        kind, rows, length = BLOCK_HEADER.unpack(fileobj.read(BLOCK_HEADER.size))
+        if kind == b"END\0":
+            break
+        payload = zlib.decompress(fileobj.read(length))
+        pos = 0
+        columns = {}
+        for name, dtype in COLUMNAR_LAYOUT[kind]:
+            if dtype == "str":
+                columns[name], pos = decodeStrings(payload, pos, rows)
+            else:
+                columns[name] = np.frombuffer(
+                    payload, dtype=dtype, count=rows, offset=pos
+                )
+                pos += columns[name].nbytes
+        blocks[kind].append(columns)
+
+    def concat(kind):
+        names = [name for name, _ in COLUMNAR_LAYOUT[kind]]
+        if not blocks[kind]:
+            return {
+                name: np.array([], dtype=object if dtype == "str" else dtype)
+                for name, dtype in COLUMNAR_LAYOUT[kind]
+            }
+        return {n: np.concatenate([b[n] for b in blocks[kind]]) for n in names}
+
+    return {"trackers": concat(b"TRKR"), "activities": concat(b"ACTV")}
+
+
+EXPORT_FORMATS = {
+    "csv": (csvChunks, "text/csv", "export.csv"),
+    "ndjson.gz": (ndjsonGzChunks, "application/gzip", "export.ndjson.gz"),
+    "columnar": (columnarChunks, "application/octet-stream", "export.trkcol"),
+}
@@ -0,0 +1,103 @@
+import logging
+import os
+
+from flask import Flask
+from flask_security import Security, SQLAlchemySessionUserDatastore
+from flask_security.forms import RegisterForm, StringField, Required
+
+from .chart_cache import chartCache
+from .chart_renderer import chartRenderer
+from .commands import COMMANDS
+from .compression import compressResponse
+from .config import LocalDevelopmentConfig, ProductionConfig
+from .controllers.analytics_controllers import analytics
+from .controllers.api_controllers import api
+from .controllers.chart_controllers import charts
+from .controllers.metrics_controllers import monitoring
+from .controllers.search_controllers import search
+from .controllers.settings_controllers import settings
+from .controllers.tracker_controllers import trackers
+from .database import db, applySqliteEngineOptions, registerSqlitePragmas
+from .error import errors
+from .fragment_cache import fragmentCache
+from .ingest_queue import ingestQueue
+from .metrics import requestMetrics
+from .migrations import pendingMigrations, upgradeDatabase
+from .models import User, Role
+from .static_assets import staticAssets
+from .tracker_purge import trackerPurger
+
+# templates/ and static/ live next to the application package
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ExtendedRegisterForm(RegisterForm):
+    username = StringField("User Name", [Required()])
+
+
+def create_app(config=None):
+    """Build the app; config defaults to the one picked by the ENV variable.
+
+    Nothing is pushed globally: code outside a request or a CLI command needs
+    `with app.app_context():` to reach the database.
+    """
+    app = Flask(__name__, root_path=ROOT_DIR, template_folder="templates")
+    if config is None:
+        if os.getenv("ENV", "development") == "production":
+            app.logger.info("Starting Production.")
+            config = ProductionConfig
+        else:
+            app.logger.info("Staring Local Development.")
+            print("Staring Local Development")
+            config = LocalDevelopmentConfig
+    app.config.from_object(config)
+    logging.getLogger().setLevel(app.config["LOG_LEVEL"])
+    applySqliteEngineOptions(app)
+    db.init_app(app)
+    chartCache.init_app(app)
+    fragmentCache.init_app(app)
+    staticAssets.init_app(app)
+    chartRenderer.init_app(app)
+    ingestQueue.init_app(app)
+    trackerPurger.init_app(app)
+    with app.app_context():
+        registerSqlitePragmas(app)
+        if app.config["REQUEST_METRICS"]:
+            requestMetrics.init_app(app, db.engine)
+            if app.config["METRICS_TOKEN"] or not app.config["METRICS_REQUIRE_TOKEN"]:
+                app.register_blueprint(monitoring)
+            else:
+                app.logger.info("/metrics is off: set METRICS_TOKEN to serve it")
+        if app.config["AUTO_UPGRADE_DB"]:
+            upgradeDatabase()
+        pending = pendingMigrations()
+        if pending:
+            app.logger.error(
+                "Database schema is %s migration(s) behind; run `flask upgrade-db`",
+                pending,
+            )
+        elif trackerPurger.enabled:
+            trackerPurger.resumePending()
+    user_datastore = SQLAlchemySessionUserDatastore(db.session, User, Role)
+    Security(app, user_datastore, register_form=ExtendedRegisterForm)
+
+    app.register_blueprint(trackers)
+    app.register_blueprint(charts)
+    app.register_blueprint(analytics)
+    app.register_blueprint(search)
+    app.register_blueprint(settings)
+    app.register_blueprint(api)
+    app.register_blueprint(errors)
+    app.after_request(allowAnyOrigin)
+    # Registered last so it runs first, before the metrics see the size
+    app.after_request(compressResponse)
+    for command in COMMANDS:
+        app.cli.add_command(command)
+    app.logger.info("App setup complete")
+    print("App setup complete")
+    return app
+
+
+def allowAnyOrigin(response):
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
@@ -0,0 +1,40 @@
+from flask import current_app
+from markupsafe import Markup
+
+from .chart_cache import ChartCache
+
+# Rendered HTML fragments of the pages that are requested over and over
+# without any change to the data: the tracker rows of the home page and the
+# log table of the overview. Same LRU as the chart cache, in memory only;
+# keys start with the tracker id and carry its data_version, which every
+# write of logs bumps (touchTracker), so a write makes the old fragments
+# unreachable without any explicit invalidation.
+
+
+class FragmentCache(ChartCache):
+    def init_app(self, app):
+        self.maxBytes = app.config.get("FRAGMENT_CACHE_MAX_BYTES", self.maxBytes)
+        self.directory = None
+        self.clear()
+
+    def enabled(self):
+        return current_app.config["FRAGMENT_CACHE"]
+
+    def getHtml(self, key):
+        if not self.enabled():
+            return None
+        value = self.get(key)
+        return Markup(value.decode()) if value is not None else None
+
+    def putHtml(self, key, html):
+        if self.enabled():
+            self.put(key, html.encode())
+        return Markup(html)
+
+    def cached(self, key, render):
+        """The fragment stored under key, or render() stored under it."""
+        html = self.getHtml(key)
+        return html if html is not None else self.putHtml(key, render())
+
+
+fragmentCache = FragmentCache(4 * 1024 * 1024)
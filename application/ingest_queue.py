@@ -0,0 +1,196 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from .activity_service import touchTracker
+from .database import db
+from .metrics import Histogram
+from .models import Activity
+
+logger = logging.getLogger(__name__)
+
+# Group commit for new activity logs (INGEST_MODE = "queue"). Requests
+# validate their logs and hand the insert mappings to one writer thread,
+# which inserts everything queued within INGEST_MAX_DELAY_MS (at most
+# INGEST_BATCH_SIZE submissions) and commits it in one transaction: one
+# fsync and one trip through the SQLite write lock for the whole burst.
+
+INGEST_MODES = ("direct", "queue")
+INGEST_ACKS = ("commit", "enqueue")
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class IngestQueueFull(Exception):
+    """The queue holds INGEST_QUEUE_MAX submissions already."""
+
+
+class IngestQueue:
+    """Background writer for activity logs.
+
+    ingest() waits for the commit with ack="commit" and returns as soon as
+    the logs are queued with ack="enqueue"; logs acknowledged that way are
+    lost if the process dies before the writer gets to them. A batch that
+    fails is retried one submission at a time, so one bad submission does
+    not fail the logs committed with it.
+    """
+
+    def __init__(
+        self, batchSize=500, maxDelayMs=5, maxQueued=10000, ack="commit", timeout=10
+    ):
+        self.batchSize = batchSize
+        self.maxDelayMs = maxDelayMs
+        self.maxQueued = maxQueued
+        self.ack = ack
+        self.timeout = timeout
+        self.enabled = False
+        self.batchSizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.commitLatency = Histogram()
+        self.committed = 0
+        self.failed = 0
+        self._app = None
+        self._queue = queue.Queue(maxQueued)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.shutdown()
+        self.batchSize = app.config.get("INGEST_BATCH_SIZE", self.batchSize)
+        self.maxDelayMs = app.config.get("INGEST_MAX_DELAY_MS", self.maxDelayMs)
+        self.maxQueued = app.config.get("INGEST_QUEUE_MAX", self.maxQueued)
+        self.ack = app.config.get("INGEST_ACK", self.ack)
+        self.timeout = app.config.get("INGEST_TIMEOUT", self.timeout)
+        mode = app.config.get("INGEST_MODE", "direct")
+        if mode not in INGEST_MODES:
+            raise ValueError("Unknown ingest mode " + mode)
+        if self.ack not in INGEST_ACKS:
+            raise ValueError("Unknown ingest ack " + self.ack)
+        self.enabled = mode == "queue"
+        self._app = app
+        self._queue = queue.Queue(self.maxQueued)
+
+    def submit(self, trackerId, trackerType, mappings):
+        """Queue Activity insert mappings of one tracker; the Future resolves
+        to the number of logs once they are committed."""
+        self._start()
+        future = Future()
+        try:
+            self._queue.put_nowait((trackerId, trackerType, mappings, future))
+        except queue.Full:
+            raise IngestQueueFull()
+        return future
+
+    def ingest(self, trackerId, trackerType, mappings):
+        """Queue the logs and, with ack="commit", wait for their commit.
+
+        Returns True once they are committed, False when they are only
+        queued (ack="enqueue", or the commit took longer than the timeout).
+        """
+        future = self.submit(trackerId, trackerType, mappings)
+        if self.ack == "enqueue":
+            return False
+        try:
+            future.result(timeout=self.timeout)
+        except FutureTimeout:
+            return False
+        return True
+
+    def stats(self):
+        with self._lock:
+            committed = self.committed
+            failed = self.failed
+        return {
+            "enabled": self.enabled,
+            "ack": self.ack,
+            "queued": self._queue.qsize(),
+            "committed": committed,
+            "failed": failed,
+            "batch_size": self.batchSizes.snapshot(),
+            "commit_latency_ms": self.commitLatency.snapshot(),
+        }
+
+    def shutdown(self, timeout=None):
+        """Write everything queued so far and stop the writer."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="ingest-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.perf_counter() + self.maxDelayMs / 1000
+            while len(batch) < self.batchSize:
+                try:
+                    item = self._queue.get(
+                        timeout=max(deadline - time.perf_counter(), 0)
+                    )
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._writeBatch(batch)
+
+    def _writeBatch(self, batch):
+        started = time.perf_counter()
+        with self._app.app_context():
+            try:
+                self._insert(batch)
+            except Exception:
+                db.session.rollback()
+                logger.warning(
+                    "Group commit of %d submissions failed, retrying one by one",
+                    len(batch),
+                    exc_info=True,
+                )
+                for item in batch:
+                    try:
+                        self._insert([item])
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.exception("Ingesting logs of tracker %s failed", item[0])
+                        with self._lock:
+                            self.failed += len(item[2])
+                        item[3].set_exception(e)
+        self.batchSizes.observe(len(batch))
+        self.commitLatency.observe((time.perf_counter() - started) * 1000)
+
+    def _insert(self, batch):
+        timestamps = {}
+        trackerTypes = {}
+        for trackerId, trackerType, mappings, _ in batch:
+            db.session.bulk_insert_mappings(Activity, mappings)
+            timestamps.setdefault(trackerId, []).extend(
+                m["timestamp"] for m in mappings
+            )
+            trackerTypes[trackerId] = trackerType
+        for trackerId, changed in timestamps.items():
+            touchTracker(trackerId, changed, trackerTypes[trackerId])
+        db.session.commit()
+        with self._lock:
+            self.committed += sum(len(item[2]) for item in batch)
+        for _, _, mappings, future in batch:
+            future.set_result(len(mappings))
+
+
+ingestQueue = IngestQueue()
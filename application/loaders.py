@@ -0,0 +1,54 @@
+from flask import abort, g
+from flask_login import current_user
+from sqlalchemy.orm import contains_eager
+
+from .database import db
+from .models import Activity, Tracker
+
+# Request scoped lookups for the web UI. Every lookup filters on the logged in
+# user in the same query, so another user's tracker or log (or a deleted
+# tracker waiting for its purge) is a plain 404, and the result is kept on
+# flask.g so the view and the helpers it calls share one query per object per
+# request.
+
+
+def loadTracker(tid):
+    """The current user's tracker `tid`; aborts with 404 if there is none."""
+    trackers = g.setdefault("loadedTrackers", {})
+    if tid not in trackers:
+        trackers[tid] = (
+            db.session.query(Tracker)
+            .filter(
+                Tracker.id == tid,
+                Tracker.user_id == current_user.id,
+                Tracker.deleted_at.is_(None),
+            )
+            .first()
+        )
+    if trackers[tid] is None:
+        abort(404, "Tracker not found")
+    return trackers[tid]
+
+
+def loadActivity(aid):
+    """The current user's log `aid` with its tracker (activity.activity)
+    loaded by the same query; aborts with 404 if there is none."""
+    activities = g.setdefault("loadedActivities", {})
+    if aid not in activities:
+        activity = (
+            db.session.query(Activity)
+            .join(Activity.activity)
+            .options(contains_eager(Activity.activity))
+            .filter(
+                Activity.id == aid,
+                Tracker.user_id == current_user.id,
+                Tracker.deleted_at.is_(None),
+            )
+            .first()
+        )
+        activities[aid] = activity
+        if activity is not None:
+            g.setdefault("loadedTrackers", {})[activity.tracker_id] = activity.activity
+    if activities[aid] is None:
+        abort(404, "Log not found")
+    return activities[aid]
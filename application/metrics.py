@@ -0,0 +1,278 @@
+import bisect
+import threading
+import time
+
+# In-process instrumentation shared by the chart renderer and the request
+# hooks. Values are plain numbers; prometheusText() renders them for /metrics.
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Thread-safe histogram with fixed upper bounds (plus +Inf)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """{"buckets": [(upper bound, cumulative count)], "count", "sum"}"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "count": running, "sum": total}
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = 0.0
+
+
+SQL_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+SQL_TIME_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+RESPONSE_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RequestMetrics:
+    """Per endpoint latency, SQL statement count, SQL time and response size.
+
+    Request hooks time every request and SQLAlchemy engine events count the
+    statements it runs (in the request's thread, up to after_request, so the
+    rows of a streamed response are not included). A request slower than
+    slowRequestMs is logged as a warning; None turns that off.
+    """
+
+    def __init__(self, slowRequestMs=None):
+        self.slowRequestMs = slowRequestMs
+        self.latency = {}
+        self.sqlCount = {}
+        self.sqlTime = {}
+        self.responseSize = {}
+        self.requests = {}
+        self._current = threading.local()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, engine):
+        from flask import request
+        from sqlalchemy import event
+
+        self.slowRequestMs = app.config.get("SLOW_REQUEST_MS", self.slowRequestMs)
+        current = self._current
+
+        @app.before_request
+        def startRequest():
+            current.started = time.perf_counter()
+            current.statements = 0
+            current.sqlSeconds = 0.0
+
+        @app.after_request
+        def finishRequest(response):
+            if getattr(current, "started", None) is None:
+                return response
+            self.observe(
+                request.url_rule.endpoint if request.url_rule else "unmatched",
+                request.method,
+                response,
+                (time.perf_counter() - current.started) * 1000,
+                current.statements,
+                current.sqlSeconds * 1000,
+                app.logger,
+            )
+            current.started = None
+            return response
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def startStatement(conn, cursor, statement, parameters, context, many):
+            conn.info.setdefault("statementStarts", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def finishStatement(conn, cursor, statement, parameters, context, many):
+            elapsed = time.perf_counter() - conn.info["statementStarts"].pop()
+            if getattr(current, "started", None) is not None:
+                current.statements += 1
+                current.sqlSeconds += elapsed
+
+    def observe(self, endpoint, method, response, ms, statements, sqlMs, logger):
+        with self._lock:
+            if endpoint not in self.latency:
+                self.latency[endpoint] = Histogram()
+                self.sqlCount[endpoint] = Histogram(SQL_COUNT_BUCKETS)
+                self.sqlTime[endpoint] = Histogram(SQL_TIME_BUCKETS_MS)
+                self.responseSize[endpoint] = Histogram(RESPONSE_SIZE_BUCKETS)
+            key = (endpoint, method, response.status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+        self.latency[endpoint].observe(ms)
+        self.sqlCount[endpoint].observe(statements)
+        self.sqlTime[endpoint].observe(sqlMs)
+        # Streamed responses (exports) have no length up front
+        if response.content_length is not None:
+            self.responseSize[endpoint].observe(response.content_length)
+        if self.slowRequestMs is not None and ms > self.slowRequestMs:
+            logger.warning(
+                "Slow request %s %s (%s): %.1f ms, %d SQL statements in %.1f ms",
+                method,
+                endpoint,
+                response.status_code,
+                ms,
+                statements,
+                sqlMs,
+            )
+
+    def series(self):
+        """Copies of the per endpoint dicts, safe to iterate while requests
+        keep adding endpoints."""
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "latency": dict(self.latency),
+                "sql_count": dict(self.sqlCount),
+                "sql_time": dict(self.sqlTime),
+                "response_size": dict(self.responseSize),
+            }
+
+    def reset(self):
+        with self._lock:
+            for series in (
+                self.latency,
+                self.sqlCount,
+                self.sqlTime,
+                self.responseSize,
+                self.requests,
+            ):
+                series.clear()
+
+
+def formatValue(value):
+    return "%d" % value if value == int(value) else repr(round(value, 9))
+
+
+def prometheusHistogram(name, description, histograms, label="endpoint", scale=1):
+    """Prometheus text lines of {label value: Histogram}; scale converts the
+    observed unit to the exported one (0.001 for ms to seconds)."""
+    lines = ["# HELP %s %s" % (name, description), "# TYPE %s histogram" % name]
+    for value in sorted(histograms):
+        snapshot = histograms[value].snapshot()
+        labels = '%s="%s"' % (label, value) if label else ""
+        for bound, count in snapshot["buckets"]:
+            le = "+Inf" if bound == float("inf") else formatValue(bound * scale)
+            lines.append(
+                '%s_bucket{%s%sle="%s"} %d'
+                % (name, labels, "," if labels else "", le, count)
+            )
+        suffix = "{%s}" % labels if labels else ""
+        lines.append(
+            "%s_sum%s %s" % (name, suffix, formatValue(snapshot["sum"] * scale))
+        )
+        lines.append("%s_count%s %d" % (name, suffix, snapshot["count"]))
+    return lines
+
+
+def prometheusText(requestMetrics, renderer, cacheStats):
+    """/metrics body: request metrics plus chart renderer and cache stats."""
+    series = requestMetrics.series()
+    renderStats = renderer.stats()
+    lines = [
+        "# HELP http_requests_total Requests by endpoint, method and status.",
+        "# TYPE http_requests_total counter",
+    ]
+    for (endpoint, method, status), count in sorted(series["requests"].items()):
+        lines.append(
+            'http_requests_total{endpoint="%s",method="%s",status="%s"} %d'
+            % (endpoint, method, status, count)
+        )
+    lines += prometheusHistogram(
+        "http_request_duration_seconds",
+        "Request latency.",
+        series["latency"],
+        scale=0.001,
+    )
+    lines += prometheusHistogram(
+        "http_request_sql_statements",
+        "SQL statements per request.",
+        series["sql_count"],
+    )
+    lines += prometheusHistogram(
+        "http_request_sql_duration_seconds",
+        "Time spent in SQL per request.",
+        series["sql_time"],
+        scale=0.001,
+    )
+    lines += prometheusHistogram(
+        "http_response_size_bytes",
+        "Response body size (streamed responses excluded).",
+        series["response_size"],
+    )
+
+    lines += prometheusHistogram(
+        "chart_render_duration_seconds",
+        "Chart render time, including the wait for a worker.",
+        {renderer.backend: renderer.latency},
+        label="backend",
+        scale=0.001,
+    )
+    for name, kind, description, value in [
+        (
+            "chart_render_in_flight",
+            "gauge",
+            "Renders running or queued.",
+            renderStats["in_flight"],
+        ),
+        (
+            "chart_render_rejected_total",
+            "counter",
+            "Renders refused, pool full.",
+            renderStats["rejected"],
+        ),
+        (
+            "chart_render_timeouts_total",
+            "counter",
+            "Renders that timed out.",
+            renderStats["timeouts"],
+        ),
+        (
+            "chart_cache_hits_total",
+            "counter",
+            "Chart cache memory hits.",
+            cacheStats["hits"],
+        ),
+        (
+            "chart_cache_disk_hits_total",
+            "counter",
+            "Chart cache disk hits.",
+            cacheStats["disk_hits"],
+        ),
+        (
+            "chart_cache_misses_total",
+            "counter",
+            "Chart cache misses.",
+            cacheStats["misses"],
+        ),
+        (
+            "chart_cache_bytes",
+            "gauge",
+            "Bytes held by the chart cache.",
+            cacheStats["bytes"],
+        ),
+    ]:
+        lines += [
+            "# HELP %s %s" % (name, description),
+            "# TYPE %s %s" % (name, kind),
+            "%s %s" % (name, value),
+        ]
+    return "\n".join(lines) + "\n"
+
+
+requestMetrics = RequestMetrics()
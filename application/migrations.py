@@ -0,0 +1,292 @@
+import logging
+
+from flask import current_app
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.schema import CreateTable
+
+from .activity_service import replaceActivityOptions, typedValueColumns
+from .database import db
+from .models import Activity, ActivityOption, Tracker, User
+from .rollups import rebuildRollups
+from .search import createSearchIndex, rebuildSearchIndex
+from .timezones import getTimezone
+
+logger = logging.getLogger(__name__)
+
+# Schema upgrades for databases created before a column/index existed in
+# models.py. Every step must be idempotent: a brand new database gets the
+# full schema from db.create_all() and then runs all the steps as well.
+
+
+def getColumns(table):
+    return {c["name"] for c in inspect(db.session.connection()).get_columns(table)}
+
+
+def addColumn(table, column, ddl):
+    if column not in getColumns(table):
+        # Quoted when it needs to be ("user" is reserved on PostgreSQL)
+        name = db.engine.dialect.identifier_preparer.quote(table)
+        db.session.execute(text(f"ALTER TABLE {name} ADD COLUMN {column} {ddl}"))
+
+
+def createIndex(name, table, columns, where=None):
+    db.session.execute(
+        text(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+            + (f" WHERE {where}" if where else "")
+        )
+    )
+
+
+def migration001LastActivity():
+    createIndex(
+        "ix_activity_tracker_id_timestamp", "activity", ["tracker_id", "timestamp"]
+    )
+    addColumn("tracker", "last_activity_at", "DATETIME")
+    db.session.execute(
+        text(
+            "UPDATE tracker SET last_activity_at = "
+            "(SELECT MAX(timestamp) FROM activity WHERE activity.tracker_id = tracker.id)"
+        )
+    )
+
+
+def migration002DataVersion():
+    addColumn("tracker", "data_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def migration003DataChangedAt():
+    addColumn("tracker", "data_changed_at", "DATETIME")
+    db.session.execute(
+        text(
+            "UPDATE tracker SET data_changed_at = CURRENT_TIMESTAMP "
+            "WHERE data_changed_at IS NULL"
+        )
+    )
+
+
+def migration004ActivityRevision():
+    addColumn("activity", "revision", "INTEGER")
+    createIndex(
+        "ix_activity_tracker_id_revision", "activity", ["tracker_id", "revision"]
+    )
+    db.session.execute(
+        text(
+            "UPDATE activity SET revision = "
+            "(SELECT data_version FROM tracker WHERE tracker.id = activity.tracker_id) "
+            "WHERE revision IS NULL"
+        )
+    )
+
+
+def migration005Rollups():
+    # The rollup tables come from db.create_all(); they are filled by
+    # migration010RollupValueCount, from the typed columns that
+    # migration006TypedValues backfills
+    pass
+
+
+def migration006TypedValues():
+    addColumn("activity", "num_value", "REAL")
+    addColumn("activity", "duration_seconds", "INTEGER")
+    trackerTypes = dict(db.session.query(Tracker.id, Tracker.type))
+    lastId = 0
+    while True:
+        chunk = (
+            db.session.query(Activity.id, Activity.tracker_id, Activity.value)
+            .filter(Activity.id > lastId)
+            .order_by(Activity.id)
+            .limit(5000)
+            .all()
+        )
+        if not chunk:
+            break
+        lastId = chunk[-1].id
+        db.session.bulk_update_mappings(
+            Activity,
+            [
+                dict(typedValueColumns(trackerTypes.get(tid), value), id=aid)
+                for aid, tid, value in chunk
+            ],
+        )
+        replaceActivityOptions(
+            (aid, value) for aid, tid, value in chunk if trackerTypes.get(tid) == 2
+        )
+    # The rollups are rebuilt by migration010RollupValueCount, which always
+    # runs after this one: they need the user timezones of migration009
+
+
+def hasCascades(connection, table):
+    foreignKeys = inspect(connection).get_foreign_keys(table.name)
+    return all(
+        (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE"
+        for fk in foreignKeys
+    )
+
+
+def rebuildTable(connection, table):
+    """Recreate table from its models.py definition, keeping the rows whose
+    parents exist (SQLite cannot ALTER constraints in place)."""
+    metadata = MetaData()
+    for t in db.Model.metadata.sorted_tables:
+        t.to_metadata(metadata)
+    rebuilt = table.to_metadata(metadata, name=table.name + "_rebuild")
+    connection.execute(CreateTable(rebuilt))
+
+    oldColumns = {c["name"] for c in inspect(connection).get_columns(table.name)}
+    columns = ", ".join(c.name for c in table.columns if c.name in oldColumns)
+    parents = (
+        " AND ".join(
+            f"{fk.parent.name} IN (SELECT {fk.column.name} FROM {fk.column.table.name})"
+            for fk in table.foreign_keys
+        )
+        or "1 = 1"
+    )
+    copied = connection.execute(
+        text(
+            f"INSERT INTO {rebuilt.name} ({columns}) "
+            f"SELECT {columns} FROM {table.name} WHERE {parents}"
+        )
+    ).rowcount
+    dropped = (
+        connection.execute(text(f"SELECT COUNT(*) FROM {table.name}")).scalar() - copied
+    )
+    if dropped:
+        logger.warning("Dropped %d orphaned rows of %s", dropped, table.name)
+    sequence = None
+    if "sqlite_sequence" in inspect(connection).get_table_names():
+        sequence = connection.execute(
+            text("SELECT seq FROM sqlite_sequence WHERE name = :name"),
+            {"name": table.name},
+        ).scalar()
+    connection.execute(text(f"DROP TABLE {table.name}"))
+    connection.execute(text(f"ALTER TABLE {rebuilt.name} RENAME TO {table.name}"))
+    if sequence is not None and table.kwargs.get("sqlite_autoincrement"):
+        # Ids handed out before stay used, even those of deleted rows
+        connection.execute(
+            text("UPDATE sqlite_sequence SET seq = MAX(seq, :seq) WHERE name = :name"),
+            {"seq": sequence, "name": table.name},
+        )
+    for index in table.indexes:
+        index.create(connection)
+
+
+def migration007ForeignKeyCascades():
+    # Indexes on every foreign key, the tracker.deleted_at column (indexed by
+    # migration012) and ON DELETE CASCADE from user to tracker to activity to
+    # activity_option. SQLite tables are rebuilt with
+    # https://sqlite.org/lang_altertable.html#otheralter: with foreign keys
+    # off (a PRAGMA that only works outside a transaction, hence the
+    # connection of its own), so dropping the old tables cascades nothing.
+    createIndex("ix_roles_users_user_id", "roles_users", ["user_id"])
+    createIndex("ix_tracker_user_id", "tracker", ["user_id"])
+    addColumn("tracker", "deleted_at", "DATETIME")
+    db.session.commit()
+    if db.engine.dialect.name != "sqlite":
+        logger.warning("Add ON DELETE CASCADE to the foreign keys by hand")
+        return
+
+    tables = [Tracker.__table__, Activity.__table__, ActivityOption.__table__]
+    with db.engine.connect() as connection:
+        connection.execute(text("PRAGMA foreign_keys = OFF"))
+        try:
+            with connection.begin():
+                for table in tables:
+                    if hasCascades(connection, table):
+                        continue
+                    rebuildTable(connection, table)
+                    problems = connection.execute(
+                        text(f"PRAGMA foreign_key_check({table.name})")
+                    ).all()
+                    if problems:
+                        raise RuntimeError(
+                            "Foreign key check failed: %r" % problems[:10]
+                        )
+        finally:
+            connection.execute(text("PRAGMA foreign_keys = ON"))
+
+
+def migration008SearchIndex():
+    # The triggers keep the index in sync from now on; the rebuild indexes
+    # the notes that are already there
+    if not createSearchIndex():
+        logger.warning("No FTS5 here, note search falls back to LIKE scans")
+        return
+    rebuildSearchIndex()
+
+
+def migration009UserTimezone():
+    addColumn("user", "timezone", "VARCHAR(64)")
+
+
+def migration010RollupValueCount():
+    # Averages divided the sum by every log of the bucket, NULL values too
+    addColumn("activity_rollup", "value_count", "INTEGER NOT NULL DEFAULT 0")
+    rebuildRollups()
+
+
+def migration011LocalDayRollups():
+    # Buckets were UTC days; they are now days in the owner's timezone, which
+    # only changes them for users (or a DEFAULT_TIMEZONE) other than UTC
+    default = current_app.config["DEFAULT_TIMEZONE"]
+    for userId, name in db.session.query(User.id, User.timezone):
+        if str(getTimezone(name or default)) != "UTC":
+            rebuildRollups(userId=userId)
+
+
+def migration012TrackerDeletedAtIndex():
+    # The purge thread looks for deleted trackers on every run
+    createIndex(
+        "ix_tracker_deleted_at", "tracker", ["deleted_at"], "deleted_at IS NOT NULL"
+    )
+
+
+MIGRATIONS = [
+    migration001LastActivity,
+    migration002DataVersion,
+    migration003DataChangedAt,
+    migration004ActivityRevision,
+    migration005Rollups,
+    migration006TypedValues,
+    migration007ForeignKeyCascades,
+    migration008SearchIndex,
+    migration009UserTimezone,
+    migration010RollupValueCount,
+    migration011LocalDayRollups,
+    migration012TrackerDeletedAtIndex,
+]
+
+
+def getSchemaVersion():
+    db.session.execute(
+        text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    )
+    version = db.session.execute(
+        text("SELECT MAX(version) FROM schema_version")
+    ).scalar()
+    return version or 0
+
+
+def pendingMigrations():
+    """Number of MIGRATIONS not applied yet, without writing anything."""
+    if not inspect(db.session.connection()).has_table("schema_version"):
+        return len(MIGRATIONS)
+    version = db.session.execute(
+        text("SELECT MAX(version) FROM schema_version")
+    ).scalar()
+    return max(0, len(MIGRATIONS) - (version or 0))
+
+
+def upgradeDatabase():
+    db.create_all()
+    version = getSchemaVersion()
+    for number, step in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        logger.info("Applying schema migration %s (%s)", number, step.__name__)
+        step()
+        db.session.execute(
+            text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": number}
+        )
+        db.session.commit()
+    db.session.commit()
@@ -1,8 +1,11 @@
+import enum
+from datetime import datetime
+
 from .database import db
 from flask_security import RoleMixin, UserMixin
 
 roles_users = db.Table('roles_users',
- db.Column('user_id', db.Integer(), db.ForeignKey('user.id')),
+ db.Column('user_id', db.Integer(), db.ForeignKey('user.id'), index=True),
  db.Column('role_id', db.Integer(), db.ForeignKey('role.id')))
 
 class User(db.Model, UserMixin):
@@ -12,7 +15,14 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String, unique=True)
     password = db.Column(db.String(255))
     active = db.Column(db.Boolean())
-    trackers = db.relationship("Tracker", backref="tracker")
+    # IANA timezone name the UI shows times in (DEFAULT_TIMEZONE when unset)
+    timezone = db.Column(db.String(64))
+    trackers = db.relationship(
+        "Tracker",
+        backref="tracker",
+        cascade="save-update, merge, delete",
+        passive_deletes=True,
+    )
     roles = db.relationship('Role', secondary=roles_users, backref=db.backref('users', lazy='dynamic'))            
 
 class Role(db.Model, RoleMixin):
@@ -21,6 +31,12 @@ class Role(db.Model, RoleMixin):
     name = db.Column(db.String(80), unique=True)
     description = db.Column(db.String(255))
 
+class TRACKERTYPE(enum.Enum):
+    Numeric = 1
+    Multi = 2
+    Time_Duration = 3
+    Bool = 4
+
 class Tracker(db.Model):
     __tablename__ = "tracker"
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -28,13 +44,104 @@ class Tracker(db.Model):
     description = db.Column(db.String)
     type = db.Column(db.Integer, nullable=False)
     settings = db.Column(db.String)
-    user_id = db.Column(db.Integer,  db.ForeignKey("user.id"), nullable=False)
-    activity = db.relationship("Activity", backref="activity")
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # Denormalized MAX(activity.timestamp), kept current by the log write paths
+    last_activity_at = db.Column(db.DateTime)
+    # Bumped on every change to the tracker or its logs; part of chart cache keys
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    # When data_version was last bumped; Last-Modified of the chart endpoints
+    data_changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set when the user deletes the tracker; its logs are purged in the
+    # background (tracker_purge.py) and every tracker query skips it
+    deleted_at = db.Column(db.DateTime)
+    # Only the few deleted trackers are indexed: what the purge thread scans
+    __table_args__ = (
+        db.Index(
+            "ix_tracker_deleted_at",
+            "deleted_at",
+            sqlite_where=db.text("deleted_at IS NOT NULL"),
+            postgresql_where=db.text("deleted_at IS NOT NULL"),
+        ),
+    )
+    # The database deletes the logs (ON DELETE CASCADE); the ORM only deletes
+    # the ones already loaded in the session
+    activity = db.relationship(
+        "Activity",
+        backref="activity",
+        cascade="save-update, merge, delete",
+        passive_deletes=True,
+    )
 
 class Activity(db.Model):
     __tablename__ = "activity"
+    # Lookups by tracker_id alone use the leading column of these indexes.
+    # AUTOINCREMENT: ids are never reused, or a new log could take the id of
+    # a tombstone.
+    __table_args__ = (
+        db.Index("ix_activity_tracker_id_timestamp", "tracker_id", "timestamp"),
+        db.Index("ix_activity_tracker_id_revision", "tracker_id", "revision"),
+        {"sqlite_autoincrement": True},
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     timestamp = db.Column(db.DateTime, nullable=False)
     value = db.Column(db.String, nullable=False)
     note = db.Column(db.String, nullable=False)
-    tracker_id = db.Column(db.Integer, db.ForeignKey("tracker.id"), nullable=False)
+    tracker_id = db.Column(
+        db.Integer, db.ForeignKey("tracker.id", ondelete="CASCADE"), nullable=False
+    )
+    # tracker.data_version of the write that last changed this row; NULL until
+    # touchTracker stamps it. Drives the API's incremental sync cursor.
+    revision = db.Column(db.Integer)
+    # Typed copies of value: the number for Numeric trackers and 1/0 for Bool
+    # in num_value, durations in seconds; multiple choice options are in
+    # activity_option
+    num_value = db.Column(db.Float)
+    duration_seconds = db.Column(db.Integer)
+
+class ActivityOption(db.Model):
+    # One row per option picked in a multiple choice log
+    __tablename__ = "activity_option"
+    activity_id = db.Column(
+        db.Integer, db.ForeignKey("activity.id", ondelete="CASCADE"), primary_key=True
+    )
+    option = db.Column(db.String, primary_key=True)
+
+class ActivityTombstone(db.Model):
+    # Deleted activities, so sync clients can drop them
+    __tablename__ = "activity_tombstone"
+    __table_args__ = (
+        db.Index("ix_activity_tombstone_tracker_id_revision", "tracker_id", "revision"),
+    )
+    activity_id = db.Column(db.Integer, primary_key=True)
+    tracker_id = db.Column(db.Integer, nullable=False)
+    revision = db.Column(db.Integer)
+
+class ActivityRollup(db.Model):
+    # Per tracker aggregates of the logs in one UTC day/week/month bucket.
+    # sum/min/max hold the numeric value (seconds for durations, 1/0 for
+    # booleans) and stay NULL for multiple choice trackers. count is the
+    # number of logs, value_count the number of them with a numeric value:
+    # averages are sum / value_count.
+    __tablename__ = "activity_rollup"
+    tracker_id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+    sum = db.Column(db.Float)
+    min = db.Column(db.Float)
+    max = db.Column(db.Float)
+
+class ActivityOptionRollup(db.Model):
+    # Per option counts of multiple choice ("1"/"0" for boolean) trackers
+    __tablename__ = "activity_option_rollup"
+    tracker_id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    option = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
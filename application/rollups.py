@@ -0,0 +1,405 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, case, func, not_, or_
+
+from .database import db
+from .models import (
+    Activity,
+    ActivityOption,
+    ActivityOptionRollup,
+    ActivityRollup,
+    Tracker,
+    User,
+)
+from .timezones import getTimezone, localNow, offsetRuns, toLocal, toUtc
+
+# Pre-aggregated chart data. Day buckets are computed in SQL from the typed
+# value columns of the activity rows, week (starting Monday) and month
+# buckets from the day buckets. Buckets are calendar days/weeks/months in the
+# timezone of the tracker's owner (bucket_start is local midnight), so they
+# are rebuilt when the user changes timezone.
+# A write only recomputes the buckets containing the timestamps it touched.
+
+PERIODS = ("day", "week", "month")
+
+# Tracker types with per option counts (Multiple choice, Bool)
+OPTION_TYPES = (2, 4)
+
+# ?range= of the overview charts -> number of days, None for everything
+CHART_RANGES = {"30d": 30, "90d": 90, "1y": 365, "all": None}
+
+
+def bucketStart(period, dt):
+    day = datetime(dt.year, dt.month, dt.day)
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def bucketEnd(period, dt):
+    start = bucketStart(period, dt)
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def chartRangeStart(chartRange, zone, now=None):
+    """First local day (a bucket_start) of the range ending today in zone."""
+    days = CHART_RANGES[chartRange]
+    if days is None:
+        return None
+    return bucketStart("day", (now or localNow(zone)) - timedelta(days=days - 1))
+
+
+def mergeBucket(buckets, key, count, valueCount, total, low, high):
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = [count, valueCount, total, low, high]
+        return
+    bucket[0] += count
+    bucket[1] += valueCount
+    if total is not None:
+        bucket[2] = total if bucket[2] is None else bucket[2] + total
+        bucket[3] = low if bucket[3] is None else min(bucket[3], low)
+        bucket[4] = high if bucket[4] is None else max(bucket[4], high)
+
+
+def inRuns(column, runs):
+    """column within any of the [start, end) ranges of runs."""
+    return or_(*(and_(column >= start, column < end) for start, end in runs))
+
+
+def deleteBuckets(tid, runs=None, withOptions=True):
+    """Rollups of tracker tid; only the buckets in runs ({period: [start,
+    end) ranges}) when given, all periods in one statement per table."""
+    models = (ActivityRollup, ActivityOptionRollup)
+    for model in models if withOptions else models[:1]:
+        query = db.session.query(model).filter(model.tracker_id == tid)
+        if runs is not None:
+            query = query.filter(
+                or_(
+                    *(
+                        and_(model.period == period, inRuns(model.bucket_start, r))
+                        for period, r in runs.items()
+                    )
+                )
+            )
+        query.delete(synchronize_session=False)
+
+
+def saveBuckets(tid, buckets, options):
+    """buckets by (period, start), option counts by (period, start, option)."""
+    db.session.bulk_insert_mappings(
+        ActivityRollup,
+        [
+            {
+                "tracker_id": tid,
+                "period": period,
+                "bucket_start": start,
+                "count": count,
+                "value_count": valueCount,
+                "sum": total,
+                "min": low,
+                "max": high,
+            }
+            for (period, start), (
+                count,
+                valueCount,
+                total,
+                low,
+                high,
+            ) in buckets.items()
+        ],
+    )
+    db.session.bulk_insert_mappings(
+        ActivityOptionRollup,
+        [
+            {
+                "tracker_id": tid,
+                "period": period,
+                "bucket_start": start,
+                "option": option,
+                "count": count,
+            }
+            for (period, start, option), count in options.items()
+        ],
+    )
+
+
+def toDay(value):
+    # date() comes back as "YYYY-MM-DD" from SQLite and as a date elsewhere
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d")
+    return datetime(value.year, value.month, value.day)
+
+
+def shiftedDate(column, offset):
+    """date() of a UTC column moved by offset seconds."""
+    if not offset:
+        return func.date(column)
+    if db.engine.dialect.name == "sqlite":
+        return func.date(column, "%+d seconds" % offset)
+    return func.date(column + timedelta(seconds=offset))
+
+
+def localDate(column, utcRuns, zone):
+    """Local calendar day in zone of a UTC column whose values are all in
+    utcRuns: one CASE branch per offset (DST) period the runs cross."""
+    periods = []
+    for start, end in utcRuns:
+        for _, periodEnd, offset in offsetRuns(start, end, zone):
+            if periods and periods[-1][1] == offset:
+                periods[-1][0] = periodEnd
+            else:
+                periods.append([periodEnd, offset])
+    if len(periods) == 1:
+        return shiftedDate(column, periods[0][1])
+    return case(
+        *((column < end, shiftedDate(column, offset)) for end, offset in periods[:-1]),
+        else_=shiftedDate(column, periods[-1][1]),
+    )
+
+
+def computeDays(tid, trackerType, runs, zone):
+    # COUNT/SUM/MIN/MAX per local day straight from the typed value columns;
+    # logs without a numeric value count as logs, not as values of the
+    # average. runs are local days, the activity rows are read by their UTC
+    # bounds.
+    utcRuns = [(toUtc(start, zone), toUtc(end, zone)) for start, end in runs]
+    day = localDate(Activity.timestamp, utcRuns, zone)
+    number = func.coalesce(Activity.num_value, Activity.duration_seconds)
+    inRange = (Activity.tracker_id == tid, inRuns(Activity.timestamp, utcRuns))
+    days = {
+        toDay(d): [count, valueCount, total, low, high]
+        for d, count, valueCount, total, low, high in db.session.query(
+            day,
+            func.count(),
+            func.count(number),
+            func.sum(number),
+            func.min(number),
+            func.max(number),
+        )
+        .filter(*inRange)
+        .group_by(day)
+    }
+    if trackerType == 2:
+        counts = (
+            db.session.query(day, ActivityOption.option, func.count())
+            .join(ActivityOption, ActivityOption.activity_id == Activity.id)
+            .filter(*inRange)
+            .group_by(day, ActivityOption.option)
+        )
+    elif trackerType == 4:
+        counts = (
+            db.session.query(day, Activity.num_value, func.count())
+            .filter(*inRange)
+            .group_by(day, Activity.num_value)
+        )
+    else:
+        counts = []
+    options = {}
+    for d, option, count in counts:
+        if trackerType == 4:
+            option = "1" if option else "0"
+        options[toDay(d), option] = count
+    return days, options
+
+
+def storedDays(tid, trackerType, spans, excluded):
+    """Day rollups already stored within spans, except the excluded runs
+    (the days being recomputed)."""
+
+    def inRange(model):
+        return (
+            model.tracker_id == tid,
+            model.period == "day",
+            inRuns(model.bucket_start, spans),
+            not_(inRuns(model.bucket_start, excluded)),
+        )
+
+    days = {
+        day: [count, valueCount, total, low, high]
+        for day, count, valueCount, total, low, high in db.session.query(
+            ActivityRollup.bucket_start,
+            ActivityRollup.count,
+            ActivityRollup.value_count,
+            ActivityRollup.sum,
+            ActivityRollup.min,
+            ActivityRollup.max,
+        ).filter(*inRange(ActivityRollup))
+    }
+    options = {}
+    if trackerType in OPTION_TYPES:
+        options = {
+            (day, option): count
+            for day, option, count in db.session.query(
+                ActivityOptionRollup.bucket_start,
+                ActivityOptionRollup.option,
+                ActivityOptionRollup.count,
+            ).filter(*inRange(ActivityOptionRollup))
+        }
+    return days, options
+
+
+def runBuckets(period, runs):
+    """Set of the period bucket starts in runs."""
+    starts = set()
+    for start, end in runs:
+        while start < end:
+            starts.add(start)
+            start = bucketEnd(period, start)
+    return starts
+
+
+def refreshBuckets(tid, trackerType, runs, zone):
+    """Recompute the buckets of tracker tid in runs ({period: local [start,
+    end) ranges}, the week and month runs covering the day runs): days from
+    the activity rows, weeks and months from those days and the other
+    stored days of the runs. At most three statements per rollup table
+    (read, delete, insert), whatever the number of runs."""
+    days, dayOptions = computeDays(tid, trackerType, runs["day"], zone)
+    others, otherOptions = storedDays(
+        tid, trackerType, runs["week"] + runs["month"], runs["day"]
+    )
+    buckets = {("day", day): bucket for day, bucket in days.items()}
+    options = {("day", day, option): c for (day, option), c in dayOptions.items()}
+    for period in ("week", "month"):
+        refreshed = runBuckets(period, runs[period])
+        for source in (days, others):
+            for day, bucket in source.items():
+                key = bucketStart(period, day)
+                if key in refreshed:
+                    mergeBucket(buckets, (period, key), *bucket)
+        for source in (dayOptions, otherOptions):
+            for (day, option), count in source.items():
+                key = bucketStart(period, day)
+                if key in refreshed:
+                    key = (period, key, option)
+                    options[key] = options.get(key, 0) + count
+    deleteBuckets(tid, runs, trackerType in OPTION_TYPES)
+    saveBuckets(tid, buckets, options)
+
+
+def bucketRuns(period, timestamps):
+    """[start, end) ranges covering the period buckets of timestamps, with
+    adjacent buckets merged so a run of consecutive days is one range."""
+    runs = []
+    for start in sorted({bucketStart(period, t) for t in timestamps}):
+        if runs and runs[-1][1] == start:
+            runs[-1][1] = bucketEnd(period, start)
+        else:
+            runs.append([start, bucketEnd(period, start)])
+    return runs
+
+
+def getTrackerRollupInfo(tid):
+    """(type, timezone of the owner) of tracker tid; (None, None) when it
+    does not exist."""
+    row = (
+        db.session.query(Tracker.type, User.timezone)
+        .join(User, User.id == Tracker.user_id)
+        .filter(Tracker.id == tid)
+        .first()
+    )
+    if row is None:
+        return None, None
+    return row[0], getTimezone(row[1] or current_app.config["DEFAULT_TIMEZONE"])
+
+
+def refreshRollups(tid, timestamps, trackerType=None, zone=None):
+    """Recompute the buckets of tracker tid containing timestamps (old and
+    new timestamps of the changed logs), and only those: moving a log from
+    its first day to its last recomputes two days, two weeks, two months.
+    zone is the owner's timezone; callers serving the owner pass it to save
+    a query."""
+    timestamps = [t for t in timestamps if t is not None]
+    if not timestamps:
+        return
+    if trackerType is None or zone is None:
+        trackerType, zone = getTrackerRollupInfo(tid)
+    if trackerType is None:
+        return
+    local = [toLocal(t, zone) for t in timestamps]
+    refreshBuckets(tid, trackerType, {p: bucketRuns(p, local) for p in PERIODS}, zone)
+
+
+def rebuildRollups(tid=None, userId=None):
+    """Drop and recompute the rollups of one tracker, of the trackers of one
+    user (after a timezone change), or of all trackers."""
+    if tid is None and userId is None:
+        for model in (ActivityRollup, ActivityOptionRollup):
+            db.session.query(model).delete(synchronize_session=False)
+        trackerIds = [t for (t,) in db.session.query(Tracker.id).order_by(Tracker.id)]
+    elif tid is None:
+        trackerIds = [
+            t
+            for (t,) in db.session.query(Tracker.id)
+            .filter(Tracker.user_id == userId)
+            .order_by(Tracker.id)
+        ]
+    else:
+        trackerIds = [tid]
+    for trackerId in trackerIds:
+        if tid is not None or userId is not None:
+            deleteBuckets(trackerId)
+        first, last = (
+            db.session.query(func.min(Activity.timestamp), func.max(Activity.timestamp))
+            .filter(Activity.tracker_id == trackerId)
+            .one()
+        )
+        trackerType, zone = getTrackerRollupInfo(trackerId)
+        if first is None or trackerType is None:
+            continue
+        first, last = toLocal(first, zone), toLocal(last, zone)
+        # Every bucket from the first log to the last
+        runs = {p: [(bucketStart(p, first), bucketEnd(p, last))] for p in PERIODS}
+        refreshBuckets(trackerId, trackerType, runs, zone)
+    return len(trackerIds)
+
+
+def getRollups(tid, period, since=None):
+    """(bucket_start, value_count, sum, min, max) rows of one period, oldest
+    first."""
+    query = db.session.query(
+        ActivityRollup.bucket_start,
+        ActivityRollup.value_count,
+        ActivityRollup.sum,
+        ActivityRollup.min,
+        ActivityRollup.max,
+    ).filter(ActivityRollup.tracker_id == tid, ActivityRollup.period == period)
+    if since is not None:
+        query = query.filter(ActivityRollup.bucket_start >= since)
+    return query.order_by(ActivityRollup.bucket_start).all()
+
+
+def getOptionCounts(tid, since=None):
+    """(option, count) pairs over the range; whole months are summed when the
+    range is unbounded, days otherwise so the range start is exact."""
+    period = "month" if since is None else "day"
+    query = db.session.query(
+        ActivityOptionRollup.option, func.sum(ActivityOptionRollup.count)
+    ).filter(
+        ActivityOptionRollup.tracker_id == tid,
+        ActivityOptionRollup.period == period,
+    )
+    if since is not None:
+        query = query.filter(ActivityOptionRollup.bucket_start >= since)
+    return query.group_by(ActivityOptionRollup.option).all()
+
+
+def choosePeriod(tid, since, maxBuckets):
+    """Finest period with at most maxBuckets non-empty buckets in the range."""
+    for period in PERIODS[:-1]:
+        query = db.session.query(func.count()).filter(
+            ActivityRollup.tracker_id == tid, ActivityRollup.period == period
+        )
+        if since is not None:
+            query = query.filter(ActivityRollup.bucket_start >= since)
+        if query.scalar() <= maxBuckets:
+            return period
+    return PERIODS[-1]
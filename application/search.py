@@ -0,0 +1,224 @@
+import logging
+import re
+from collections import namedtuple
+
+from markupsafe import Markup, escape
+from sqlalchemy import DateTime, bindparam, text
+
+from .database import db
+
+logger = logging.getLogger(__name__)
+
+# Full text search over activity notes. On SQLite the notes are indexed by an
+# FTS5 table with external content (activity_fts: the text stays in activity,
+# the index keeps only the tokens), kept in sync by triggers on activity, so
+# every write path (forms, API, bulk import, ingest queue, cascades and
+# purges) updates it without any Python code. Other databases, or an SQLite
+# built without FTS5, fall back to a LIKE scan.
+
+FTS_TABLE = "activity_fts"
+
+FTS_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "note, content='activity', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS activity_fts_insert AFTER INSERT ON activity "
+    f"BEGIN INSERT INTO {FTS_TABLE}(rowid, note) VALUES (new.id, new.note); END",
+    f"CREATE TRIGGER IF NOT EXISTS activity_fts_delete AFTER DELETE ON activity "
+    f"BEGIN INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note) "
+    f"VALUES ('delete', old.id, old.note); END",
+    f"CREATE TRIGGER IF NOT EXISTS activity_fts_update AFTER UPDATE OF note "
+    f"ON activity BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, note) "
+    f"VALUES ('delete', old.id, old.note); "
+    f"INSERT INTO {FTS_TABLE}(rowid, note) VALUES (new.id, new.note); END",
+]
+
+# snippet() wraps the matches in these; they cannot come from a note typed
+# in a form, so the note can be HTML escaped first and the marks added after
+MARK_START, MARK_END = "\x02", "\x03"
+
+SearchPage = namedtuple("SearchPage", ["hits", "hasNext", "order"])
+SearchHit = namedtuple(
+    "SearchHit", ["id", "tracker_id", "tracker_name", "timestamp", "value", "snippet"]
+)
+
+
+def hasFts5():
+    if db.engine.dialect.name != "sqlite":
+        return False
+    options = db.session.execute(text("PRAGMA compile_options")).scalars().all()
+    return "ENABLE_FTS5" in options
+
+
+def hasSearchIndex():
+    return (
+        db.engine.dialect.name == "sqlite"
+        and db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).scalar()
+        is not None
+    )
+
+
+def createSearchIndex():
+    """Create the FTS5 table and its triggers (no-op when they exist);
+    False when this database cannot have them."""
+    if not hasFts5():
+        return False
+    for statement in FTS_SCHEMA:
+        db.session.execute(text(statement))
+    return True
+
+
+def rebuildSearchIndex():
+    """Re-tokenize every note, e.g. after rows were changed with the
+    triggers missing. Returns False without an FTS5 index."""
+    if not hasSearchIndex():
+        return False
+    db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    return True
+
+
+def ftsQuery(terms):
+    """FTS5 MATCH expression for what a user typed: every word must match,
+    taken literally (quotes, AND/OR/NOT and column filters lose their
+    meaning), and a trailing * makes a word a prefix."""
+    words = []
+    for word in terms.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            words.append('"%s"%s' % (word.replace('"', '""'), "*" if prefix else ""))
+    return " ".join(words)
+
+
+def likePattern(word):
+    return "%" + re.sub(r"([%_\\])", r"\\\1", word.rstrip("*")) + "%"
+
+
+def highlight(snippet):
+    return Markup(
+        str(escape(snippet)).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+    )
+
+
+def typedQuery(sql, params, **columns):
+    # Typed so the dates are compared and read back in the format the
+    # DateTime columns are stored in, not as driver defaults
+    query = text(sql).columns(**columns)
+    return query.bindparams(
+        *(
+            bindparam(name, type_=DateTime)
+            for name in ("start", "end")
+            if name in params
+        )
+    )
+
+
+def countMatches(where, params, limit):
+    """The user's logs matching the FTS5 query of the search (where: the
+    MATCH and the user / tracker / date filters), counting up to limit.
+    CROSS JOIN keeps the index as the outer loop, as in the search itself;
+    driven from an activity range, SQLite would run the MATCH once per row."""
+    params = dict(params, countLimit=limit)
+    sql = (
+        f"SELECT COUNT(*) FROM (SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} "
+        f"CROSS JOIN activity ON activity.id = {FTS_TABLE}.rowid "
+        f"CROSS JOIN tracker ON tracker.id = activity.tracker_id "
+        f"WHERE {where} LIMIT :countLimit)"
+    )
+    return db.session.execute(typedQuery(sql, params), params).scalar()
+
+
+def searchActivities(
+    userId,
+    terms,
+    trackerId=None,
+    start=None,
+    end=None,
+    page=1,
+    pageSize=20,
+    rankLimit=None,
+    fts=None,
+):
+    """One page of the user's logs whose note matches terms.
+
+    With the FTS5 index the best matches (BM25) come first. BM25 scores every
+    match before the first row is returned, so when the terms match more
+    than rankLimit of the user's notes the index is read most recently
+    logged first instead, which stops after a page. The LIKE scan is always
+    newest first. The order used is returned with the page ("rank" or
+    "newest"). fts=None uses the index when there is one; False forces the
+    LIKE scan (for benchmarks).
+    """
+    if fts is None:
+        fts = hasSearchIndex()
+    order = "newest"
+    params = {
+        "user": userId,
+        "limit": pageSize + 1,
+        "offset": (page - 1) * pageSize,
+    }
+    filters = ["tracker.user_id = :user", "tracker.deleted_at IS NULL"]
+    if trackerId is not None:
+        filters.append("activity.tracker_id = :tracker")
+        params["tracker"] = trackerId
+    if start is not None:
+        filters.append("activity.timestamp >= :start")
+        params["start"] = start
+    if end is not None:
+        filters.append("activity.timestamp < :end")
+        params["end"] = end
+
+    if fts:
+        params["match"] = ftsQuery(terms)
+        if not params["match"]:
+            return SearchPage([], False, order)
+        where = f"{FTS_TABLE} MATCH :match AND {' AND '.join(filters)}"
+        orderBy = f"{FTS_TABLE}.rowid DESC"
+        # Only this user's matches decide the order: other accounts' notes
+        # must not change (or reveal anything through) how a search runs
+        if rankLimit is None or countMatches(where, params, rankLimit + 1) <= rankLimit:
+            order = "rank"
+            orderBy = f"bm25({FTS_TABLE}), " + orderBy
+        sql = (
+            f"SELECT activity.id, activity.tracker_id, tracker.name, "
+            f"activity.timestamp, activity.value, "
+            f"snippet({FTS_TABLE}, 0, '{MARK_START}', '{MARK_END}', '…', 16) "
+            f"FROM {FTS_TABLE} "
+            f"JOIN activity ON activity.id = {FTS_TABLE}.rowid "
+            f"JOIN tracker ON tracker.id = activity.tracker_id "
+            f"WHERE {where} "
+            f"ORDER BY {orderBy} LIMIT :limit OFFSET :offset"
+        )
+    else:
+        words = [w for w in terms.split() if w.rstrip("*")]
+        if not words:
+            return SearchPage([], False, order)
+        for i, word in enumerate(words):
+            filters.append(f"activity.note LIKE :word{i} ESCAPE '\\'")
+            params["word%d" % i] = likePattern(word)
+        sql = (
+            "SELECT activity.id, activity.tracker_id, tracker.name, "
+            "activity.timestamp, activity.value, activity.note "
+            "FROM activity JOIN tracker ON tracker.id = activity.tracker_id "
+            f"WHERE {' AND '.join(filters)} "
+            "ORDER BY activity.timestamp DESC, activity.id DESC "
+            "LIMIT :limit OFFSET :offset"
+        )
+
+    rows = db.session.execute(typedQuery(sql, params, timestamp=DateTime), params).all()
+    hits = [
+        SearchHit(
+            row[0],
+            row[1],
+            row[2],
+            row[3],
+            row[4],
+            highlight(row[5] or "") if fts else escape(row[5] or ""),
+        )
+        for row in rows[:pageSize]
+    ]
+    return SearchPage(hits, len(rows) > pageSize, order)
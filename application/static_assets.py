@@ -0,0 +1,64 @@
+import hashlib
+import os
+import threading
+
+from flask import request
+from werkzeug.security import safe_join
+
+# Content-hashed static URLs: url_for("static", filename=...) gets a
+# ?v=<hash of the file> argument, so a changed file gets a new URL and the
+# old one can be cached by browsers for a year without ever going stale.
+# Requests carrying the current hash are answered "immutable"; anything else
+# (no v, an old v) must be revalidated.
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class StaticAssets:
+    def __init__(self):
+        self.folder = None
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.folder = app.static_folder
+        self._hashes = {}
+        app.url_defaults(self.addVersion)
+        app.after_request(self.cacheHeaders)
+
+    def staticHash(self, filename):
+        """Hash of a static file's content, recomputed when its mtime changes;
+        None for a file that does not exist."""
+        path = safe_join(self.folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except (OSError, TypeError):  # missing, or outside static/
+            return None
+        with self._lock:
+            cached = self._hashes.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as file:
+            digest = hashlib.md5(file.read()).hexdigest()[:12]
+        with self._lock:
+            self._hashes[filename] = (mtime, digest)
+        return digest
+
+    def addVersion(self, endpoint, values):
+        if endpoint == "static" and "v" not in values:
+            digest = self.staticHash(values.get("filename", ""))
+            if digest is not None:
+                values["v"] = digest
+
+    def cacheHeaders(self, response):
+        if request.endpoint != "static" or response.status_code not in (200, 304):
+            return response
+        version = request.args.get("v")
+        if version and version == self.staticHash(request.view_args["filename"]):
+            response.headers["Cache-Control"] = IMMUTABLE
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+
+staticAssets = StaticAssets()
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+from flask import current_app
+from flask_login import current_user
+
+# Timestamps are stored as naive UTC datetimes, everywhere. They become local
+# time only on the way out (tables, forms, exports), in the timezone of the
+# user (User.timezone, an IANA name like "Europe/Paris"), and local form
+# input becomes UTC on the way in. Values are converted into new objects:
+# rows loaded through the ORM are never shifted in place.
+
+UTC = timezone.utc
+
+
+@lru_cache(maxsize=None)
+def timezoneNames():
+    return sorted(available_timezones())
+
+
+@lru_cache(maxsize=256)
+def getTimezone(name):
+    """ZoneInfo for an IANA name; UTC for None or an unknown name."""
+    if not name:
+        return UTC
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return UTC
+
+
+def isTimezone(name):
+    return name in timezoneNames()
+
+
+def getUserTimezone():
+    name = None
+    if current_user and current_user.is_authenticated:
+        name = current_user.timezone
+    return getTimezone(name or current_app.config["DEFAULT_TIMEZONE"])
+
+
+def toLocal(dt, zone):
+    """Naive UTC -> naive local time in zone."""
+    if dt is None:
+        return None
+    return dt.replace(tzinfo=UTC).astimezone(zone).replace(tzinfo=None)
+
+
+def toUtc(dt, zone):
+    """Naive local time in zone (or an aware datetime) -> naive UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=zone)
+    return dt.astimezone(UTC).replace(tzinfo=None)
+
+
+def parseLocalTimestamp(value, zone):
+    """A datetime-local form value ("2022-01-31T18:30") in zone, or any ISO
+    8601 timestamp with an offset, as naive UTC. Raises ValueError."""
+    return toUtc(datetime.fromisoformat(value.strip().replace("Z", "+00:00")), zone)
+
+
+def localOffsets(values, zone):
+    """UTC offset in zone of every value of a datetime64 array (UTC), as
+    timedelta64[s].
+
+    Offsets only change at the zone's transitions, so they are looked up
+    once per distinct day (at its first and last second) and only the rows
+    of a day that has a transition in it are converted one by one.
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype="datetime64[s]")
+    if zone is UTC or not len(values):
+        return np.zeros(len(values), dtype="timedelta64[s]")
+
+    def offsetOf(moment):
+        utc = moment.astype(datetime).replace(tzinfo=UTC)
+        return int(utc.astimezone(zone).utcoffset().total_seconds())
+
+    days, inverse = np.unique(values.astype("datetime64[D]"), return_inverse=True)
+    firsts = days.astype("datetime64[s]")
+    lasts = firsts + np.timedelta64(86399, "s")
+    starts = np.array([offsetOf(d) for d in firsts], dtype=np.int64)
+    ends = np.array([offsetOf(d) for d in lasts], dtype=np.int64)
+    offsets = starts[inverse]
+    changing = np.flatnonzero((starts != ends)[inverse])
+    offsets[changing] = [offsetOf(v) for v in values[changing]]
+    return offsets.astype("timedelta64[s]")
+
+
+def localIsoStrings(values, zone):
+    """ISO 8601 local times with their offset ("2022-01-31T18:30:00+05:30")
+    for a datetime64 array of UTC values."""
+    import numpy as np
+
+    values = np.asarray(values, dtype="datetime64[s]")
+    offsets = localOffsets(values, zone)
+    local = np.datetime_as_string(values + offsets, unit="s")
+    # Few distinct offsets: format each once
+    unique, inverse = np.unique(offsets.astype(np.int64), return_inverse=True)
+    suffixes = np.array([formatOffset(int(o)) for o in unique])
+    return np.char.add(local, suffixes[inverse])
+
+
+def formatOffset(seconds):
+    sign = "-" if seconds < 0 else "+"
+    minutes = abs(seconds) // 60
+    return "%s%02d:%02d" % (sign, minutes // 60, minutes % 60)
+
+
+def localNow(zone):
+    return toLocal(datetime.utcnow(), zone)
+
+
+def localDayStart(day, zone):
+    """UTC start of a local calendar day (a date or naive datetime)."""
+    return toUtc(datetime(day.year, day.month, day.day), zone)
+
+
+def dayRange(start, end, zone):
+    """UTC bounds [start, end + 1 day) of inclusive local days."""
+    return (
+        localDayStart(start, zone) if start is not None else None,
+        localDayStart(end + timedelta(days=1), zone) if end is not None else None,
+    )
+
+
+def utcOffset(dt, zone):
+    """UTC offset in seconds of zone at naive UTC dt."""
+    return int(dt.replace(tzinfo=UTC).astimezone(zone).utcoffset().total_seconds())
+
+
+def offsetRuns(start, end, zone):
+    """[start, end) (naive UTC) split where the UTC offset of zone changes:
+    [(start, end, offset in seconds)], one entry for zones without DST.
+
+    The offset is sampled once a day and a change is then narrowed down to
+    the second, so a range of years costs a few thousand lookups."""
+    second = timedelta(seconds=1)
+    runs = []
+    runStart, offset = start, utcOffset(start, zone)
+    probe = start
+    while probe < end:
+        last = min(probe + timedelta(days=1), end) - second
+        if utcOffset(last, zone) == offset:
+            probe = last + second
+            continue
+        # First second with the new offset: after the last one checked
+        low, high = probe - second, last
+        while high - low > second:
+            middle = low + ((high - low) // second // 2) * second
+            if utcOffset(middle, zone) == offset:
+                low = middle
+            else:
+                high = middle
+        runs.append((runStart, high, offset))
+        runStart, offset, probe = high, utcOffset(high, zone), high
+    runs.append((runStart, end, offset))
+    return runs
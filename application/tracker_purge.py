@@ -0,0 +1,129 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import select
+
+from .database import db
+from .models import Activity, ActivityTombstone, Tracker
+from .rollups import deleteBuckets
+
+logger = logging.getLogger(__name__)
+
+# Deleting a tracker with hundreds of thousands of logs in one statement holds
+# the SQLite write lock for seconds. With TRACKER_DELETE_MODE = "background"
+# the request only sets tracker.deleted_at; this thread then deletes the logs
+# PURGE_CHUNK_ROWS at a time, one short transaction each, and finally the
+# tracker row. activity_option rows go with their logs (ON DELETE CASCADE).
+
+TRACKER_DELETE_MODES = ("background", "immediate")
+
+
+def purgeTracker(tid, chunkRows=1000, pauseMs=0):
+    """Delete the logs of tracker `tid` in chunks, then the tracker itself.
+
+    Every chunk is committed on its own. Returns the number of logs deleted.
+    """
+    deleted = 0
+    while True:
+        chunk = (
+            select(Activity.id).where(Activity.tracker_id == tid).limit(chunkRows)
+        ).scalar_subquery()
+        count = (
+            db.session.query(Activity)
+            .filter(Activity.id.in_(chunk))
+            .delete(synchronize_session=False)
+        )
+        db.session.commit()
+        deleted += count
+        if count < chunkRows:
+            break
+        if pauseMs:
+            time.sleep(pauseMs / 1000)
+    db.session.query(ActivityTombstone).filter(
+        ActivityTombstone.tracker_id == tid
+    ).delete(synchronize_session=False)
+    deleteBuckets(tid)
+    # Logs queued for the tracker while the chunks ran cascade with it
+    db.session.query(Tracker).filter(Tracker.id == tid).delete(
+        synchronize_session=False
+    )
+    db.session.commit()
+    return deleted
+
+
+class TrackerPurger:
+    """Background thread purging soft deleted trackers one at a time."""
+
+    def __init__(self, chunkRows=1000, pauseMs=10):
+        self.chunkRows = chunkRows
+        self.pauseMs = pauseMs
+        self.enabled = False
+        self._app = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.shutdown()
+        self.chunkRows = app.config.get("PURGE_CHUNK_ROWS", self.chunkRows)
+        self.pauseMs = app.config.get("PURGE_PAUSE_MS", self.pauseMs)
+        mode = app.config.get("TRACKER_DELETE_MODE", "background")
+        if mode not in TRACKER_DELETE_MODES:
+            raise ValueError("Unknown tracker delete mode " + mode)
+        self.enabled = mode == "background"
+        self._app = app
+        self._queue = queue.Queue()
+
+    def schedule(self, tid):
+        self._start()
+        self._queue.put(tid)
+
+    def resumePending(self):
+        """Schedule the trackers whose purge a restart interrupted."""
+        pending = db.session.query(Tracker.id).filter(Tracker.deleted_at.isnot(None))
+        for (tid,) in pending.all():
+            self.schedule(tid)
+
+    def shutdown(self, timeout=None):
+        """Finish the purges scheduled so far and stop the thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="tracker-purge", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _run(self):
+        while True:
+            tid = self._queue.get()
+            if tid is None:
+                break
+            started = time.perf_counter()
+            with self._app.app_context():
+                try:
+                    deleted = purgeTracker(tid, self.chunkRows, self.pauseMs)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Purging tracker %s failed", tid)
+                    continue
+            logger.info(
+                "Purged tracker %s and %d logs in %.0f ms",
+                tid,
+                deleted,
+                (time.perf_counter() - started) * 1000,
+            )
+
+
+trackerPurger = TrackerPurger()
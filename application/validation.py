@@ -4,16 +4,19 @@ from flask import make_response, abort
 import json
 
 
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
 class SchemaValidationError(HTTPException):
     def __init__(self, status_code, error_code, error_message):
         data = {"error_code": error_code, "error_message": error_message}
-        self.response = make_response(json.dumps(data), status_code)
+        self.response = make_response(json.dumps(data), status_code, JSON_HEADERS)
 
 
 class BusinessValidationError(HTTPException):
     def __init__(self, status_code, error_code, error_message):
         data = {"error_code": error_code, "error_message": error_message}
-        self.response = make_response(json.dumps(data), status_code)
+        self.response = make_response(json.dumps(data), status_code, JSON_HEADERS)
 
 
 class NotFoundError(HTTPException):
@@ -32,3 +35,52 @@ def validateTrackerData(tdata):
 def validateTrackerLogData(tdata):
     # Validate Tracker data
     return True
+
+
+def getLogValueError(trackerType, settings, values):
+    # Rules for the value(s) of a tracker log, shared by the log form and the
+    # bulk importer. `values` is the submitted list (the "tvalue" form list,
+    # or a stored value split on ","). Returns the error message or None.
+    if not values or values[0] is None or values[0] == "":
+        return "Tracker log value is mandatory."
+
+    if trackerType == 1:
+        try:
+            val = float(values[0])
+        except ValueError:
+            return "Log value should be Numeric. ex: 10, 2.5 ..."
+        if not val >= 0:
+            return "Log value should positive. ex: 10, 2.5 ..."
+
+    if trackerType == 2:
+        possibleValues = (settings or "").split(",")
+        for op in values:
+            if op not in possibleValues:
+                return "Invalid option for the Multi tracker. Allowed values are " + (
+                    settings or ""
+                )
+
+    if trackerType == 3:
+        if len(values) != 3 or not all(t.isdigit() for t in values):
+            return "Time duration values are not correct"
+
+    if trackerType == 4 and values[0] not in ["1", "0"]:
+        return "Only yes/no allowed"
+
+    return None
+
+
+def numericValue(trackerType, value):
+    # Numeric value of a log as float64: the number itself, duration in
+    # seconds, 1/0 for booleans and NaN for multiple choice.
+    try:
+        if trackerType == 1:
+            return float(value)
+        if trackerType == 3:
+            h, m, s = value.split(",")
+            return int(h) * 3600 + int(m) * 60 + int(s)
+        if trackerType == 4:
+            return float(value == "1")
+    except ValueError:
+        pass
+    return float("nan")
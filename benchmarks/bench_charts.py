@@ -0,0 +1,76 @@
+"""Chart data preparation and render time per tracker type and range.
+
+Renders bypass the chart cache. "full" plots every daily bucket, "budget"
+is the configured CHART_MAX_BUCKETS / CHART_MAX_POINTS downsampling.
+
+    python benchmarks/bench_charts.py --activities 100000
+"""
+
+import argparse
+import json
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--activities", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = common.loadApp(common.tempDatabasePath())
+    from application.controllers.chart_controllers import getChartImg
+    from application.chart_data import getTrendSeries
+    from application.database import db
+    from application.models import Tracker
+    from application.rollups import CHART_RANGES, chartRangeStart
+    from application.timezones import UTC
+
+    userId = common.seed(4, args.activities)
+    trackers = db.session.query(Tracker).filter(Tracker.user_id == userId).all()
+    config = app.config
+    budgets = {
+        "full": (10**9, 10**9),
+        "budget": (config["CHART_MAX_BUCKETS"], config["CHART_MAX_POINTS"]),
+    }
+
+    results = {}
+    with app.test_request_context("/"):
+        for tracker in trackers:
+            for chartRange in CHART_RANGES:
+                since = chartRangeStart(chartRange, UTC)
+                for name, (maxBuckets, maxPoints) in budgets.items():
+                    if tracker.type in (1, 3):
+                        series = getTrendSeries(
+                            tracker.id, since, 1, maxBuckets, maxPoints
+                        )
+                        points = 0 if series is None else len(series.x)
+                        prepare = common.timeit(
+                            lambda: getTrendSeries(
+                                tracker.id, since, 1, maxBuckets, maxPoints
+                            ),
+                            args.repeat,
+                        )
+                    elif name == "full":
+                        continue
+                    else:
+                        points, prepare = None, None
+                    config["CHART_MAX_BUCKETS"] = maxBuckets
+                    config["CHART_MAX_POINTS"] = maxPoints
+                    render = common.timeit(
+                        lambda: getChartImg(tracker, "png", since),
+                        args.repeat,
+                    )
+                    key = "type%d/%s/%s" % (tracker.type, chartRange, name)
+                    results[key] = {
+                        "points": points,
+                        "prepare": prepare,
+                        "render": render,
+                    }
+    config["CHART_MAX_BUCKETS"], config["CHART_MAX_POINTS"] = budgets["budget"]
+
+    print(json.dumps({"activities": args.activities, "charts": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
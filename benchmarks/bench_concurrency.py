@@ -0,0 +1,128 @@
+"""Parallel writers logging activities while readers load `/`.
+
+Each configuration runs in its own process against a fresh copy of the
+seeded database; "development" is the plain SQLite setup, "production"
+adds WAL, the pragmas and the connection pool from ProductionConfig.
+
+    python benchmarks/bench_concurrency.py --writers 8 --readers 8 --seconds 10
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import common
+
+
+def run(dbPath, userId, trackerIds, writers, readers, seconds):
+    app = common.loadApp(dbPath)
+    stop = time.perf_counter() + seconds
+    results = {"write": [], "read": []}
+    errors = {"write": 0, "read": 0, "locked": 0}
+    lock = threading.Lock()
+
+    def worker(kind, index):
+        client = app.test_client()
+        common.login(client, userId)
+        tid = trackerIds[index % len(trackerIds)]
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                if kind == "write":
+                    response = client.post(
+                        "/tracker/%d/log" % tid,
+                        data={
+                            "timestamp": "2022-04-01T10:00",
+                            "tvalue": "42",
+                            "note": "bench",
+                        },
+                    )
+                else:
+                    response = client.get("/")
+                failed = response.status_code >= 400
+                locked = False
+            except Exception as e:
+                failed = True
+                locked = "locked" in str(e)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                results[kind].append(elapsed)
+                if failed:
+                    errors[kind] += 1
+                if locked:
+                    errors["locked"] += 1
+
+    threads = [
+        threading.Thread(target=worker, args=("write", i)) for i in range(writers)
+    ] + [threading.Thread(target=worker, args=("read", i)) for i in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return {
+        "writes": common.summarize(results["write"]) if results["write"] else None,
+        "reads": common.summarize(results["read"]) if results["read"] else None,
+        "writes_per_sec": round(len(results["write"]) / seconds, 1),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--trackers", type=int, default=20)
+    parser.add_argument("--activities", type=int, default=2000)
+    parser.add_argument("--run", nargs=3, metavar=("DB", "USER_ID", "TRACKER_IDS"))
+    args = parser.parse_args()
+
+    if args.run:
+        dbPath, userId, trackerIds = args.run
+        result = run(
+            dbPath,
+            int(userId),
+            [int(t) for t in trackerIds.split(",")],
+            args.writers,
+            args.readers,
+            args.seconds,
+        )
+        print(json.dumps(result))
+        return
+
+    seedPath = common.tempDatabasePath("seed")
+    common.loadApp(seedPath)
+    from application.database import db
+    from application.models import Tracker
+
+    userId = common.seed(args.trackers, args.activities, types=(1,))
+    trackerIds = ",".join(
+        str(t) for (t,) in db.session.query(Tracker.id).filter_by(user_id=userId)
+    )
+    db.session.remove()
+
+    report = {}
+    for env in ("development", "production"):
+        dbPath = os.path.join(os.path.dirname(seedPath), env + ".sqlite3")
+        shutil.copy(seedPath, dbPath)
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", dbPath, str(userId), trackerIds]
+            + ["--writers", str(args.writers), "--readers", str(args.readers)]
+            + ["--seconds", str(args.seconds)],
+            env=dict(os.environ, ENV=env),
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        report[env] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Cost of deleting a big tracker, for the deleting user and everyone else.
+
+Every mode (TRACKER_DELETE_MODE immediate / background) runs in a fresh
+interpreter against its own throwaway SQLite file: one user gets a tracker
+with --activities logs, another user keeps POSTing logs to a tracker of
+their own from a second thread while the first one deletes it. Reported per
+mode: the latency of the delete request, how long until the logs were gone,
+and the latency of the other user's log writes while that happened (their
+max is how long they waited for the write lock).
+
+    python benchmarks/bench_delete.py --activities 500000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import common
+
+MODES = ("immediate", "background")
+
+
+def runMode(args):
+    """Measure the mode configured in the environment; prints JSON."""
+    app = common.loadApp(common.tempDatabasePath(), pushContext=False)
+    from application.database import db
+    from application.models import Activity, Tracker
+    from application.tracker_purge import trackerPurger
+
+    with app.app_context():
+        owner = common.seed(1, args.activities, types=(1,))
+        other = common.seed(1, 0, types=(1,), seedValue=43)
+        tid = db.session.query(Tracker.id).filter(Tracker.user_id == owner).scalar()
+        otherTid = (
+            db.session.query(Tracker.id).filter(Tracker.user_id == other).scalar()
+        )
+
+    stop = threading.Event()
+    samples = []
+
+    def writer():
+        client = app.test_client()
+        common.login(client, other)
+        i = 0
+        while not stop.is_set():
+            logged = datetime(2022, 1, 1) + timedelta(minutes=i)
+            started = time.perf_counter()
+            client.post(
+                "/tracker/%d/log" % otherTid,
+                data={
+                    "timestamp": logged.strftime("%Y-%m-%dT%H:%M"),
+                    "tvalue": "1",
+                    "note": "bench delete",
+                    "backurl": "/",
+                },
+            )
+            samples.append((time.perf_counter() - started) * 1000)
+            i += 1
+
+    client = app.test_client()
+    common.login(client, owner)
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    response = client.get("/tracker/%d/delete" % tid, headers={"Referer": "/"})
+    requestMs = (time.perf_counter() - started) * 1000
+    trackerPurger.shutdown()
+    purgedMs = (time.perf_counter() - started) * 1000
+    stop.set()
+    thread.join()
+
+    with app.app_context():
+        left = db.session.query(Activity).filter(Activity.tracker_id == tid).count()
+    print(
+        json.dumps(
+            {
+                "status": response.status_code,
+                "delete_request_ms": round(requestMs, 1),
+                "logs_gone_after_ms": round(purgedMs, 1),
+                "logs_left": left,
+                "other_user_writes": common.summarize(samples),
+                "other_user_max_ms": round(max(samples), 1),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--activities", type=int, default=200000)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        runMode(args)
+        return
+
+    report = {}
+    for mode in args.modes:
+        output = subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--child",
+                "--activities",
+                str(args.activities),
+            ],
+            env=dict(os.environ, TRACKER_DELETE_MODE=mode),
+            cwd=common.ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        report[mode] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
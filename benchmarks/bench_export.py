@@ -0,0 +1,78 @@
+"""/export time-to-first-byte, total time and peak RSS.
+
+The database is seeded first and the export is measured in a fresh process,
+so the reported peak RSS belongs to the export and not to the seeding.
+
+    python benchmarks/bench_export.py --trackers 10 --activities 100000
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import common
+
+
+def peakRssMb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(dbPath, userId, path):
+    app = common.loadApp(dbPath)
+    client = app.test_client()
+    common.login(client, userId)
+    client.get("/")  # warm up imports and the session
+
+    rssBefore = peakRssMb()
+    started = time.perf_counter()
+    response = client.get(path, buffered=False)
+    ttfb = None
+    size = 0
+    for chunk in response.response:
+        if ttfb is None:
+            ttfb = time.perf_counter() - started
+        size += len(chunk)
+    total = time.perf_counter() - started
+    response.close()
+    return {
+        "path": path,
+        "bytes": size,
+        "ttfb_ms": round(ttfb * 1000, 3),
+        "total_ms": round(total * 1000, 3),
+        "peak_rss_mb_before": round(rssBefore, 1),
+        "peak_rss_mb_after": round(peakRssMb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trackers", type=int, default=10)
+    parser.add_argument("--activities", type=int, default=100000)
+    parser.add_argument("--path", default="/export")
+    parser.add_argument("--measure", nargs=2, metavar=("DB", "USER_ID"))
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure[0], int(args.measure[1]), args.path)))
+        return
+
+    dbPath = common.tempDatabasePath()
+    common.loadApp(dbPath)
+    userId = common.seed(args.trackers, args.activities)
+    output = subprocess.run(
+        [sys.executable, __file__, "--path", args.path]
+        + ["--measure", dbPath, str(userId)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["activities"] = args.trackers * args.activities
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Size, export time and parse time of every /export format.
+
+python benchmarks/bench_export_formats.py --trackers 8 --activities 50000
+"""
+
+import argparse
+import csv
+import io
+import json
+import time
+
+import common
+
+
+def parseCsv(data):
+    return sum(1 for _ in csv.reader(io.StringIO(data.decode())))
+
+
+def parseNdjsonGz(data):
+    from application.export_formats import readNdjsonGz
+
+    return sum(1 for _ in readNdjsonGz(io.BytesIO(data)))
+
+
+def parseColumnar(data):
+    from application.export_formats import readColumnar
+
+    return len(readColumnar(io.BytesIO(data))["activities"]["id"])
+
+
+PARSERS = {"csv": parseCsv, "ndjson.gz": parseNdjsonGz, "columnar": parseColumnar}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trackers", type=int, default=8)
+    parser.add_argument("--activities", type=int, default=50000)
+    args = parser.parse_args()
+
+    app = common.loadApp(common.tempDatabasePath())
+    userId = common.seed(args.trackers, args.activities)
+    client = app.test_client()
+    common.login(client, userId)
+
+    results = {}
+    for fmt, parse in PARSERS.items():
+        started = time.perf_counter()
+        data = client.get("/export?format=" + fmt).data
+        exported = time.perf_counter() - started
+        started = time.perf_counter()
+        parse(data)
+        parsed = time.perf_counter() - started
+        results[fmt] = {
+            "bytes": len(data),
+            "export_ms": round(exported * 1000, 1),
+            "parse_ms": round(parsed * 1000, 1),
+        }
+
+    print(
+        json.dumps(
+            {"activities": args.trackers * args.activities, "formats": results},
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Home page (`/`) latency for N trackers x M activities.
+
+"before" replays the old per-tracker ORDER BY ... LIMIT 1 loop on a database
+without the (tracker_id, timestamp) index, "after" requests `/` on the
+migrated schema.
+
+    python benchmarks/bench_home.py --trackers 50 --activities 20000
+"""
+
+import argparse
+import json
+
+from sqlalchemy import text
+
+import common
+
+
+def legacyLastTimestamps(db, Tracker, Activity, userId):
+    trackers = db.session.query(Tracker).filter(Tracker.user_id == userId).all()
+    for t in trackers:
+        (
+            db.session.query(Activity)
+            .filter(Activity.tracker_id == t.id)
+            .order_by(Activity.timestamp.desc())
+            .first()
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trackers", type=int, default=50)
+    parser.add_argument("--activities", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = common.loadApp(common.tempDatabasePath())
+    from application.database import db
+    from application.models import Activity, Tracker
+
+    userId = common.seed(args.trackers, args.activities)
+    client = app.test_client()
+    common.login(client, userId)
+
+    db.session.execute(text("DROP INDEX ix_activity_tracker_id_timestamp"))
+    db.session.commit()
+    before = common.timeit(
+        lambda: legacyLastTimestamps(db, Tracker, Activity, userId), args.repeat
+    )
+
+    db.session.execute(
+        text(
+            "CREATE INDEX ix_activity_tracker_id_timestamp "
+            "ON activity (tracker_id, timestamp)"
+        )
+    )
+    db.session.commit()
+    after = common.timeit(lambda: client.get("/"), args.repeat)
+
+    print(
+        json.dumps(
+            {
+                "trackers": args.trackers,
+                "activities_per_tracker": args.activities,
+                "before_legacy_queries": before,
+                "after_home_request": after,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Sustained log writes per second, direct commits against the ingest queue.
+
+Every mode runs in a fresh interpreter (INGEST_MODE / INGEST_ACK are read
+when the app is created) against its own throwaway SQLite file: --threads
+clients POST /tracker/<tid>/log --requests times each, spread over
+--trackers trackers of one user. Reported per mode: writes/sec while the
+clients run, request latency, how long the writer needed to drain what was
+still queued afterwards, the rows found in the database, and the queue's
+batch size / commit latency histograms. rows_not_touched counts logs that
+skipped touchTracker (no revision stamp) and must be 0.
+
+    python benchmarks/bench_ingest.py --threads 8 --requests 200
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import common
+
+MODES = {
+    "direct": {"INGEST_MODE": "direct", "INGEST_ACK": "commit"},
+    "queue+commit": {"INGEST_MODE": "queue", "INGEST_ACK": "commit"},
+    "queue+enqueue": {"INGEST_MODE": "queue", "INGEST_ACK": "enqueue"},
+}
+
+
+def logForm(i):
+    logged = datetime(2022, 1, 1) + timedelta(seconds=i)
+    return {
+        "timestamp": logged.strftime("%Y-%m-%dT%H:%M"),
+        "tvalue": "72.5",
+        "note": "bench ingest",
+        "backurl": "/",
+    }
+
+
+def runMode(args):
+    """Measure the mode configured in the environment; prints JSON."""
+    app = common.loadApp(common.tempDatabasePath(), pushContext=False)
+    from application.database import db
+    from application.ingest_queue import ingestQueue
+    from application.models import Activity, Tracker
+
+    with app.app_context():
+        userId = common.seed(args.trackers, 0, types=(1,))
+        trackerIds = [
+            tid
+            for tid, in db.session.query(Tracker.id).filter(Tracker.user_id == userId)
+        ]
+
+    samples = [[] for _ in range(args.threads)]
+    errors = []
+
+    def client(n):
+        c = app.test_client()
+        common.login(c, userId)
+        for i in range(args.requests):
+            tid = trackerIds[(n + i) % len(trackerIds)]
+            started = time.perf_counter()
+            response = c.post(
+                "/tracker/%d/log" % tid, data=logForm(n * args.requests + i)
+            )
+            samples[n].append((time.perf_counter() - started) * 1000)
+            if response.status_code != 302:
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    drainStarted = time.perf_counter()
+    ingestQueue.shutdown()
+    drained = time.perf_counter() - drainStarted
+
+    with app.app_context():
+        rows = db.session.query(Activity.id).count()
+        # touchTracker stamps every row it covered with a revision
+        unstamped = (
+            db.session.query(Activity.id).filter(Activity.revision.is_(None)).count()
+        )
+    writes = args.threads * args.requests
+    print(
+        json.dumps(
+            {
+                "writes": writes,
+                "failed_requests": len(errors),
+                "rows_in_db": rows,
+                "rows_not_touched": unstamped,
+                "writes_per_sec": round(writes / elapsed, 1),
+                "durable_writes_per_sec": round(rows / (elapsed + drained), 1),
+                "drain_ms": round(drained * 1000, 1),
+                "latency": common.summarize([s for per in samples for s in per]),
+                "queue": ingestQueue.stats(),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--trackers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        runMode(args)
+        return
+
+    report = {}
+    for mode in args.modes:
+        env = dict(os.environ, **MODES[mode])
+        output = subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--child",
+                "--threads",
+                str(args.threads),
+                "--requests",
+                str(args.requests),
+                "--trackers",
+                str(args.trackers),
+            ],
+            env=env,
+            cwd=common.ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        report[mode] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Latency of a light request while charts render, per render backend.
+
+Chart threads keep requesting uncached charts while one thread measures
+`/api/v1/trackers`. With the "thread" backend the renders hold this
+process's GIL; with "process" they run in the worker processes. Each
+backend runs in its own process against a copy of the same database.
+
+    python benchmarks/bench_render_backends.py --chart-threads 8 --seconds 20
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import common
+
+
+def run(dbPath, userId, trackerIds, chartThreads, seconds):
+    app = common.loadApp(dbPath)
+    from application.chart_cache import chartCache
+    from application.chart_renderer import chartRenderer
+
+    stop = time.perf_counter() + seconds
+    light = []
+    charts = {"ok": 0, "busy": 0}
+    lock = threading.Lock()
+
+    def chartWorker(index):
+        client = app.test_client()
+        common.login(client, userId)
+        tid = trackerIds[index % len(trackerIds)]
+        while time.perf_counter() < stop:
+            chartCache.clear()
+            status = client.get("/tracker/%d/chart.png" % tid).status_code
+            with lock:
+                charts["ok" if status == 200 else "busy"] += 1
+
+    def lightWorker():
+        client = app.test_client()
+        common.login(client, userId)
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            client.get("/api/v1/trackers")
+            light.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=lightWorker)] + [
+        threading.Thread(target=chartWorker, args=(i,)) for i in range(chartThreads)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = chartRenderer.stats()
+    chartRenderer.shutdown()
+    return {
+        "light_request": common.summarize(light),
+        "charts_per_sec": round(charts["ok"] / seconds, 1),
+        "charts_rejected": charts["busy"],
+        "render_latency_ms": stats["latency_ms"],
+        "queue_depth": stats["queue_depth"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chart-threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--activities", type=int, default=20000)
+    parser.add_argument("--run", nargs=3, metavar=("DB", "USER_ID", "TRACKER_IDS"))
+    args = parser.parse_args()
+
+    if args.run:
+        dbPath, userId, trackerIds = args.run
+        result = run(
+            dbPath,
+            int(userId),
+            [int(t) for t in trackerIds.split(",")],
+            args.chart_threads,
+            args.seconds,
+        )
+        print(json.dumps(result))
+        return
+
+    seedPath = common.tempDatabasePath("seed")
+    common.loadApp(seedPath)
+    from application.database import db
+    from application.models import Tracker
+
+    userId = common.seed(4, args.activities)
+    trackerIds = ",".join(
+        str(t) for (t,) in db.session.query(Tracker.id).filter_by(user_id=userId)
+    )
+    db.session.remove()
+
+    report = {}
+    for backend in ("thread", "process"):
+        dbPath = os.path.join(os.path.dirname(seedPath), backend + ".sqlite3")
+        shutil.copy(seedPath, dbPath)
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", dbPath, str(userId), trackerIds]
+            + ["--chart-threads", str(args.chart_threads)]
+            + ["--seconds", str(args.seconds)],
+            env=dict(os.environ, CHART_RENDER_BACKEND=backend),
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        report[backend] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Bytes on the wire and render time of the main pages, before and after the
+response compression and the fragment cache.
+
+Seeds one user with --trackers trackers of --activities logs each and
+requests the home page, a tracker overview (first and a deeper page), the
+CSV export, a note search and the static CSS/JS through the test client:
+
+  - bytes: the body as sent without and with "Accept-Encoding: gzip"
+  - "before": fragment cache and compression off (the app as it was)
+  - "cold": fragment cache emptied before every request
+  - "warm": fragment cache filled by an earlier request
+  - "warm_gzip": warm, and the body gzipped as a browser would get it
+
+Static files are also checked for their content-hashed URL and its
+"immutable" Cache-Control.
+
+    python benchmarks/bench_responses.py --trackers 20 --activities 5000
+"""
+
+import argparse
+import json
+import re
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--trackers", type=int, default=20)
+    parser.add_argument("--activities", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = common.loadApp(common.tempDatabasePath())
+    from application.database import db
+    from application.fragment_cache import fragmentCache
+    from application.models import Tracker
+
+    userId = common.seed(args.trackers, args.activities, types=(1, 2, 3, 4))
+    tid = db.session.query(Tracker.id).filter(Tracker.user_id == userId).first()[0]
+    client = app.test_client()
+    common.login(client, userId)
+
+    overview = client.get("/tracker/%d/overview" % tid).get_data(as_text=True)
+    nextPage = re.search(r'href="([^"]*cursor=[^"]*)"', overview).group(1)
+    routes = {
+        "home": "/",
+        "overview": "/tracker/%d/overview" % tid,
+        "overview, page 2": nextPage.replace("&amp;", "&"),
+        "export csv": "/export",
+        "search json": "/search.json?q=note",
+    }
+
+    def configure(cache, compression):
+        app.config["FRAGMENT_CACHE"] = cache
+        app.config["RESPONSE_COMPRESSION"] = compression
+
+    def fetch(path, encoding=None):
+        headers = {"Accept-Encoding": encoding} if encoding else {}
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, (path, response.status_code)
+        return response, len(response.get_data())
+
+    def coldFetch(path):
+        fragmentCache.clear()
+        fetch(path)
+
+    report = {"trackers": args.trackers, "activities": args.activities}
+    pages = {}
+    for name, path in routes.items():
+        result = {}
+        configure(False, False)
+        result["bytes"] = fetch(path)[1]
+        result["before"] = common.timeit(lambda: fetch(path), args.repeat)
+        configure(True, True)
+        gzipped, result["bytes_gzip"] = fetch(path, "gzip")
+        result["content_encoding"] = gzipped.headers.get("Content-Encoding")
+        result["ratio"] = round(result["bytes"] / max(result["bytes_gzip"], 1), 1)
+        result["cold"] = common.timeit(lambda: coldFetch(path), args.repeat)
+        fetch(path)
+        result["warm"] = common.timeit(lambda: fetch(path), args.repeat)
+        result["warm_gzip"] = common.timeit(lambda: fetch(path, "gzip"), args.repeat)
+        result["speedup_p50"] = round(
+            result["before"]["p50_ms"] / max(result["warm"]["p50_ms"], 1e-3), 1
+        )
+        pages[name] = result
+    report["pages"] = pages
+
+    static = {}
+    home = client.get("/").get_data(as_text=True)
+    for url in re.findall(r'(?:href|src)="(/static/[^"]+)"', home):
+        plain, size = fetch(url.split("?")[0])
+        versioned, _ = fetch(url)
+        _, sizeGzip = fetch(url, "gzip")
+        static[url] = {
+            "bytes": size,
+            "bytes_gzip": sizeGzip,
+            "cache_control": versioned.headers.get("Cache-Control"),
+            "cache_control_unversioned": plain.headers.get("Cache-Control"),
+        }
+    report["static"] = static
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
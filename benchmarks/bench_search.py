@@ -0,0 +1,129 @@
+"""Note search: the FTS5 index against a LIKE '%term%' scan.
+
+Seeds one user with --activities logs spread over --trackers trackers, each
+with a note of a few words drawn from a Zipf-like vocabulary (so there are
+common and rare words), then times the first result page of
+searchActivities() for a common, a mid and a rare word, a prefix, two words
+and a search scoped to one tracker and a year, three ways: the FTS5 index
+ranking every match by BM25, the index as /search uses it (newest first
+past SEARCH_RANK_LIMIT matches) and the LIKE fallback. Hits are counted
+once per query; LIKE finds more, as it also matches inside longer words.
+
+    python benchmarks/bench_search.py --activities 1000000
+"""
+
+import argparse
+import itertools
+import json
+import random
+import time
+from datetime import datetime
+
+import common
+
+VOCABULARY = 20000
+WORDS_PER_NOTE = (3, 12)
+
+
+def makeVocabulary(rnd):
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "do"]
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rnd.choice(syllables) for _ in range(rnd.randint(2, 5))))
+    words = sorted(words)
+    rnd.shuffle(words)
+    return words
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--activities", type=int, default=1000000)
+    parser.add_argument("--trackers", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = common.loadApp(common.tempDatabasePath())
+    from application.database import db
+    from application.models import Tracker
+    from application.search import rebuildSearchIndex, searchActivities
+
+    rnd = random.Random(7)
+    words = makeVocabulary(rnd)
+    # Zipf: the word of rank r is picked with a weight of 1 / r
+    weights = list(
+        itertools.accumulate(1.0 / rank for rank in range(1, VOCABULARY + 1))
+    )
+
+    def note(rnd, j):
+        return " ".join(
+            rnd.choices(words, cum_weights=weights, k=rnd.randint(*WORDS_PER_NOTE))
+        )
+
+    started = time.perf_counter()
+    userId = common.seed(
+        args.trackers,
+        args.activities // args.trackers,
+        types=(1,),
+        notes=note,
+    )
+    seedSeconds = time.perf_counter() - started
+    tid = db.session.query(Tracker.id).filter(Tracker.user_id == userId).first()[0]
+
+    started = time.perf_counter()
+    rebuildSearchIndex()
+    db.session.commit()
+    rebuildSeconds = time.perf_counter() - started
+
+    cases = {
+        "common word": {"terms": words[0]},
+        "mid word": {"terms": words[200]},
+        "rare word": {"terms": words[VOCABULARY - 1]},
+        "prefix": {"terms": words[50][:4] + "*"},
+        "two words": {"terms": "%s %s" % (words[3], words[40])},
+        "mid word, tracker + year": {
+            "terms": words[200],
+            "trackerId": tid,
+            "start": datetime(2020, 1, 1),
+            "end": datetime(2021, 1, 1),
+        },
+    }
+    rankLimit = app.config["SEARCH_RANK_LIMIT"]
+    report = {
+        "activities": args.activities,
+        "rank_limit": rankLimit,
+        "seed_s": round(seedSeconds, 1),
+        "index_rebuild_s": round(rebuildSeconds, 1),
+        "cases": {},
+    }
+    variants = {
+        # BM25 over every match, whatever their number
+        "fts_ranked": {"fts": True},
+        # What /search does: newest first past SEARCH_RANK_LIMIT matches
+        "fts": {"fts": True, "rankLimit": rankLimit},
+        "like": {"fts": False},
+    }
+    for name, query in cases.items():
+        result = {"terms": query["terms"]}
+        for label, variant in variants.items():
+            page = searchActivities(userId, **variant, **query)
+            result[label] = common.timeit(
+                lambda: searchActivities(userId, **variant, **query), args.repeat
+            )
+            result[label]["order"] = page.order
+        for label in ("fts", "like"):
+            # Every match, to compare what the two find
+            everything = searchActivities(
+                userId, pageSize=args.activities, **variants[label], **query
+            )
+            result[label + "_hits"] = len(everything.hits)
+        result["speedup_p50"] = round(
+            result["like"]["p50_ms"] / max(result["fts"]["p50_ms"], 1e-3), 1
+        )
+        report["cases"][name] = result
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
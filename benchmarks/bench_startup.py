@@ -0,0 +1,114 @@
+"""Startup cost: import time of main.py and time to the first response.
+
+Every sample is a fresh interpreter. "import_ms" is `import main` (which
+builds the app), "first_response_ms" adds the first GET / of a logged in
+user, and "process_ms" is the whole child process as seen from outside.
+The -X importtime breakdown lists the slowest packages imported by main.py
+and whether NumPy / matplotlib were loaded before the first chart.
+
+    python benchmarks/bench_startup.py --repeat 10 --top 15
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import common
+
+WATCHED_MODULES = ("numpy", "matplotlib", "flask_security", "sqlalchemy")
+
+
+def run(dbPath, userId):
+    started = time.perf_counter()
+    app = common.loadApp(dbPath)
+    imported = time.perf_counter()
+    client = app.test_client()
+    common.login(client, userId)
+    status = client.get("/").status_code
+    responded = time.perf_counter()
+    return {
+        "import_ms": (imported - started) * 1000,
+        "first_response_ms": (responded - started) * 1000,
+        "status": status,
+        "loaded": {name: name in sys.modules for name in WATCHED_MODULES},
+    }
+
+
+def importTimes(env, top):
+    """Top packages by cumulative import time, from python -X importtime."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=common.ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        selfUs, cumulativeUs, name = (
+            field.strip() for field in line[len("import time:") :].split("|")
+        )
+        if not cumulativeUs.isdigit():
+            continue  # the header line
+        package = name.split(".")[0]
+        # Nested imports are listed before their parent, so the largest
+        # cumulative value of a package is its own top level import
+        packages[package] = max(packages.get(package, 0), int(cumulativeUs))
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return [
+        {"module": name, "cumulative_ms": round(us / 1000, 1)}
+        for name, us in ranked[:top]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--run", nargs=2, metavar=("DB", "USER_ID"))
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run(args.run[0], int(args.run[1]))))
+        return
+
+    dbPath = common.tempDatabasePath()
+    common.loadApp(dbPath)
+    userId = common.seed(4, 100)
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + dbPath)
+
+    samples = []
+    processMs = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", dbPath, str(userId)],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        processMs.append((time.perf_counter() - started) * 1000)
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    report = {
+        "import_ms": common.summarize([s["import_ms"] for s in samples]),
+        "first_response_ms": common.summarize(
+            [s["first_response_ms"] for s in samples]
+        ),
+        "process_ms": common.summarize(processMs),
+        "first_response_status": samples[-1]["status"],
+        "loaded_after_first_response": samples[-1]["loaded"],
+        "importtime_top": importTimes(env, args.top),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Route and function benchmarks with JSON output comparable between commits.
+
+Seeds --users users with --trackers trackers each (cycling through the four
+tracker types) and --activities logs per tracker into a throwaway SQLite
+file, then measures through the Flask test client:
+
+    GET /                           GET /tracker/<tid>/overview (per type)
+    POST /tracker/<tid>/log         GET and POST /activity/<aid>/update
+    GET /export                      GET /analytics.json
+
+Each route reports throughput, latency (mean/p50/p99), SQL statements per
+request and the peak Python memory of one request (tracemalloc, measured on
+a separate run so it does not slow the timed ones). The micro benchmarks
+time convertToNaturalday, the local time conversion of export columns, the
+chart pipeline (series preparation and rendering) per tracker type and the
+cross tracker analytics.
+
+    python benchmarks/bench_suite.py --activities 5000 --output before.json
+    python benchmarks/bench_suite.py --activities 5000 --output after.json
+    python benchmarks/bench_suite.py --compare before.json after.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import common
+
+TYPE_NAMES = {1: "numeric", 2: "multi", 3: "duration", 4: "bool"}
+
+# Tracker type -> form of a valid log POST / activity update
+LOG_FORMS = {
+    1: {"tvalue": "72.5"},
+    2: {"tvalue": ["Good", "Tired"]},
+    3: {"tvalue": ["1", "15", "0"]},
+    4: {"tvalue": "1"},
+}
+
+
+def logForm(trackerType, i):
+    logged = datetime(2022, 1, 1) + timedelta(minutes=i)
+    form = dict(LOG_FORMS[trackerType])
+    form.update(
+        timestamp=logged.strftime("%Y-%m-%dT%H:%M"),
+        note="bench suite",
+        backurl="/",
+    )
+    return form
+
+
+def measureRoute(client, statements, request, repeat):
+    """request(i) sends the i-th request and returns the response."""
+    samples = []
+    counts = []
+    for i in range(repeat):
+        statements.clear()
+        started = time.perf_counter()
+        response = request(i)
+        response.get_data()
+        samples.append((time.perf_counter() - started) * 1000)
+        counts.append(len(statements))
+        if response.status_code >= 400:
+            raise RuntimeError("Benchmark request failed: %s" % response.status)
+
+    tracemalloc.start()
+    request(repeat).get_data()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = common.summarize(samples)
+    result["requests_per_sec"] = round(1000 / result["mean_ms"], 1)
+    result["sql_statements"] = round(sum(counts) / len(counts), 1)
+    result["peak_alloc_kb"] = round(peak / 1024, 1)
+    return result
+
+
+def runRoutes(app, userId, trackers, activityIds, repeat):
+    from application.database import db
+
+    with app.app_context():
+        statements = common.recordStatements(db.engine)
+    client = app.test_client()
+    common.login(client, userId)
+    client.get("/")  # warm up templates and the session
+
+    routes = {
+        "GET /": measureRoute(client, statements, lambda i: client.get("/"), repeat)
+    }
+    for tid, trackerType in trackers:
+        name = TYPE_NAMES[trackerType]
+        aid = activityIds[tid]
+        routes["GET /tracker/<tid>/overview [%s]" % name] = measureRoute(
+            client,
+            statements,
+            lambda i: client.get("/tracker/%d/overview" % tid),
+            repeat,
+        )
+        routes["POST /tracker/<tid>/log [%s]" % name] = measureRoute(
+            client,
+            statements,
+            lambda i: client.post(
+                "/tracker/%d/log" % tid, data=logForm(trackerType, i)
+            ),
+            repeat,
+        )
+        routes["GET /activity/<aid>/update [%s]" % name] = measureRoute(
+            client,
+            statements,
+            lambda i: client.get("/activity/%d/update" % aid, headers={"Referer": "/"}),
+            repeat,
+        )
+        routes["POST /activity/<aid>/update [%s]" % name] = measureRoute(
+            client,
+            statements,
+            lambda i: client.post(
+                "/activity/%d/update" % aid, data=logForm(trackerType, i)
+            ),
+            repeat,
+        )
+    routes["GET /analytics.json"] = measureRoute(
+        client, statements, lambda i: client.get("/analytics.json?range=all"), repeat
+    )
+    routes["GET /export"] = measureRoute(
+        client, statements, lambda i: client.get("/export"), max(repeat // 10, 3)
+    )
+    return routes
+
+
+def runMicro(app, trackers, repeat):
+    from application.analytics import getAnalytics
+    from application.chart_renderer import (
+        drawPie,
+        drawShareBars,
+        drawTrend,
+        renderFigure,
+    )
+    from application.controllers.chart_controllers import getChartSeries
+    from application.controllers.tracker_controllers import convertToNaturalday
+    from application.models import Tracker
+    from application.timezones import getTimezone, localIsoStrings
+    import numpy as np
+
+    config = app.config
+    now = datetime.now()
+    dates = [now - timedelta(days=d) for d in (0, 1, 7, 45, 400, 2000)]
+    micro = {
+        "convertToNaturalday": common.timeit(
+            lambda: [convertToNaturalday(d) for d in dates], repeat * 10
+        )
+    }
+    # Half-hourly timestamps over ~5.7 years, across a dozen DST changes
+    stamps = np.datetime64("2018-01-01T00:00:00") + np.arange(100000) * 1800
+    paris = getTimezone("Europe/Paris")
+    micro["localIsoStrings [100k]"] = common.timeit(
+        lambda: localIsoStrings(stamps, paris), repeat
+    )
+    draws = {"trend": drawTrend, "pie": drawPie, "bar": drawShareBars}
+    with app.app_context():
+        userTrackers = (
+            Tracker.query.with_entities(
+                Tracker.id, Tracker.name, Tracker.type, Tracker.settings
+            )
+            .filter(Tracker.id.in_([tid for tid, _ in trackers]))
+            .all()
+        )
+        micro["getAnalytics [day]"] = common.timeit(
+            lambda: getAnalytics(userTrackers, "day"), repeat
+        )
+        for tid, trackerType in trackers:
+            name = TYPE_NAMES[trackerType]
+            tracker = Tracker.query.get(tid)
+            micro["getChartSeries [%s]" % name] = common.timeit(
+                lambda: getChartSeries(tracker), repeat
+            )
+            kind, series, ylabel = getChartSeries(tracker)
+            args = (series, ylabel) if kind == "trend" else (series,)
+            micro["renderChart [%s]" % name] = common.timeit(
+                lambda: renderFigure(
+                    draws[kind],
+                    args,
+                    "png",
+                    config["CHART_DPI"],
+                    config["CHART_FIGSIZE"],
+                ),
+                max(repeat // 5, 3),
+            )
+    return micro
+
+
+def gitCommit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=common.ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(basePath, headPath):
+    """Print p50 latency and SQL count changes of head against base."""
+    with open(basePath) as f:
+        base = json.load(f)
+    with open(headPath) as f:
+        head = json.load(f)
+    print("%-48s %10s %10s %8s %12s" % ("", "base p50", "head p50", "ratio", "sql"))
+    for section in ("routes", "micro"):
+        for name, result in head[section].items():
+            before = base[section].get(name)
+            if before is None:
+                continue
+            ratio = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 0
+            sql = ""
+            if "sql_statements" in result:
+                sql = "%s -> %s" % (before["sql_statements"], result["sql_statements"])
+            print(
+                "%-48s %10.3f %10.3f %7.2fx %12s"
+                % (name[:48], before["p50_ms"], result["p50_ms"], ratio, sql)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--trackers", type=int, default=4)
+    parser.add_argument("--activities", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="Write the JSON report here too.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    app = common.loadApp(common.tempDatabasePath(), pushContext=False)
+    from application.database import db
+    from application.models import Activity, Tracker
+
+    with app.app_context():
+        started = time.perf_counter()
+        userIds = [
+            common.seed(args.trackers, args.activities, seedValue=42 + i)
+            for i in range(args.users)
+        ]
+        seedSeconds = time.perf_counter() - started
+        # The first user's first tracker of every type, and one of its logs
+        trackers = {}
+        for tid, trackerType in (
+            db.session.query(Tracker.id, Tracker.type)
+            .filter(Tracker.user_id == userIds[0])
+            .order_by(Tracker.id)
+        ):
+            trackers.setdefault(trackerType, tid)
+        trackers = sorted((tid, t) for t, tid in trackers.items())
+        activityIds = {
+            tid: db.session.query(Activity.id)
+            .filter(Activity.tracker_id == tid)
+            .order_by(Activity.id)
+            .limit(1)
+            .scalar()
+            for tid, _ in trackers
+        }
+
+    report = {
+        "meta": {
+            "commit": gitCommit(),
+            "python": platform.python_version(),
+            "users": args.users,
+            "trackers_per_user": args.trackers,
+            "activities_per_tracker": args.activities,
+            "repeat": args.repeat,
+            "seed_seconds": round(seedSeconds, 2),
+            "created_at": datetime.utcnow().isoformat() + "Z",
+        },
+        "routes": runRoutes(app, userIds[0], trackers, activityIds, args.repeat),
+        "micro": runMicro(app, trackers, args.repeat),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
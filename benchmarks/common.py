@@ -0,0 +1,163 @@
+"""Shared helpers for the benchmark scripts.
+
+The scripts import the real application against a throwaway SQLite file so
+they never touch db_directory/trackerqunatified.sqlite3.
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Tracker type -> generator for the string stored in activity.value
+VALUE_FACTORIES = {
+    1: lambda rnd: str(round(rnd.uniform(40, 120), 1)),
+    2: lambda rnd: ",".join(rnd.sample(["Good", "Bad", "Tired", "Sleepy"], 2)),
+    3: lambda rnd: ",".join(str(rnd.randint(0, n)) for n in (3, 59, 59)),
+    4: lambda rnd: rnd.choice(["0", "1"]),
+}
+
+
+def tempDatabasePath(name="benchmark"):
+    directory = tempfile.mkdtemp(prefix="tracker-bench-")
+    return os.path.join(directory, name + ".sqlite3")
+
+
+def loadApp(dbPath, pushContext=True):
+    """Import main.py with the database pointed at dbPath.
+
+    The scripts seed and query the database outside any request, so an app
+    context is pushed for them here (the app itself never pushes one). Pass
+    pushContext=False to give every request its own context, and flask.g.
+    """
+    for name in ("APPDEVSECRET", "APPSECRET"):
+        os.environ.setdefault(name, "benchmark-secret")
+    for name in ("APPDEVHASHSALT", "APPHASHSALT"):
+        os.environ.setdefault(name, "benchmark-salt")
+    os.environ["DATABASE_URL"] = "sqlite:///" + dbPath
+    import main
+
+    if pushContext:
+        main.app.app_context().push()
+        # Requests reuse the pushed context, and so its flask.g; start every
+        # request with an empty g like a deployed app does
+        main.app.before_request(clearRequestGlobals)
+    return main.app
+
+
+def clearRequestGlobals():
+    from flask import g
+
+    for name in list(g):
+        g.pop(name)
+
+
+def seed(trackers, activities, types=(1, 2, 3, 4), seedValue=42, notes=None):
+    """Create one user with `trackers` trackers of `activities` logs each.
+
+    notes(rnd, j) makes the note of the j-th log of a tracker (default
+    "note <j>").
+
+    Returns the user id. Rows go in through Core executemany so seeding a few
+    million activities stays in the seconds range.
+    """
+    from application import migrations
+    from application.database import db
+    from application.models import Activity, Tracker, User
+
+    rnd = random.Random(seedValue)
+    user = User(
+        username="bench",
+        email="bench%d@example.com" % rnd.randint(0, 10**9),
+        password="x",
+        active=True,
+    )
+    db.session.add(user)
+    db.session.commit()
+
+    start = datetime(2018, 1, 1)
+    for i in range(trackers):
+        ttype = types[i % len(types)]
+        tracker = Tracker(
+            name="Tracker %d" % i,
+            description="benchmark tracker",
+            type=ttype,
+            settings="Good,Bad,Tired,Sleepy" if ttype == 2 else "",
+            user_id=user.id,
+        )
+        db.session.add(tracker)
+        db.session.flush()
+        factory = VALUE_FACTORIES[ttype]
+        batch = []
+        for j in range(activities):
+            batch.append(
+                {
+                    "timestamp": start
+                    + timedelta(hours=6 * j, minutes=rnd.randint(0, 59)),
+                    "value": factory(rnd),
+                    "note": notes(rnd, j) if notes else "note %d" % j,
+                    "tracker_id": tracker.id,
+                }
+            )
+            if len(batch) == 10000:
+                db.session.execute(Activity.__table__.insert(), batch)
+                batch = []
+        if batch:
+            db.session.execute(Activity.__table__.insert(), batch)
+    db.session.commit()
+    # Migration steps are idempotent; re-running them backfills every
+    # denormalized column from the freshly inserted rows.
+    for step in migrations.MIGRATIONS:
+        step()
+    db.session.commit()
+    return user.id
+
+
+def login(client, userId):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(userId)
+        session["_fresh"] = True
+
+
+def recordStatements(engine):
+    """List that every SQL statement the calling thread sends through engine
+    is appended to. Background threads (ingest writer, tracker purge) are
+    left out, so the counts are those of the test client's requests."""
+    from sqlalchemy import event
+
+    statements = []
+    thread = threading.get_ident()
+
+    def record(conn, cursor, statement, *args):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    return statements
+
+
+def timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.mean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+    }
@@ -0,0 +1,131 @@
+"""SQL statements per web UI route, checked against a budget.
+
+Every route loads its tracker / log once per request through
+application/loaders.py, joined with the owner check. This script counts the
+statements each request sends (Flask-Security's user lookup included) and
+exits with status 1 when a route goes over its budget, when another user's
+tracker or log is reachable, or when the deleted tracker was not purged.
+
+    python benchmarks/query_counts.py
+"""
+
+import argparse
+import json
+import sys
+
+import common
+
+# (method, path template, form, max statements per request). Every request
+# starts with the user and role lookups. The writes include the rollup
+# refresh: 4 statements for this numeric tracker (compute the days, read the
+# other days of the weeks/months, delete, insert), 3 more with option counts.
+BUDGETS = [
+    # Cold fragment cache: the log counts of the trackers; 3 once rows are cached
+    ("GET", "/", None, 4),
+    ("GET", "/tracker/{tid}/overview", None, 4),
+    ("GET", "/tracker/{tid}/log", None, 3),
+    ("POST", "/tracker/{tid}/log", "log", 11),
+    ("GET", "/tracker/{tid}/update", None, 3),
+    ("POST", "/tracker/{tid}/update", "tracker", 7),
+    ("GET", "/tracker/{tid}/chart.png", None, 5),
+    ("GET", "/tracker/{tid}/series.json", None, 5),
+    ("GET", "/activity/{aid}/update", None, 3),
+    ("POST", "/activity/{aid}/update", "log", 11),
+    ("GET", "/activity/{aid}/delete", None, 13),
+    # Only marks the tracker deleted; the purge thread removes its logs
+    ("GET", "/tracker/{tid}/delete", None, 4),
+]
+
+FORMS = {
+    "log": {
+        "timestamp": "2022-04-01T10:00",
+        "tvalue": "80",
+        "note": "query count",
+        "backurl": "/",
+    },
+    "tracker": {"name": "Weight", "desc": "query count"},
+}
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__).parse_args()
+
+    # No global app context: each request gets its own, and its own flask.g
+    app = common.loadApp(common.tempDatabasePath(), pushContext=False)
+    from application.database import db
+    from application.models import Activity, Tracker
+
+    with app.app_context():
+        owner = common.seed(1, 50, types=(1,))
+        other = common.seed(1, 50, types=(1,), seedValue=43)
+        tid, aid = (
+            db.session.query(Tracker.id, Activity.id)
+            .join(Activity, Activity.tracker_id == Tracker.id)
+            .filter(Tracker.user_id == owner)
+            .first()
+        )
+        otherTid, otherAid = (
+            db.session.query(Tracker.id, Activity.id)
+            .join(Activity, Activity.tracker_id == Tracker.id)
+            .filter(Tracker.user_id == other)
+            .first()
+        )
+        engine = db.engine
+
+    statements = common.recordStatements(engine)
+    client = app.test_client()
+    common.login(client, owner)
+
+    def count(method, path, form=None):
+        statements.clear()
+        response = client.open(path, method=method, data=form, headers={"Referer": "/"})
+        return response.status_code, len(statements)
+
+    report = {"routes": {}, "ownership": {}}
+    failed = False
+    for method, template, form, budget in BUDGETS:
+        path = template.format(tid=tid, aid=aid)
+        status, used = count(method, path, FORMS.get(form))
+        ok = status < 400 and used <= budget
+        failed = failed or not ok
+        report["routes"]["%s %s" % (method, template)] = {
+            "status": status,
+            "statements": used,
+            "budget": budget,
+            "ok": ok,
+        }
+
+    for method, path in [
+        ("GET", "/tracker/%d/overview" % otherTid),
+        ("GET", "/tracker/%d/chart.png" % otherTid),
+        ("GET", "/tracker/%d/delete" % otherTid),
+        ("POST", "/tracker/%d/log" % otherTid),
+        ("GET", "/activity/%d/update" % otherAid),
+        ("GET", "/activity/%d/delete" % otherAid),
+    ]:
+        status, used = count(method, path, FORMS["log"])
+        failed = failed or status != 404
+        report["ownership"]["%s %s" % (method, path)] = {
+            "status": status,
+            "statements": used,
+        }
+    from application.tracker_purge import trackerPurger
+
+    trackerPurger.shutdown()
+    with app.app_context():
+        stillThere = db.session.get(Tracker, otherTid) is not None
+        purged = (
+            db.session.get(Tracker, tid) is None
+            and db.session.query(Activity).filter(Activity.tracker_id == tid).count()
+            == 0
+        )
+    failed = failed or not stillThere or not purged
+    report["ownership"]["other user's tracker kept"] = stillThere
+    report["deleted tracker purged"] = purged
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Render many charts from many threads and check that RSS stays flat.
+
+Every render goes through the application's ChartRenderer pool with a mix
+of trend, pie and bar charts. RSS is sampled as renders complete; the
+script exits with status 1 when it grew by more than --max-growth-mb after
+the warm-up renders.
+
+    python benchmarks/soak_charts.py --renders 10000 --threads 16
+"""
+
+import argparse
+import json
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+
+import common  # noqa: F401  (puts the repository on sys.path)
+from application.chart_data import ShareSeries, TrendSeries, yTicks
+from application.chart_renderer import (
+    ChartRenderer,
+    drawPie,
+    drawShareBars,
+    drawTrend,
+)
+
+
+def rssMb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 1024 / 1024
+    except OSError:
+        # No procfs: fall back to the peak, which still catches a leak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def sampleCharts(points):
+    rnd = np.random.default_rng(42)
+    x = np.datetime64("2022-01-01", "s") + np.arange(points) * np.timedelta64(1, "D")
+    y = rnd.uniform(40, 120, points)
+    low, high = y - rnd.uniform(0, 10, points), y + rnd.uniform(0, 10, points)
+    trend = TrendSeries("day", x, y, low, high, yTicks(low, high))
+    options = ShareSeries(["Good", "Bad", "Tired", "Sleepy"], np.full(4, 0.25))
+    yesNo = ShareSeries(["Yes", "No"], np.array([0.7, 0.3]))
+    return [
+        (drawTrend, (trend, "Values")),
+        (drawPie, (options,)),
+        (drawShareBars, (yesNo,)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--renders", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--points", type=int, default=400)
+    parser.add_argument("--format", default="png")
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--max-growth-mb", type=float, default=20)
+    args = parser.parse_args()
+
+    renderer = ChartRenderer(workers=args.workers)
+    charts = sampleCharts(args.points)
+    counter = iter(range(args.renders))
+    lock = threading.Lock()
+    samples = []
+    errors = []
+
+    def worker():
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            draw, drawArgs = charts[n % len(charts)]
+            try:
+                renderer.render(draw, drawArgs, args.format)
+            except Exception as e:
+                errors.append(repr(e))
+            if n % 250 == 0:
+                with lock:
+                    samples.append((n, rssMb()))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    renderer.shutdown()
+
+    samples.sort()
+    steady = [rss for n, rss in samples if n >= args.warmup]
+    growth = steady[-1] - steady[0] if len(steady) > 1 else 0.0
+    report = {
+        "renders": args.renders,
+        "threads": args.threads,
+        "workers": args.workers,
+        "renders_per_sec": round(args.renders / elapsed, 1),
+        "errors": len(errors),
+        "rss_mb_after_warmup": round(steady[0], 1) if steady else None,
+        "rss_mb_end": round(steady[-1], 1) if steady else None,
+        "rss_growth_mb": round(growth, 1),
+    }
+    print(json.dumps(report, indent=2))
+    if errors or growth > args.max_growth_mb:
+        print("FAIL: RSS grew or renders failed", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
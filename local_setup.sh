@@ -9,7 +9,7 @@ then
     echo ".env folder exists. Installing using pip"
 else
     echo "creating .env and install using pip"
-    python3.7 -m venv .env
+    python3.9 -m venv .env
 fi
 
 # Activate virtual env
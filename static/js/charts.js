@@ -0,0 +1,177 @@
+// Draws the tracker overview chart from /tracker/<id>/series.json on a
+// canvas (CHART_MODE = "client"). If the series cannot be fetched or drawn,
+// the server rendered image at data-fallback-src is shown instead.
+
+const CHART_COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
+    "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"];
+const CHART_TITLES = { day: "daily", week: "weekly", month: "monthly" };
+const CHART_MARGIN = { left: 60, right: 20, top: 30, bottom: 60 };
+
+function drawTrackerChart(container) {
+    fetch(container.dataset.seriesUrl, { credentials: "same-origin" })
+        .then((response) => {
+            if (!response.ok) {
+                throw new Error("Chart series request failed: " + response.status);
+            }
+            return response.json();
+        })
+        .then((series) => {
+            const canvas = container.querySelector("canvas");
+            const ctx = canvas.getContext("2d");
+            ctx.font = "12px sans-serif";
+            if (series.kind === "trend") {
+                drawTrend(ctx, canvas, series);
+            } else if (series.kind === "pie") {
+                drawPie(ctx, canvas, series);
+            } else {
+                drawShareBars(ctx, canvas, series);
+            }
+        })
+        .catch(() => {
+            const img = document.createElement("img");
+            img.src = container.dataset.fallbackSrc;
+            img.alt = "Trend chart";
+            container.replaceChildren(img);
+        });
+}
+
+function niceTicks(low, high, count) {
+    if (low === high) {
+        low -= 1;
+        high += 1;
+    }
+    const step = (high - low) / count;
+    const ticks = [];
+    for (let i = 0; i <= count; i++) {
+        ticks.push(low + step * i);
+    }
+    return ticks;
+}
+
+function formatDate(seconds) {
+    // yy-mm-dd of the UTC bucket start, like the server rendered charts
+    return new Date(seconds * 1000).toISOString().slice(2, 10);
+}
+
+function drawTrend(ctx, canvas, series) {
+    const plot = {
+        left: CHART_MARGIN.left,
+        top: CHART_MARGIN.top,
+        width: canvas.width - CHART_MARGIN.left - CHART_MARGIN.right,
+        height: canvas.height - CHART_MARGIN.top - CHART_MARGIN.bottom,
+    };
+    const xMin = series.x[0];
+    const xMax = series.x[series.x.length - 1];
+    const yTicks = niceTicks(Math.min(...series.low), Math.max(...series.high), 8);
+    const yMin = yTicks[0];
+    const yMax = yTicks[yTicks.length - 1];
+    const px = (x) => plot.left + (xMax === xMin ? plot.width / 2 : (x - xMin) / (xMax - xMin) * plot.width);
+    const py = (y) => plot.top + plot.height - (y - yMin) / (yMax - yMin) * plot.height;
+
+    ctx.fillStyle = "#000";
+    ctx.textAlign = "center";
+    ctx.fillText("Trend over time (" + CHART_TITLES[series.period] + " average)", canvas.width / 2, 18);
+    ctx.fillText("Time", plot.left + plot.width / 2, canvas.height - 8);
+
+    ctx.strokeStyle = "#000";
+    ctx.strokeRect(plot.left, plot.top, plot.width, plot.height);
+    ctx.textAlign = "right";
+    ctx.textBaseline = "middle";
+    for (const tick of yTicks) {
+        ctx.fillText(tick.toFixed(1), plot.left - 6, py(tick));
+    }
+    ctx.textAlign = "center";
+    ctx.textBaseline = "top";
+    const xLabels = Math.min(6, series.x.length);
+    for (let i = 0; i < xLabels; i++) {
+        const x = xLabels === 1 ? xMin : xMin + (xMax - xMin) * i / (xLabels - 1);
+        ctx.fillText(formatDate(x), px(x), plot.top + plot.height + 6);
+    }
+    ctx.save();
+    ctx.translate(14, plot.top + plot.height / 2);
+    ctx.rotate(-Math.PI / 2);
+    ctx.fillText(series.ylabel, 0, 0);
+    ctx.restore();
+
+    // min..max band
+    ctx.beginPath();
+    series.x.forEach((x, i) => ctx.lineTo(px(x), py(series.high[i])));
+    for (let i = series.x.length - 1; i >= 0; i--) {
+        ctx.lineTo(px(series.x[i]), py(series.low[i]));
+    }
+    ctx.closePath();
+    ctx.fillStyle = "rgba(31, 119, 180, 0.2)";
+    ctx.fill();
+
+    ctx.beginPath();
+    series.x.forEach((x, i) => ctx.lineTo(px(x), py(series.y[i])));
+    ctx.strokeStyle = CHART_COLORS[0];
+    ctx.lineWidth = 1.5;
+    ctx.stroke();
+    if (series.x.length <= 60) {
+        ctx.fillStyle = CHART_COLORS[0];
+        series.x.forEach((x, i) => {
+            ctx.beginPath();
+            ctx.arc(px(x), py(series.y[i]), 3, 0, 2 * Math.PI);
+            ctx.fill();
+        });
+    }
+}
+
+function drawPie(ctx, canvas, series) {
+    const cx = canvas.width / 2;
+    const cy = canvas.height / 2;
+    const radius = Math.min(cx, cy) - 50;
+    let angle = 0;
+    ctx.textAlign = "center";
+    ctx.textBaseline = "middle";
+    series.shares.forEach((share, i) => {
+        const end = angle + share * 2 * Math.PI;
+        ctx.beginPath();
+        ctx.moveTo(cx, cy);
+        ctx.arc(cx, cy, radius, angle, end);
+        ctx.closePath();
+        ctx.fillStyle = CHART_COLORS[i % CHART_COLORS.length];
+        ctx.fill();
+        const middle = (angle + end) / 2;
+        ctx.fillStyle = "#000";
+        ctx.fillText(series.labels[i], cx + Math.cos(middle) * (radius + 25), cy + Math.sin(middle) * (radius + 25));
+        angle = end;
+    });
+}
+
+function drawShareBars(ctx, canvas, series) {
+    const plot = {
+        left: CHART_MARGIN.left,
+        top: CHART_MARGIN.top,
+        width: canvas.width - CHART_MARGIN.left - CHART_MARGIN.right,
+        height: canvas.height - CHART_MARGIN.top - CHART_MARGIN.bottom,
+    };
+    const py = (percent) => plot.top + plot.height - percent / 100 * plot.height;
+    const slot = plot.width / series.shares.length;
+
+    ctx.strokeStyle = "#000";
+    ctx.strokeRect(plot.left, plot.top, plot.width, plot.height);
+    ctx.fillStyle = "#000";
+    ctx.textAlign = "right";
+    ctx.textBaseline = "middle";
+    for (let percent = 0; percent <= 100; percent += 10) {
+        ctx.fillText(percent, plot.left - 6, py(percent));
+    }
+    ctx.save();
+    ctx.translate(14, plot.top + plot.height / 2);
+    ctx.rotate(-Math.PI / 2);
+    ctx.textAlign = "center";
+    ctx.fillText(series.ylabel, 0, 0);
+    ctx.restore();
+
+    ctx.textAlign = "center";
+    ctx.textBaseline = "top";
+    series.shares.forEach((share, i) => {
+        const x = plot.left + slot * i + slot * 0.1;
+        ctx.fillStyle = CHART_COLORS[0];
+        ctx.fillRect(x, py(share * 100), slot * 0.8, plot.height * share);
+        ctx.fillStyle = "#000";
+        ctx.fillText(series.labels[i], x + slot * 0.4, plot.top + plot.height + 6);
+    });
+}
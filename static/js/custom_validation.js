@@ -24,25 +24,12 @@ function validateTrackerData() {
     return true;
 }
 
-function onLoadLog() {
-    document.getElementById("whenDateTime").addEventListener('change', (event) => {
-        const res = document.getElementById('utctime');
-        res.value = new Date(`${event.target.value}`).toISOString();
-      });
-
-    var local = new Date();
-    document.getElementById('utctime').value = local.toISOString();
-    local.setMinutes(local.getMinutes() - local.getTimezoneOffset());
-    document.getElementById("whenDateTime").value = local.toJSON().slice(0,16);
-
-   
-}
-
-function onLoadHome(){
-    tlinks = document.querySelectorAll(".tracker-links")
-    for(t in tlinks){
-        tlinks[t].href += `?offset=${new Date().getTimezoneOffset()}`; 
-    }
+function detectTimezone(url) {
+    // Saves the browser's timezone for users who have not picked one
+    const data = new FormData();
+    data.append("timezone", Intl.DateTimeFormat().resolvedOptions().timeZone);
+    data.append("detected", "1");
+    fetch(url, { method: "POST", body: data, credentials: "same-origin" });
 }
 
 function validateTrackerData() {